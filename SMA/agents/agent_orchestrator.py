@@ -1,21 +1,12 @@
 from .base_agent import BaseAgent
-from .customer_profiling_agent import CustomerProfilingAgent
-from .product_search_agent import ProductSearchAgent
-from .recommendation_agent import RecommendationAgent
-from .order_management_agent import OrderManagementAgent
-from .escalation_agent import EscalationAgent
-from .monitoring_agent import MonitoringAgent
-from .gdpr_agent import GDPRAgent
-from .cart_management_agent import CartManagementAgent
-from .customer_service_agent import CustomerServiceAgent
-from .security_agent import SecurityAgent
-from .multimodal_agent import MultimodalAgent
-from .social_agent import SocialAgent
-from .sustainability_agent import SustainabilityAgent
+from ..core.config import settings
+from ..core.agent_registry import AgentRegistry
+from ..core.intent_engine import intent_engine
 
 from typing import Dict, Any, List, Optional
 import logging
 import asyncio
+import time
 from datetime import datetime
 
 class AgentOrchestrator(BaseAgent):
@@ -26,22 +17,22 @@ class AgentOrchestrator(BaseAgent):
         )
         self.logger = logging.getLogger(__name__)
         
-        # Initialiser tous les agents
-        self.agents = {
-            "customer_profiling": CustomerProfilingAgent(),
-            "product_search": ProductSearchAgent(),
-            "recommendation": RecommendationAgent(),
-            "order_management": OrderManagementAgent(),
-            "escalation": EscalationAgent(),
-            "monitoring": MonitoringAgent(),
-            "gdpr": GDPRAgent(),
-            "cart_management": CartManagementAgent(),
-            "customer_service": CustomerServiceAgent(),  # Maintenant corrigé
-            "security": SecurityAgent(),
-            "multimodal": MultimodalAgent(),
-            "social": SocialAgent(),
-            "sustainability": SustainabilityAgent()
-        }
+        # Agents importés et construits à la première utilisation (voir AgentRegistry)
+        self.agents = AgentRegistry({
+            "customer_profiling": ".customer_profiling_agent:CustomerProfilingAgent",
+            "product_search": ".product_search_agent:ProductSearchAgent",
+            "recommendation": ".recommendation_agent:RecommendationAgent",
+            "order_management": ".order_management_agent:OrderManagementAgent",
+            "escalation": ".escalation_agent:EscalationAgent",
+            "monitoring": ".monitoring_agent:MonitoringAgent",
+            "gdpr": ".gdpr_agent:GDPRAgent",
+            "cart_management": ".cart_management_agent:CartManagementAgent",
+            "customer_service": ".customer_service_agent:CustomerServiceAgent",  # Maintenant corrigé
+            "security": ".security_agent:SecurityAgent",
+            "multimodal": ".multimodal_agent:MultimodalAgent",
+            "social": ".social_agent:SocialAgent",
+            "sustainability": ".sustainability_agent:SustainabilityAgent"
+        }, package=__package__)
         
         # Mapping des user stories vers les agents
         self.user_story_mapping = {
@@ -113,6 +104,18 @@ class AgentOrchestrator(BaseAgent):
             "US43": ["sustainability"],  # Livraison écologique
             "US44": ["sustainability"]   # Conseils entretien
         }
+        
+        # Dépendances entre agents : un agent attend uniquement ceux dont il
+        # consomme le résultat, tous les autres s'exécutent en parallèle
+        self.agent_dependencies = {
+            "recommendation": ["customer_profiling"],
+        }
+        
+        # Délais maximum par agent (secondes), AGENT_TIMEOUT_SECONDS par défaut
+        self.agent_timeouts = {
+            "multimodal": 2 * settings.AGENT_TIMEOUT_SECONDS,
+            "monitoring": 2 * settings.AGENT_TIMEOUT_SECONDS,
+        }
     
     def get_system_prompt(self) -> str:
         return """
@@ -169,55 +172,14 @@ class AgentOrchestrator(BaseAgent):
     async def _identify_user_stories(self, user_query: str) -> List[str]:
         """Identifier les user stories pertinentes à partir de la requête utilisateur"""
         try:
-            identified_stories = []
-            query_lower = user_query.lower()
-            
-            # Mapping des mots-clés vers les user stories
-            keyword_mapping = {
-                "recherche": ["US2", "US3"],
-                "produit": ["US1", "US2", "US4"],
-                "panier": ["US6", "US7", "US8"],
-                "commande": ["US9", "US11", "US12"],
-                "livraison": ["US13", "US14"],
-                "retour": ["US15"],
-                "retourner": ["US15"],  # Ajouté pour "retourner un produit"
-                "remboursement": ["US15"],  # Ajouté pour les demandes de remboursement
-                "échanger": ["US15"],  # Ajouté pour les échanges
-                "récupérer": ["US15"],  # Ajouté pour les récupérations
-                "aide": ["US17", "US18"],
-                "recommandation": ["US1", "US22"],
-                "promotion": ["US5", "US20"],
-                "paiement": ["US10", "US23"],
-                "sécurité": ["US23", "US24"],
-                "voix": ["US30"],
-                "image": ["US31"],
-                "vidéo": ["US32"],
-                "social": ["US36", "US37"],
-                "durabilité": ["US42", "US43", "US44"],
-                "accessibilité": ["US33", "US34", "US35"]
-            }
-            
-            # Détection intelligente des intentions
-            for keyword, stories in keyword_mapping.items():
-                if keyword in query_lower:
-                    # Cas spécial pour "retourner" - vérifier le contexte
-                    if keyword == "retourner":
-                        # Si c'est "retourner un produit", c'est US15 (retour)
-                        # Si c'est "retourner des produits", c'est US2 (recherche)
-                        if "produit" in query_lower and len(query_lower.split()) <= 4:
-                            identified_stories.extend(stories)  # US15 - Retour
-                        elif "produits" in query_lower or "tous" in query_lower:
-                            identified_stories.extend(["US2"])  # US2 - Recherche
-                        else:
-                            identified_stories.extend(stories)  # US15 par défaut
-                    else:
-                        identified_stories.extend(stories)
+            # Mots-clés -> user stories : voir USER_STORY_KEYWORDS dans intent_engine
+            identified_stories = list(intent_engine.analyze(user_query).user_stories)
             
             # Si aucune story détectée, router vers le service client par défaut
             if not identified_stories:
                 identified_stories = ["US17"]
-            # Dédupliquer et limiter
-            identified_stories = list(set(identified_stories))[:5]
+            # Limiter (déjà dédupliquées)
+            identified_stories = identified_stories[:5]
             
             return identified_stories
             
@@ -236,7 +198,7 @@ class AgentOrchestrator(BaseAgent):
                     for agent_name in agent_names:
                         if agent_name in self.agents:
                             required_agents[agent_name] = {
-                                "agent": self.agents[agent_name],
+                                "agent": await self.agents.aget(agent_name),
                                 "user_stories": [user_story],
                                 "priority": self._calculate_agent_priority(agent_name, context)
                             }
@@ -244,7 +206,7 @@ class AgentOrchestrator(BaseAgent):
             # Si aucun agent identifié, utiliser l'agent de service client par défaut
             if not required_agents:
                 required_agents["customer_service"] = {
-                    "agent": self.agents["customer_service"],
+                    "agent": await self.agents.aget("customer_service"),
                     "user_stories": ["US17"],
                     "priority": "high"
                 }
@@ -253,7 +215,7 @@ class AgentOrchestrator(BaseAgent):
             
         except Exception as e:
             self.logger.error(f"Erreur détermination agents: {str(e)}")
-            return {"customer_service": {"agent": self.agents["customer_service"], "priority": "high"}}
+            return {"customer_service": {"agent": await self.agents.aget("customer_service"), "priority": "high"}}
     
     def _calculate_agent_priority(self, agent_name: str, context: Dict[str, Any]) -> str:
         """Calculer la priorité d'un agent selon le contexte"""
@@ -280,49 +242,78 @@ class AgentOrchestrator(BaseAgent):
             return "medium"
     
     async def _execute_workflow(self, required_agents: Dict[str, Any], state: Dict[str, Any]) -> Dict[str, Any]:
-        """Exécuter le workflow avec les agents requis"""
+        """
+        Exécuter le workflow comme un DAG : les agents indépendants tournent en
+        parallèle, un agent n'attend que ses dépendances (agent_dependencies).
+        La latence totale tend vers celle de la plus longue chaîne.
+        """
+        workflow_result = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        
+        async def run(agent_name: str):
+            dependencies = [dep for dep in self.agent_dependencies.get(agent_name, []) if dep in tasks]
+            if dependencies:
+                await asyncio.gather(*(tasks[dep] for dep in dependencies), return_exceptions=True)
+            await self._run_agent(agent_name, required_agents[agent_name], state, workflow_result)
+        
         try:
-            workflow_result = {}
-            execution_order = self._determine_execution_order(required_agents)
-            
-            for agent_name in execution_order:
-                if agent_name in required_agents:
-                    agent_info = required_agents[agent_name]
-                    agent = agent_info["agent"]
-                    
-                    try:
-                        # Préparer le contexte pour l'agent
-                        agent_state = self._prepare_agent_state(state, agent_name, workflow_result)
-                        
-                        # Exécuter l'agent
-                        agent_result = await agent.execute(agent_state)
-                        
-                        # Stocker le résultat
-                        workflow_result[agent_name] = {
-                            "result": agent_result,
-                            "user_stories": agent_info["user_stories"],
-                            "priority": agent_info["priority"],
-                            "execution_time": datetime.utcnow().isoformat()
-                        }
-                        
-                        # Vérifier si l'agent a besoin d'escalade
-                        if self._needs_escalation(agent_result):
-                            escalation_result = await self._handle_escalation(agent_name, agent_result, state)
-                            workflow_result["escalation"] = escalation_result
-                        
-                    except Exception as e:
-                        self.logger.error(f"Erreur exécution agent {agent_name}: {str(e)}")
-                        workflow_result[agent_name] = {
-                            "error": str(e),
-                            "status": "failed"
-                        }
-            
+            # L'ordre de priorité ne sert plus qu'à l'ordre de démarrage
+            for agent_name in self._determine_execution_order(required_agents):
+                tasks[agent_name] = asyncio.create_task(run(agent_name))
+            await asyncio.gather(*tasks.values())
             return workflow_result
             
+        except asyncio.CancelledError:
+            # Requête annulée : ne pas laisser d'agents tourner en arrière-plan
+            for task in tasks.values():
+                task.cancel()
+            raise
         except Exception as e:
             self.logger.error(f"Erreur exécution workflow: {str(e)}")
             return {"error": str(e)}
     
+    async def _run_agent(self, agent_name: str, agent_info: Dict[str, Any], state: Dict[str, Any], workflow_result: Dict[str, Any]):
+        """Exécuter un agent avec son délai maximum et stocker son résultat"""
+        agent = agent_info["agent"]
+        timeout = self.agent_timeouts.get(agent_name, settings.AGENT_TIMEOUT_SECONDS)
+        start_time = time.perf_counter()
+        
+        try:
+            # Préparer le contexte pour l'agent
+            agent_state = self._prepare_agent_state(state, agent_name, dict(workflow_result))
+            
+            # Exécuter l'agent (annulé s'il dépasse son délai)
+            agent_result = await asyncio.wait_for(agent.execute(agent_state), timeout=timeout)
+            
+            # Stocker le résultat
+            workflow_result[agent_name] = {
+                "result": agent_result,
+                "user_stories": agent_info.get("user_stories", []),
+                "priority": agent_info.get("priority", "medium"),
+                "execution_time": datetime.utcnow().isoformat(),
+                "duration_ms": round((time.perf_counter() - start_time) * 1000, 1)
+            }
+            
+            # Vérifier si l'agent a besoin d'escalade
+            if self._needs_escalation(agent_result):
+                escalation_result = await self._handle_escalation(agent_name, agent_result, state)
+                workflow_result["escalation"] = escalation_result
+                
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Agent {agent_name} interrompu après {timeout}s")
+            workflow_result[agent_name] = {
+                "error": f"Délai dépassé ({timeout}s)",
+                "status": "timeout"
+            }
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Erreur exécution agent {agent_name}: {str(e)}")
+            workflow_result[agent_name] = {
+                "error": str(e),
+                "status": "failed"
+            }
+    
     def _determine_execution_order(self, required_agents: Dict[str, Any]) -> List[str]:
         """Déterminer l'ordre d'exécution des agents"""
         try:
@@ -519,9 +510,10 @@ class AgentOrchestrator(BaseAgent):
         try:
             health_status = {}
             
-            for agent_name, agent in self.agents.items():
+            for agent_name in self.agents:
                 try:
-                    # Vérifier la santé de chaque agent
+                    # Vérifier la santé de chaque agent (le construit s'il ne l'est pas encore)
+                    agent = await self.agents.aget(agent_name)
                     health_check = await agent.execute({"action": "health_check"})
                     health_status[agent_name] = {
                         "status": "healthy" if "error" not in health_check else "unhealthy",
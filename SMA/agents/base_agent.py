@@ -1,19 +1,19 @@
-import google.generativeai as genai
 from typing import Dict, Any, List, Optional
 from abc import ABC, abstractmethod
 from langchain.schema import BaseMessage, HumanMessage, AIMessage, SystemMessage
-from ..core.config import settings
+from ..core.llm_gateway import LLMUnavailable, get_llm_gateway
+from ..core.response_cache import CacheKey, get_response_cache
+from ..core.response_stream import emit, is_streaming
 import json
 import logging
 
-# Configuration de Gemini
-genai.configure(api_key=settings.GEMINI_API_KEY)
-
 class BaseAgent(ABC):
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Modèle, limites de débit et métriques partagés par tous les agents
+        self.llm = get_llm_gateway()
+        self.model = self.llm.model
         self.logger = logging.getLogger(f"agent.{name}")
         
     @abstractmethod
@@ -26,19 +26,50 @@ class BaseAgent(ABC):
         """Exécute la logique principal de l'agent"""
         pass
     
-    async def generate_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
-        """Génère une réponse en utilisant Gemini avec mode dégradé"""
+    async def generate_response(self, prompt: str, context: Dict[str, Any] = None, conversation: str = "",
+                                cache_key: Optional[CacheKey] = None, stream: bool = False) -> str:
+        """
+        Génère une réponse en utilisant Gemini avec mode dégradé.
+        `conversation` est l'historique déjà borné (ConversationContextManager).
+        `cache_key`, réservé aux réponses non personnalisées, active le cache
+        sémantique : une question proche déjà traitée n'appelle pas le LLM.
+        La réponse étant alors servie à d'autres utilisateurs, l'historique
+        `conversation` de la session n'entre pas dans le prompt.
+        `stream` marque le texte destiné à l'utilisateur : si un client reçoit la
+        réponse en direct (voir response_stream), ses fragments lui sont publiés.
+        """
+        if cache_key is not None:
+            conversation = ""
+        if stream and is_streaming():
+            return await self.stream_response(prompt, context, conversation, cache_key)
+
+        cache = get_response_cache() if cache_key is not None else None
         try:
-            # Construire le prompt avec contexte
-            full_prompt = self.get_system_prompt()
-            if context:
-                full_prompt += f"\n\nContexte: {json.dumps(context, ensure_ascii=False)}"
-            full_prompt += f"\n\nRequête: {prompt}"
+            if cache is not None:
+                try:
+                    cached = await cache.aget(self.name, cache_key)
+                except Exception as e:
+                    self.logger.warning(f"Cache de réponses indisponible: {e}")
+                    cache, cached = None, None
+                if cached is not None:
+                    return cached
+            
+            full_prompt = self.build_prompt(prompt, context, conversation)
             
-            # Générer la réponse
-            response = await self.model.generate_content_async(full_prompt)
-            return response.text
+            # Générer la réponse (concurrence, débit, échéance et tentatives gérés par la passerelle)
+            response = await self.llm.generate(full_prompt, agent=self.name)
+            # Seules les vraies réponses du LLM sont mises en cache, jamais le mode dégradé
+            if cache is not None:
+                try:
+                    await cache.aput(self.name, cache_key, response)
+                except Exception as e:
+                    self.logger.warning(f"Mise en cache de la réponse impossible: {e}")
+            return response
             
+        except LLMUnavailable as e:
+            # Quota ou surcharge : mode dégradé plutôt qu'une cascade de 429
+            self.logger.warning(f"LLM indisponible: {e}")
+            return self._get_fallback_response(prompt, context)
         except Exception as e:
             self.logger.error(f"Erreur lors de la génération de réponse: {e}")
             
@@ -48,6 +79,60 @@ class BaseAgent(ABC):
             else:
                 return "Désolé, je rencontre des difficultés techniques. Veuillez réessayer."
     
+    async def stream_response(self, prompt: str, context: Dict[str, Any] = None, conversation: str = "",
+                              cache_key: Optional[CacheKey] = None) -> str:
+        """
+        Variante de generate_response qui publie chaque fragment comme événement
+        "delta" et retourne le texte complet. Réponse en cache ou mode dégradé :
+        un seul delta avec le texte entier.
+        """
+        if cache_key is not None:
+            # Réponse partagée entre utilisateurs : sans l'historique de la session
+            conversation = ""
+        cache = get_response_cache() if cache_key is not None else None
+        if cache is not None:
+            try:
+                cached = await cache.aget(self.name, cache_key)
+            except Exception as e:
+                self.logger.warning(f"Cache de réponses indisponible: {e}")
+                cache, cached = None, None
+            if cached is not None:
+                await emit({"type": "delta", "text": cached})
+                return cached
+        
+        parts: List[str] = []
+        try:
+            async for text in self.llm.stream(self.build_prompt(prompt, context, conversation), agent=self.name):
+                parts.append(text)
+                await emit({"type": "delta", "text": text})
+        except Exception as e:
+            if parts:
+                # Le client a déjà reçu un début de réponse : le conserver plutôt que le contredire
+                self.logger.warning(f"Flux LLM interrompu: {e}")
+                return "".join(parts)
+            self.logger.warning(f"LLM indisponible: {e}")
+            fallback = self._get_fallback_response(prompt, context)
+            await emit({"type": "delta", "text": fallback})
+            return fallback
+        
+        response = "".join(parts)
+        if cache is not None:
+            try:
+                await cache.aput(self.name, cache_key, response)
+            except Exception as e:
+                self.logger.warning(f"Mise en cache de la réponse impossible: {e}")
+        return response
+    
+    def build_prompt(self, prompt: str, context: Dict[str, Any] = None, conversation: str = "") -> str:
+        """Prompt complet : prompt système, contexte, historique puis requête"""
+        full_prompt = self.get_system_prompt()
+        if context:
+            full_prompt += f"\n\nContexte: {json.dumps(context, ensure_ascii=False)}"
+        if conversation:
+            full_prompt += f"\n\nHistorique:\n{conversation}"
+        full_prompt += f"\n\nRequête: {prompt}"
+        return full_prompt
+    
     def _get_fallback_response(self, prompt: str, context: Dict[str, Any] = None) -> str:
         """Réponse de fallback quand Gemini API n'est pas disponible"""
         prompt_lower = prompt.lower()
@@ -10,10 +10,13 @@ import logging
 try:
     from catalogue.backend.database import SessionLocal
     from catalogue.backend.models import Panier, PanierProduit, Product, Utilisateur
+    from catalogue.backend.cart_service import cart_cache, load_cart
+    from catalogue.backend import stock_reservation
 except ImportError:
     # Fallback si les modèles ne sont pas disponibles
     SessionLocal = None
     Panier = PanierProduit = Product = Utilisateur = None
+    cart_cache = load_cart = stock_reservation = None
 
 # Agent de gestion du panier
 class CartManagementAgent(BaseAgent):
@@ -121,12 +124,9 @@ class CartManagementAgent(BaseAgent):
     def add_to_cart(self, db: Session, user_id: int, product_id: int, quantite: int = 1):
         if quantite <= 0:
             raise HTTPException(status_code=400, detail="La quantité doit être positive.")
-        product = db.query(Product).filter_by(id=product_id).first()
-        if not product:
-            raise HTTPException(status_code=404, detail="Produit introuvable.")
-        if product.stock < quantite:
-            raise HTTPException(status_code=400, detail="Stock insuffisant.")
         panier = self._get_or_create_panier(db, user_id)
+        # Réservation atomique : contrôle et décrément du stock en une requête
+        stock_reservation.reserve(db, user_id, product_id, quantite)
         panier_produit = db.query(PanierProduit).filter_by(id_panier=panier.id, id_produit=product_id).first()
         if panier_produit:
             panier_produit.quantite += quantite
@@ -134,6 +134,7 @@ class CartManagementAgent(BaseAgent):
             panier_produit = PanierProduit(id_panier=panier.id, id_produit=product_id, quantite=quantite)
             db.add(panier_produit)
         db.commit()
+        cart_cache.invalidate(user_id)
         return self.get_cart(db, user_id)
 
     def remove_from_cart(self, db: Session, user_id: int, product_id: int):
@@ -147,36 +148,27 @@ class CartManagementAgent(BaseAgent):
             panier_produit.quantite -= 1
         else:
             db.delete(panier_produit)
+        stock_reservation.release(db, user_id, product_id, 1)
         db.commit()
+        cart_cache.invalidate(user_id)
         return self.get_cart(db, user_id)
 
     def get_cart(self, db: Session, user_id: int):
-        panier = db.query(Panier).filter_by(utilisateur_id=user_id).first()
-        if not panier:
-            return {"produits": [], "total": 0.0}
-        items = db.query(PanierProduit).filter_by(id_panier=panier.id).all()
-        produits = []
-        total = 0.0
-        for item in items:
-            produit = db.query(Product).filter_by(id=item.id_produit).first()
-            if produit:
-                sous_total = float(produit.prix) * item.quantite
-                total += sous_total
-                produits.append({
-                    "id": produit.id,
-                    "nom": produit.nom,
-                    "prix": float(produit.prix),
-                    "quantite": item.quantite,
-                    "total_partiel": sous_total
-                })
-        return {"produits": produits, "total": round(total, 2)}
+        # Une seule requête jointe, servie depuis le cache tant que le panier ne change pas.
+        # Le cache en mémoire n'est pas invalidé par les mutations de l'API catalogue
+        # (autre processus) : sans Redis, lecture directe.
+        if not cart_cache.shared:
+            return load_cart(db, user_id)
+        return cart_cache.get_cart(db, user_id)
 
     def clear_cart(self, db: Session, user_id: int):
         panier = db.query(Panier).filter_by(utilisateur_id=user_id).first()
         if not panier:
             return {"message": "Panier déjà vide."}
         db.query(PanierProduit).filter_by(id_panier=panier.id).delete()
+        stock_reservation.release_user(db, user_id)
         db.commit()
+        cart_cache.invalidate(user_id)
         return {"message": "Panier vidé avec succès."}
 
 # --- FastAPI endpoints ---
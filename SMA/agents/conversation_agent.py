@@ -1,4 +1,7 @@
 from .base_agent import BaseAgent
+from ..core.intent_engine import intent_engine
+from ..core.intent_classifier import ESCALATION_INTENTS, predict_intent
+from ..core.config import settings
 from typing import Dict, Any, List
 import json
 
@@ -38,10 +41,16 @@ class ConversationAgent(BaseAgent):
         session_id = state["session_id"]
         user_profile = state.get("user_profile", {})
         
-        # Analyser l'intention
-        intent = await self.analyze_intent(user_message)
+        # Analyser l'intention (l'action panier sort de la même passe)
+        match = intent_engine.analyze(user_message)
+        intent, confidence = match.intent or "product_search", 0.8
+        # Avec un modèle entraîné, le classifieur local l'emporte quand sa confiance calibrée est suffisante
+        prediction = await predict_intent(user_message)
+        if prediction and prediction.confidence >= settings.INTENT_CONFIDENCE_THRESHOLD:
+            intent, confidence = prediction.intent, prediction.confidence
         state["intent"] = intent
-        state["confidence"] = 0.8
+        state["cart_action"] = match.cart_action
+        state["confidence"] = confidence
         
         # Gestion spécifique pour l'intention 'bot_role'
         if intent == "bot_role":
@@ -65,44 +74,8 @@ class ConversationAgent(BaseAgent):
     
     async def analyze_intent(self, message: str) -> str:
         """Analyser l'intention du message utilisateur"""
-        message_lower = message.lower()
-        
-        # Détection directe pour les cas évidents - ORDRE IMPORTANT (plus spécifique en premier)
-        if any(word in message_lower for word in ["rôle", "role", "mission", "qui es-tu", "ta fonction", "ta mission", "à quoi sers-tu", "présente-toi", "about you", "your role", "who are you"]):
-            return "bot_role"
-        if any(word in message_lower for word in ["bonjour", "salut", "hello", "hi", "hey"]):
-            return "greeting"
-        elif any(word in message_lower for word in ["panier", "cart", "voir mon panier", "mon panier", "afficher panier"]):
-            return "cart_management"
-        elif any(word in message_lower for word in ["ajouter au panier", "ajouter", "mettre dans le panier", "add to cart"]):
-            return "cart_management"
-        elif any(word in message_lower for word in ["supprimer du panier", "retirer", "enlever du panier", "remove from cart"]):
-            return "cart_management"
-        elif any(word in message_lower for word in ["modifier quantité", "changer quantité", "quantité"]):
-            return "cart_management"
-        elif any(word in message_lower for word in ["vider le panier", "vider panier", "clear cart"]):
-            return "cart_management"
-        elif any(word in message_lower for word in ["commande", "order", "statut", "status", "suivi"]):
-            return "order_status"
-        elif any(word in message_lower for word in ["recommand", "suggestion", "cadeau", "gift"]):
-            return "recommendation"
-        elif any(word in message_lower for word in ["aide", "help", "problème", "souci"]):
-            return "customer_service"
-        elif any(word in message_lower for word in ["liste", "produits", "catalogue"]):
-            return "product_search"
-        elif any(word in message_lower for word in ["avez", "disponible", "stock", "avoir", "est ce que"]):
-            return "availability_check"
-        elif any(word in message_lower for word in ["prix", "coût", "tarif", "combien"]):
-            return "price_check"
-        
-        # Mode dégradé : détection basique sans IA
-        # Recherche de mots-clés produits
-        product_keywords = ["iphone", "samsung", "laptop", "ordinateur", "smartphone", "tablette", "écran", "clavier", "souris"]
-        if any(keyword in message_lower for keyword in product_keywords):
-            return "product_search"
-        
         # Par défaut, considérer comme recherche de produit
-        return "product_search"
+        return intent_engine.analyze(message).intent or "product_search"
     
     def determine_agents(self, intent: str) -> List[str]:
         """Déterminer quels agents solliciter selon l'intention"""
@@ -118,7 +91,8 @@ class ConversationAgent(BaseAgent):
             "availability_check": ["product_search_agent"],  # Route vers product_search_agent
             "price_check": ["product_search_agent"],  # Route vers product_search_agent
             "return_policy": ["customer_service_agent"],
-            "general_chat": ["summarizer_agent"]
+            "general_chat": ["summarizer_agent"],
+            **{escalation_intent: ["escalation_agent"] for escalation_intent in ESCALATION_INTENTS}
         }
         
         # Si l'intention n'est pas reconnue, utiliser le fallback personnalisé
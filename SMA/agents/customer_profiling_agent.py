@@ -1,15 +1,25 @@
 from .base_agent import BaseAgent
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from catalogue.backend.database import SessionLocal
 from catalogue.backend.models import User, Order, OrderItem, Product
+from catalogue.backend.analytics import CustomerStats, customer_stats
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_
 from datetime import datetime, timedelta
+import asyncio
 import logging
+from ..core.config import settings
+from ..core.profile_store import get_profile_store
 from catalogue.backend.qdrant_client import client as qdrant_client, search_embedding
 # AGENT CONNECTÉ À QDRANT (vectoriel)
 # Utilisez search_embedding(...) pour la recherche de profils utilisateurs
 
+def _days_since(moment: Optional[datetime]) -> int:
+    """Jours écoulés depuis `moment` ; 0 si la date est inconnue (commandes.date NULL)"""
+    if moment is None:
+        return 0
+    return (datetime.utcnow() - moment).days
+
 class CustomerProfilingAgent(BaseAgent):
     def __init__(self):
         super().__init__(
@@ -17,6 +27,9 @@ class CustomerProfilingAgent(BaseAgent):
             description="Agent de profilage client optimisé et sécurisé"
         )
         self.logger = logging.getLogger(__name__)
+        self.profile_store = get_profile_store()
+        # Recalculs en cours, pour ne pas lancer deux fois le même
+        self._refreshing: Dict[int, asyncio.Task] = {}
     
     def get_system_prompt(self) -> str:
         return """
@@ -40,22 +53,81 @@ class CustomerProfilingAgent(BaseAgent):
             if not user_id:
                 return {"profile": self.get_anonymous_profile()}
             
-            # Analyser le profil complet avec gestion d'erreur
-            profile = await self.analyze_user_profile_safe(user_id)
-            
-            if profile.get("error"):
-                self.logger.error(f"Erreur lors de l'analyse du profil: {profile['error']}")
-                return {"profile": self.get_anonymous_profile(), "error": profile["error"]}
-            
-            # Mettre à jour le profil en base de manière sécurisée
-            update_result = await self.update_user_profile_safe(user_id, profile)
+            # Lecture O(1) de l'instantané ; le calcul complet n'a lieu qu'en cas d'absence
+            snapshot = self.profile_store.get(user_id)
+            if snapshot is None:
+                profile = await self.refresh_profile(user_id)
+                if profile.get("error"):
+                    self.logger.error(f"Erreur lors de l'analyse du profil: {profile['error']}")
+                    return {"profile": self.get_anonymous_profile(), "error": profile["error"]}
+                return {"profile": profile}
             
-            return {"profile": profile, "update_success": update_result.get("success", False)}
+            if self.profile_store.is_stale(snapshot):
+                self.schedule_refresh(user_id)
+            return {"profile": snapshot["profile"]}
             
         except Exception as e:
             self.logger.error(f"Erreur critique dans CustomerProfilingAgent: {str(e)}")
             return {"profile": self.get_anonymous_profile(), "error": "Erreur technique"}
     
+    async def refresh_profile(self, user_id: int) -> Dict[str, Any]:
+        """Recalculer le profil, le persister et remplacer l'instantané"""
+        profile = await self.analyze_user_profile_safe(user_id)
+        if profile.get("error"):
+            return profile
+        await self.update_user_profile_safe(user_id, profile)
+        try:
+            self.profile_store.put(user_id, profile)
+        except Exception as e:
+            self.logger.warning(f"Instantané de profil non enregistré: {e}")
+        return profile
+    
+    def schedule_refresh(self, user_id: int):
+        """Recalculer le profil en tâche de fond (sans bloquer le tour de chat)"""
+        task = self._refreshing.get(user_id)
+        if task and not task.done():
+            return
+        task = asyncio.create_task(self.refresh_profile(user_id))
+        task.add_done_callback(lambda _: self._refreshing.pop(user_id, None))
+        self._refreshing[user_id] = task
+    
+    def on_order_event(self, user_id: int):
+        """À appeler lors d'une commande (création, statut) : l'instantané est recalculé"""
+        self.profile_store.invalidate(user_id)
+        self.schedule_refresh(user_id)
+    
+    @staticmethod
+    def _users_with_new_orders(after_id: Optional[int]) -> Tuple[int, List[int]]:
+        """(dernier id de commande, utilisateurs ayant commandé après `after_id`)"""
+        db = SessionLocal()
+        try:
+            if after_id is None:
+                return db.query(func.max(Order.id)).scalar() or 0, []
+            rows = db.query(Order.id, Order.utilisateur_id).filter(Order.id > after_id).all()
+            last_id = max((row.id for row in rows), default=after_id)
+            return last_id, sorted({row.utilisateur_id for row in rows if row.utilisateur_id is not None})
+        finally:
+            db.close()
+    
+    async def run_order_refresher(self, interval_seconds: int = settings.PROFILE_ORDER_POLL_SECONDS):
+        """
+        Tâche de fond : les commandes sont créées par le catalogue (autre
+        processus), leurs nouveaux identifiants sont scrutés et les profils des
+        acheteurs recalculés via on_order_event.
+        """
+        loop = asyncio.get_running_loop()
+        last_id: Optional[int] = None
+        while True:
+            try:
+                last_id, user_ids = await loop.run_in_executor(None, self._users_with_new_orders, last_id)
+                for user_id in user_ids:
+                    self.on_order_event(user_id)
+                if user_ids:
+                    self.logger.info(f"Profils recalculés après commande: {len(user_ids)} utilisateur(s)")
+            except Exception as e:
+                self.logger.error(f"Scrutation des commandes échouée: {e}")
+            await asyncio.sleep(interval_seconds)
+    
     async def analyze_user_profile_safe(self, user_id: int) -> Dict[str, Any]:
         """Analyser le profil complet d'un utilisateur avec gestion d'erreur robuste"""
         db: Optional[Session] = None
@@ -67,23 +139,26 @@ class CustomerProfilingAgent(BaseAgent):
             if not user:
                 return {"error": "Utilisateur non trouvé"}
             
+            # Agrégats de commandes en une requête, partagés par toutes les analyses
+            stats = customer_stats(db, user_id)
+            
             # Analyser l'historique d'achat avec gestion d'erreur
-            purchase_history = await self.analyze_purchase_history_safe(user_id, db)
+            purchase_history = await self.analyze_purchase_history_safe(user_id, db, stats)
             if purchase_history.get("error"):
                 return {"error": f"Erreur analyse historique: {purchase_history['error']}"}
             
             # Analyser les préférences avec gestion d'erreur
-            preferences = await self.analyze_preferences_safe(user_id, db)
+            preferences = await self.analyze_preferences_safe(user_id, db, stats, user)
             if preferences.get("error"):
                 return {"error": f"Erreur analyse préférences: {preferences['error']}"}
             
             # Calculer la valeur client avec gestion d'erreur
-            customer_value = await self.calculate_customer_value_safe(user_id, db)
+            customer_value = await self.calculate_customer_value_safe(user_id, db, stats)
             if customer_value.get("error"):
                 return {"error": f"Erreur calcul valeur: {customer_value['error']}"}
             
             # Déterminer le segment client avec gestion d'erreur
-            segment = await self.determine_customer_segment_safe(user_id, db)
+            segment = await self.determine_customer_segment_safe(user_id, db, stats)
             if segment.get("error"):
                 return {"error": f"Erreur segmentation: {segment['error']}"}
             
@@ -107,41 +182,25 @@ class CustomerProfilingAgent(BaseAgent):
             if db:
                 db.close()
     
-    async def analyze_purchase_history_safe(self, user_id: int, db: Session) -> Dict[str, Any]:
+    async def analyze_purchase_history_safe(self, user_id: int, db: Session, stats: Optional[CustomerStats] = None) -> Dict[str, Any]:
         """Analyser l'historique d'achat de manière sécurisée"""
         try:
-            # Requête optimisée avec index sur user_id et created_at
-            orders = db.query(Order).filter(
-                Order.user_id == user_id
-            ).order_by(Order.created_at.desc()).limit(100).all()  # Limiter pour éviter les surcharges
+            stats = stats or customer_stats(db, user_id)
             
-            if not orders:
+            if not stats.order_count:
                 return {"total_orders": 0, "total_spent": 0, "favorite_categories": []}
             
-            total_spent = sum(getattr(order, 'total_amount', 0) for order in orders)
-            total_orders = len(orders)
-            
-            # Analyser les catégories favorites de manière optimisée
-            category_counts = {}
-            for order in orders:
-                if hasattr(order, 'items') and order.items:
-                    for item in order.items:
-                        if hasattr(item, 'product') and item.product:
-                            category = getattr(item.product, 'category', 'unknown')
-                            quantity = getattr(item, 'quantity', 1)
-                            category_counts[category] = category_counts.get(category, 0) + quantity
-            
-            favorite_categories = sorted(category_counts.items(), key=lambda x: x[1], reverse=True)
+            total_spent = stats.total_spent
+            total_orders = stats.order_count
             
             # Calculs RFM sécurisés
-            last_order_date = max(getattr(order, 'created_at', datetime.utcnow()) for order in orders)
-            days_since_last_order = (datetime.utcnow() - last_order_date).days
+            days_since_last_order = _days_since(stats.last_order)
             
             return {
                 "total_orders": total_orders,
                 "total_spent": round(total_spent, 2),
                 "average_order_value": round(total_spent / total_orders, 2) if total_orders > 0 else 0,
-                "favorite_categories": [cat[0] for cat in favorite_categories[:5]],
+                "favorite_categories": list(stats.top_categories),
                 "days_since_last_order": days_since_last_order,
                 "order_frequency": round(total_orders / max(1, days_since_last_order / 30), 2)
             }
@@ -150,48 +209,24 @@ class CustomerProfilingAgent(BaseAgent):
             self.logger.error(f"Erreur analyse historique: {str(e)}")
             return {"error": str(e)}
     
-    async def analyze_preferences_safe(self, user_id: int, db: Session) -> Dict[str, Any]:
+    async def analyze_preferences_safe(self, user_id: int, db: Session, stats: Optional[CustomerStats] = None, user: Optional[User] = None) -> Dict[str, Any]:
         """Analyser les préférences utilisateur de manière sécurisée"""
         try:
-            user = db.query(User).filter(User.id == user_id).first()
+            user = user or db.query(User).filter(User.id == user_id).first()
             if not user:
                 return {"error": "Utilisateur non trouvé"}
             
             stored_preferences = getattr(user, 'preferences', {}) or {}
+            stats = stats or customer_stats(db, user_id)
             
-            # Analyser les marques préférées de manière optimisée
-            brand_counts = {}
-            orders = db.query(Order).filter(Order.user_id == user_id).limit(50).all()  # Limiter les requêtes
-            
-            for order in orders:
-                if hasattr(order, 'items') and order.items:
-                    for item in order.items:
-                        if hasattr(item, 'product') and item.product:
-                            brand = getattr(item.product, 'brand', None)
-                            if brand:
-                                quantity = getattr(item, 'quantity', 1)
-                                brand_counts[brand] = brand_counts.get(brand, 0) + quantity
-            
-            preferred_brands = sorted(brand_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-            
-            # Analyser les gammes de prix de manière sécurisée
-            price_ranges = {"low": 0, "medium": 0, "high": 0}
-            for order in orders:
-                if hasattr(order, 'items') and order.items:
-                    for item in order.items:
-                        price = getattr(item, 'price', 0)
-                        if price < 50:
-                            price_ranges["low"] += 1
-                        elif price < 200:
-                            price_ranges["medium"] += 1
-                        else:
-                            price_ranges["high"] += 1
-            
+            # Gammes de prix agrégées en base
+            low, medium, high = stats.price_bands
+            price_ranges = {"low": low, "medium": medium, "high": high}
             preferred_price_range = max(price_ranges, key=price_ranges.get) if any(price_ranges.values()) else "medium"
             
             return {
                 **stored_preferences,
-                "preferred_brands": [brand[0] for brand in preferred_brands],
+                "preferred_brands": list(stats.top_brands),
                 "preferred_price_range": preferred_price_range,
                 "price_sensitivity": price_ranges
             }
@@ -200,21 +235,18 @@ class CustomerProfilingAgent(BaseAgent):
             self.logger.error(f"Erreur analyse préférences: {str(e)}")
             return {"error": str(e)}
     
-    async def calculate_customer_value_safe(self, user_id: int, db: Session) -> Dict[str, Any]:
+    async def calculate_customer_value_safe(self, user_id: int, db: Session, stats: Optional[CustomerStats] = None) -> Dict[str, Any]:
         """Calculer la valeur du client de manière sécurisée"""
         try:
-            orders = db.query(Order).filter(Order.user_id == user_id).limit(100).all()
+            stats = stats or customer_stats(db, user_id)
             
-            if not orders:
+            if not stats.order_count:
                 return {"ltv": 0, "clv_score": "low"}
             
-            total_spent = sum(getattr(order, 'total_amount', 0) for order in orders)
-            num_orders = len(orders)
+            total_spent = stats.total_spent
             
             # Calculer la durée de relation client de manière sécurisée
-            order_dates = [getattr(order, 'created_at', datetime.utcnow()) for order in orders]
-            first_order = min(order_dates)
-            customer_age_days = (datetime.utcnow() - first_order).days
+            customer_age_days = _days_since(stats.first_order)
             customer_age_months = max(1, customer_age_days / 30)
             
             # LTV estimée avec validation
@@ -240,20 +272,18 @@ class CustomerProfilingAgent(BaseAgent):
             self.logger.error(f"Erreur calcul valeur client: {str(e)}")
             return {"error": str(e)}
     
-    async def determine_customer_segment_safe(self, user_id: int, db: Session) -> Dict[str, Any]:
+    async def determine_customer_segment_safe(self, user_id: int, db: Session, stats: Optional[CustomerStats] = None) -> Dict[str, Any]:
         """Déterminer le segment client de manière sécurisée"""
         try:
-            orders = db.query(Order).filter(Order.user_id == user_id).limit(50).all()
+            stats = stats or customer_stats(db, user_id)
             
-            if not orders:
+            if not stats.order_count:
                 return {"segment": "new_customer", "confidence": 1.0}
             
             # Analyser la récence et fréquence de manière sécurisée
-            order_dates = [getattr(order, 'created_at', datetime.utcnow()) for order in orders]
-            last_order = max(order_dates)
-            days_since_last_order = (datetime.utcnow() - last_order).days
-            total_spent = sum(getattr(order, 'total_amount', 0) for order in orders)
-            num_orders = len(orders)
+            days_since_last_order = _days_since(stats.last_order)
+            total_spent = stats.total_spent
+            num_orders = stats.order_count
             
             # Segmentation RFM améliorée avec validation
             if days_since_last_order <= 30 and total_spent > 500 and num_orders >= 5:
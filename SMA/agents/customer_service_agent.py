@@ -2,11 +2,13 @@
 Agent de service client - gère les demandes de support et d'aide
 """
 
+import asyncio
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 
 from .base_agent import BaseAgent
+from ..core.faq_index import FAQEntry, get_faq_index, knowledge_base_loader
 # Import des modèles (à adapter selon ta structure)
 try:
     from catalogue.backend.database import SessionLocal
@@ -63,6 +65,11 @@ class CustomerServiceAgent(BaseAgent):
             "produits": ["garantie", "entretien", "utilisation", "spécifications"],
             "compte": ["création", "modification", "mot de passe", "profil"]
         }
+        
+        # Index FAQ partagé : réponses locales + table KnowledgeBase (relue périodiquement)
+        self.faq_index = get_faq_index()
+        self.faq_index.sync("local", self._local_faq_entries())
+        self._load_knowledge_base = knowledge_base_loader(SessionLocal) if SessionLocal else None
     
     def get_system_prompt(self) -> str:
         return """
@@ -123,35 +130,12 @@ class CustomerServiceAgent(BaseAgent):
                         matched_categories.append(category)
                         break
             
-            # Recherche dans la base de connaissances
-            if SessionLocal:
-                db = SessionLocal()
-                try:
-                    faq_results = []
-                    # TODO: Implémenter la vraie recherche quand les modèles sont disponibles
-                finally:
-                    db.close()
-            else:
-                # Fallback : recherche dans la base locale
-                faq_results = self._search_local_faq(question_lower, matched_categories)
-            
-            # Traiter les résultats de la recherche
-            if faq_results:
-                # Trier par pertinence si on a des scores
-                if any("relevance_score" in faq for faq in faq_results):
-                    faq_results.sort(key=lambda x: x.get("relevance_score", 0), reverse=True)
-                    
-                    return {
-                        "faq_results": faq_results[:5],  # Top 5
-                        "total_found": len(faq_results),
-                        "matched_categories": matched_categories,
-                        "search_query": question
-                    }
+            # Recherche hybride (cosinus + BM25) dans la FAQ locale et la base de connaissances
+            faq_results = await self._search_faq(question)
             
-            # Si pas de résultats ou erreur
             return {
-                "faq_results": [],
-                "total_found": 0,
+                "faq_results": faq_results,
+                "total_found": len(faq_results),
                 "matched_categories": matched_categories,
                 "search_query": question
             }
@@ -160,48 +144,22 @@ class CustomerServiceAgent(BaseAgent):
             self.logger.error(f"Erreur recherche FAQ: {str(e)}")
             return {"error": str(e)}
     
-    def _calculate_relevance(self, question: str, faq_question: str, faq_keywords: List[str]) -> float:
-        """Calculer la pertinence entre une question et une FAQ"""
-        try:
-            score = 0.0
-            
-            # Score par mots communs
-            question_words = set(question.split())
-            faq_words = set(faq_question.lower().split())
-            common_words = question_words.intersection(faq_words)
-            
-            if common_words:
-                score += len(common_words) / max(len(question_words), len(faq_words)) * 0.6
-            
-            # Score par mots-clés
-            if faq_keywords:
-                keyword_matches = sum(1 for keyword in faq_keywords if keyword.lower() in question)
-                score += (keyword_matches / len(faq_keywords)) * 0.4
-            
-            return min(score, 1.0)
-            
-        except Exception:
-            return 0.0
+    def _local_faq_entries(self) -> List[FAQEntry]:
+        """Entrées FAQ de la base de connaissances locale"""
+        return [
+            FAQEntry(f"local:{category}:{topic}", category, f"{category} {topic.replace('_', ' ')}", answer, (topic,))
+            for category, topics in self.knowledge_base.items()
+            for topic, answer in topics.items()
+        ]
     
-    def _search_local_faq(self, question: str, categories: List[str]) -> List[Dict[str, Any]]:
-        """Recherche dans la base locale de connaissances"""
-        results = []
-        
-        # Recherche par catégories
-        for category in categories:
-            if category in self.knowledge_base:
-                for key, answer in self.knowledge_base[category].items():
-                    if key.lower() in question or any(word in question for word in key.split()):
-                        results.append({
-                            "id": f"{category}_{key}",
-                            "question": f"Question sur {key}",
-                            "answer": answer,
-                            "category": category,
-                            "relevance_score": 0.8,
-                            "keywords": [key]
-                        })
-        
-        return results[:5]  # Limiter à 5 résultats
+    def _search_faq_index(self, question: str, k: int, category: Optional[str]) -> List[Dict[str, Any]]:
+        if self._load_knowledge_base is not None:
+            self.faq_index.refresh_if_stale(self._load_knowledge_base)
+        return self.faq_index.search(question, k, category)
+    
+    async def _search_faq(self, question: str, k: int = 5, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Meilleures entrées FAQ (encodage et relecture de la base hors de la boucle d'événements)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._search_faq_index, question, k, category)
     
     async def handle_return_exchange_safe(self, state: Dict[str, Any]) -> Dict[str, Any]:
         """Gérer les retours et échanges de manière sécurisée"""
@@ -632,30 +590,11 @@ class CustomerServiceAgent(BaseAgent):
     async def _search_knowledge_base(self, content: str, support_type: str) -> Optional[str]:
         """Recherche dans la base de connaissances"""
         try:
-            # Recherche simple basée sur les mots-clés
-            content_lower = content.lower()
-            
-            if support_type in self.knowledge_base:
-                category_knowledge = self.knowledge_base[support_type]
-                
-                # Chercher la réponse la plus pertinente
-                for topic, answer in category_knowledge.items():
-                    if topic in content_lower:
-                        return answer
-                
-                # Si pas de correspondance exacte, retourner la première réponse
-                if category_knowledge:
-                    return list(category_knowledge.values())[0]
-            
-            # Recherche dans la base de données
-            with self.db_manager.get_session() as session:
-                knowledge_entries = session.query(KnowledgeBase).filter_by(category=support_type).all()
-                
-                for entry in knowledge_entries:
-                    if any(keyword in content_lower for keyword in entry.keywords or []):
-                        return entry.answer
-            
-            return None
+            # Meilleure entrée du type de support, sinon toutes catégories confondues
+            results = await self._search_faq(content, k=1, category=support_type)
+            if not results:
+                results = await self._search_faq(content, k=1)
+            return results[0]["answer"] if results else None
             
         except Exception as e:
             logger.error(f"Error searching knowledge base: {e}")
@@ -746,8 +685,8 @@ class CustomerServiceAgent(BaseAgent):
                 "conversation_length": len(context.conversation_history)
             }
             
-            # Sauvegarder dans MongoDB
-            self.db_manager.mongo_db.support_requests.insert_one(support_log)
+            # Sauvegarder dans MongoDB (écriture différée, par lots)
+            self.db_manager.analytics.insert("support_requests", support_log)
             
         except Exception as e:
             logger.error(f"Error logging support request: {e}")
@@ -1,4 +1,7 @@
 from .base_agent import BaseAgent
+from ..core.config import settings
+from ..core.intent_classifier import ESCALATION_INTENTS, predict_intent
+from ..core.response_cache import CacheKey
 from typing import Dict, Any, List
 import json
 from datetime import datetime
@@ -31,10 +34,11 @@ class EscalationAgent(BaseAgent):
         current_intent = state.get("intent", "")
         user_message = state.get("user_message", "")
         failed_attempts = state.get("failed_attempts", 0)
+        conversation = state.get("conversation_context", "")
         
         # Analyser si une escalade est nécessaire
         escalation_needed = await self.should_escalate(
-            conversation_history, current_intent, user_message, failed_attempts
+            conversation_history, current_intent, user_message, failed_attempts, conversation
         )
         
         if escalation_needed:
@@ -55,7 +59,8 @@ class EscalationAgent(BaseAgent):
             return state
     
     async def should_escalate(self, conversation_history: List[Dict], 
-                            intent: str, message: str, failed_attempts: int) -> bool:
+                            intent: str, message: str, failed_attempts: int,
+                            conversation: str = "") -> bool:
         """Déterminer si une escalade est nécessaire"""
         
         # Escalade automatique après échecs répétés
@@ -63,24 +68,29 @@ class EscalationAgent(BaseAgent):
             return True
         
         # Intentions nécessitant une escalade humaine
-        escalation_intents = [
-            "complaint",
-            "refund_request", 
-            "technical_problem",
-            "complex_return",
-            "billing_issue"
-        ]
-        
-        if intent in escalation_intents:
+        if intent in ESCALATION_INTENTS:
             return True
         
         # Analyser le sentiment et la complexité du message
-        escalation_analysis = await self.analyze_escalation_need(message)
+        escalation_analysis = await self.analyze_escalation_need(message, conversation)
         
         return escalation_analysis.get("needs_escalation", False)
     
-    async def analyze_escalation_need(self, message: str) -> Dict[str, Any]:
+    async def analyze_escalation_need(self, message: str, conversation: str = "") -> Dict[str, Any]:
         """Analyser si le message nécessite une escalade"""
+        # Classifieur local d'abord (modèle entraîné seulement) : le LLM n'est appelé que si sa décision est incertaine
+        prediction = await predict_intent(message)
+        if prediction is not None:
+            needs_escalation = prediction.escalation >= 0.5
+            confidence = max(prediction.escalation, 1 - prediction.escalation)
+            if confidence >= settings.ESCALATION_CONFIDENCE_THRESHOLD:
+                return {
+                    "needs_escalation": needs_escalation,
+                    "confidence": confidence,
+                    "reason": prediction.intent,
+                    "source": "local_classifier"
+                }
+        
         prompt = f"""
         Analysez ce message client pour déterminer s'il nécessite une escalade vers un agent humain:
         
@@ -104,7 +114,8 @@ class EscalationAgent(BaseAgent):
         }}
         """
         
-        response = await self.generate_response(prompt)
+        # L'historique borné permet de détecter une frustration qui s'accumule
+        response = await self.generate_response(prompt, conversation=conversation)
         
         try:
             return json.loads(response)
@@ -118,6 +129,7 @@ class EscalationAgent(BaseAgent):
             "user_id": state.get("user_id"),
             "user_profile": state.get("user_profile", {}),
             "conversation_history": state.get("conversation_history", [])[-10:],  # 10 derniers messages
+            "conversation_summary": state.get("conversation_context", ""),
             "current_intent": state.get("intent"),
             "failed_attempts": state.get("failed_attempts", 0),
             "reason": "Complex issue requiring human assistance",
@@ -140,4 +152,5 @@ class EscalationAgent(BaseAgent):
         - Rester professionnel et empathique
         """
         
-        return await self.generate_response(prompt)
+        # Même message pour des raisons proches : le cache sémantique évite un appel LLM par transfert
+        return await self.generate_response(prompt, cache_key=CacheKey("transition", reason), stream=True)
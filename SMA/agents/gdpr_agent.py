@@ -1,13 +1,16 @@
 
 from .base_agent import BaseAgent
-from typing import Dict, Any, List
+from typing import Dict, Any
 import hashlib
-import json
-from datetime import datetime, timedelta
-from catalogue.backend.database import SessionLocal
-# AGENT CONNECTÉ À POSTGRES (relationnel)
-# Utilisez SessionLocal() pour accéder aux données utilisateurs/messages
-from catalogue.backend.models import User
+# Effacement, export et audit : tâches de fond (les données sont lues par gdpr_user_data et gdpr_audit)
+from ..core.gdpr_audit import compliance_score
+from ..core.gdpr_jobs import get_gdpr_jobs
+from ..core.pii import redact
+
+SENSITIVE_FIELDS = frozenset({
+    'email', 'phone', 'address', 'credit_card', 'iban',
+    'password', 'ssn', 'birthdate', 'full_name'
+})
 
 class GDPRAgent(BaseAgent):
     def __init__(self):
@@ -58,251 +61,77 @@ class GDPRAgent(BaseAgent):
         }
     
     async def delete_user_data(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Supprimer toutes les données d'un utilisateur (droit à l'oubli)"""
+        """
+        Supprimer toutes les données d'un utilisateur (droit à l'oubli).
+        Suppression par lots en tâche de fond (voir gdpr_user_data), suivie
+        avec get_job_status.
+        """
         user_id = state.get("user_id")
         
         if not user_id:
             return {"error": "ID utilisateur requis"}
         
-        db = SessionLocal()
-        try:
-            # Compter les données avant suppression
-            conversations_count = db.query(Conversation).filter(Conversation.user_id == user_id).count()
-            messages_count = db.query(Message).join(Conversation).filter(Conversation.user_id == user_id).count()
-            
-            # Supprimer les messages
-            messages_deleted = db.query(Message).join(Conversation).filter(
-                Conversation.user_id == user_id
-            ).delete(synchronize_session=False)
-            
-            # Supprimer les conversations
-            conversations_deleted = db.query(Conversation).filter(
-                Conversation.user_id == user_id
-            ).delete()
-            
-            # Anonymiser l'utilisateur plutôt que le supprimer (pour préserver l'intégrité référentielle)
-            user = db.query(User).filter(User.id == user_id).first()
-            if user:
-                user.email = f"deleted_user_{user_id}@anonymized.com"
-                user.username = f"deleted_user_{user_id}"
-                user.hashed_password = "DELETED"
-                user.is_active = False
-                user.preferences = {}
-            
-            db.commit()
-            
-            return {
-                "success": True,
-                "user_anonymized": True,
-                "conversations_deleted": conversations_deleted,
-                "messages_deleted": messages_deleted,
-                "deletion_timestamp": datetime.utcnow().isoformat()
-            }
-            
-        except Exception as e:
-            db.rollback()
-            return {"error": f"Erreur lors de la suppression: {str(e)}"}
-        finally:
-            db.close()
+        job = get_gdpr_jobs().submit("erasure", {"user_id": user_id})
+        return {"job_id": job.id, "status": job.status, "progress": job.progress}
     
     async def export_user_data(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Exporter toutes les données d'un utilisateur (droit d'accès)"""
+        """
+        Exporter toutes les données d'un utilisateur (droit d'accès).
+        L'export est écrit en flux dans une archive ZIP (NDJSON) par une tâche
+        de fond ; le chemin de l'archive figure dans le résultat de la tâche.
+        """
         user_id = state.get("user_id")
         
         if not user_id:
             return {"error": "ID utilisateur requis"}
         
-        db = SessionLocal()
-        try:
-            user = db.query(User).filter(User.id == user_id).first()
-            if not user:
-                return {"error": "Utilisateur non trouvé"}
-            
-            # Données utilisateur
-            user_data = {
-                "user_info": {
-                    "id": user.id,
-                    "email": user.email,
-                    "username": user.username,
-                    "created_at": user.created_at.isoformat(),
-                    "is_vip": user.is_vip,
-                    "preferences": user.preferences
-                }
-            }
-            
-            # Conversations
-            conversations = db.query(Conversation).filter(Conversation.user_id == user_id).all()
-            user_data["conversations"] = []
-            
-            for conv in conversations:
-                conv_data = {
-                    "id": conv.id,
-                    "session_id": conv.session_id,
-                    "started_at": conv.started_at.isoformat(),
-                    "ended_at": conv.ended_at.isoformat() if conv.ended_at else None,
-                    "status": conv.status,
-                    "messages": []
-                }
-                
-                for message in conv.messages:
-                    conv_data["messages"].append({
-                        "id": message.id,
-                        "sender_type": message.sender_type,
-                        "content": message.content,
-                        "intent": message.intent,
-                        "timestamp": message.timestamp.isoformat(),
-                        "agent_used": message.agent_used
-                    })
-                
-                user_data["conversations"].append(conv_data)
-            
-            # Commandes (si applicable)
-            from catalogue.backend.models import Order
-            orders = db.query(Order).filter(Order.user_id == user_id).all()
-            user_data["orders"] = []
-            
-            for order in orders:
-                order_data = {
-                    "id": order.id,
-                    "total_amount": order.total_amount,
-                    "status": order.status,
-                    "created_at": order.created_at.isoformat(),
-                    "items": []
-                }
-                
-                for item in order.items:
-                    order_data["items"].append({
-                        "product_name": item.product.name,
-                        "quantity": item.quantity,
-                        "price": item.price
-                    })
-                
-                user_data["orders"].append(order_data)
-            
-            return {
-                "success": True,
-                "user_data": user_data,
-                "export_timestamp": datetime.utcnow().isoformat(),
-                "total_conversations": len(user_data["conversations"]),
-                "total_orders": len(user_data["orders"])
-            }
-            
-        finally:
-            db.close()
+        job = get_gdpr_jobs().submit("export", {"user_id": user_id})
+        return {"job_id": job.id, "status": job.status, "progress": job.progress}
     
     async def audit_stored_data(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Auditer les données stockées pour la conformité RGPD"""
-        db = SessionLocal()
-        try:
-            # Statistiques générales
-            total_users = db.query(User).count()
-            active_users = db.query(User).filter(User.is_active == True).count()
-            total_conversations = db.query(Conversation).count()
-            total_messages = db.query(Message).count()
-            
-            # Données anciennes (> 2 ans)
-            cutoff_date = datetime.utcnow() - timedelta(days=730)
-            old_conversations = db.query(Conversation).filter(
-                Conversation.started_at < cutoff_date
-            ).count()
-            
-            # Messages contenant potentiellement des données sensibles
-            sensitive_patterns = ['email', 'telephone', 'adresse', 'carte', 'iban']
-            potentially_sensitive_messages = 0
-            
-            messages = db.query(Message).filter(Message.sender_type == "user").all()
-            for message in messages:
-                content_lower = message.content.lower()
-                if any(pattern in content_lower for pattern in sensitive_patterns):
-                    potentially_sensitive_messages += 1
-            
-            # Utilisateurs inactifs depuis longtemps
-            inactive_cutoff = datetime.utcnow() - timedelta(days=365)
-            potentially_inactive_users = db.query(User).filter(
-                User.created_at < inactive_cutoff,
-                User.is_active == True
-            ).count()
-            
-            # Recommandations de conformité
-            recommendations = []
-            
-            if old_conversations > 0:
-                recommendations.append(f"Examiner {old_conversations} conversations anciennes pour archivage/suppression")
-            
-            if potentially_sensitive_messages > total_messages * 0.1:
-                recommendations.append("Taux élevé de messages potentiellement sensibles - réviser les filtres")
-            
-            if potentially_inactive_users > 0:
-                recommendations.append(f"Contacter {potentially_inactive_users} utilisateurs inactifs pour confirmation")
-            
-            return {
-                "audit_timestamp": datetime.utcnow().isoformat(),
-                "statistics": {
-                    "total_users": total_users,
-                    "active_users": active_users,
-                    "total_conversations": total_conversations,
-                    "total_messages": total_messages,
-                    "old_conversations": old_conversations,
-                    "potentially_sensitive_messages": potentially_sensitive_messages,
-                    "potentially_inactive_users": potentially_inactive_users
-                },
-                "compliance_score": self._calculate_compliance_score({
-                    "old_data_ratio": old_conversations / max(1, total_conversations),
-                    "sensitive_ratio": potentially_sensitive_messages / max(1, total_messages),
-                    "inactive_ratio": potentially_inactive_users / max(1, total_users)
-                }),
-                "recommendations": recommendations
-            }
-            
-        finally:
-            db.close()
+        """
+        Auditer les données stockées pour la conformité RGPD.
+        L'audit parcourt toute la table des messages : il tourne en tâche de fond
+        (voir gdpr_audit) et se suit avec get_job_status. Avec `job_id`, reprend
+        une tâche interrompue depuis son dernier point de reprise.
+        """
+        jobs = get_gdpr_jobs()
+        if state.get("job_id"):
+            job = jobs.resume(state["job_id"])
+            if job is None:
+                return {"error": "Tâche d'audit introuvable"}
+        else:
+            job = jobs.submit("audit", {"batch_size": state.get("batch_size")})
+        return {"job_id": job.id, "status": job.status, "progress": job.progress}
+    
+    async def get_job_status(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """État d'une tâche RGPD (progression, résultat ou erreur)"""
+        job = get_gdpr_jobs().get(state.get("job_id", ""))
+        if job is None:
+            return {"error": "Tâche introuvable"}
+        return job.to_dict()
     
     async def filter_sensitive_content(self, state: Dict[str, Any]) -> Dict[str, Any]:
-        """Filtrer et masquer le contenu sensible dans les messages"""
+        """Filtrer et masquer le contenu sensible dans les messages (un seul passage, voir core.pii)"""
         content = state.get("content", "")
         filter_level = state.get("filter_level", "moderate")  # low, moderate, high
         
-        filtered_content = content
-        detected_patterns = []
-        
-        # Patterns de données sensibles
-        sensitive_patterns = {
-            "email": r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
-            "phone": r'\b(?:\+33|0)[1-9](?:[0-9]{8})\b',
-            "credit_card": r'\b(?:[0-9]{4}[-\s]?){3}[0-9]{4}\b',
-            "iban": r'\b[A-Z]{2}[0-9]{2}[A-Z0-9]{4}[0-9]{7}([A-Z0-9]?){0,16}\b'
-        }
-        
-        import re
-        
-        for pattern_name, pattern in sensitive_patterns.items():
-            matches = re.findall(pattern, content, re.IGNORECASE)
-            if matches:
-                detected_patterns.append(pattern_name)
-                
-                # Remplacer selon le niveau de filtrage
-                if filter_level == "high":
-                    filtered_content = re.sub(pattern, "[DONNÉES SUPPRIMÉES]", filtered_content, flags=re.IGNORECASE)
-                elif filter_level == "moderate":
-                    filtered_content = re.sub(pattern, "[***]", filtered_content, flags=re.IGNORECASE)
-                else:  # low
-                    filtered_content = re.sub(pattern, lambda m: m.group()[:2] + "*" * (len(m.group()) - 4) + m.group()[-2:], filtered_content, flags=re.IGNORECASE)
+        filtered_content, matches = redact(content, filter_level)
         
         return {
             "original_content": content,
             "filtered_content": filtered_content,
-            "detected_patterns": detected_patterns,
+            "detected_patterns": list(dict.fromkeys(match.type for match in matches)),
+            "detections": [
+                {"type": match.type, "start": match.start, "end": match.end} for match in matches
+            ],
             "filter_level": filter_level,
-            "content_modified": content != filtered_content
+            "content_modified": bool(matches)
         }
     
     def _is_sensitive_field(self, field_name: str) -> bool:
         """Vérifier si un champ contient des données sensibles"""
-        sensitive_fields = [
-            'email', 'phone', 'address', 'credit_card', 'iban', 
-            'password', 'ssn', 'birthdate', 'full_name'
-        ]
-        return field_name.lower() in sensitive_fields
+        return field_name.lower() in SENSITIVE_FIELDS
     
     def _partial_anonymize(self, value: str) -> str:
         """Anonymisation partielle (masquer une partie)"""
@@ -316,16 +145,4 @@ class GDPRAgent(BaseAgent):
     
     def _calculate_compliance_score(self, metrics: Dict[str, float]) -> float:
         """Calculer un score de conformité RGPD"""
-        # Score basé sur les métriques de conformité
-        score = 100
-        
-        # Pénaliser les données anciennes
-        score -= metrics["old_data_ratio"] * 30
-        
-        # Pénaliser les données sensibles non filtrées
-        score -= metrics["sensitive_ratio"] * 40
-        
-        # Pénaliser les utilisateurs inactifs
-        score -= metrics["inactive_ratio"] * 20
-        
-        return max(0, min(100, round(score, 1)))
+        return compliance_score(metrics)
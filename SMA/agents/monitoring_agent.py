@@ -5,7 +5,7 @@ import time
 import logging
 from datetime import datetime, timedelta
 from ..models.database import SessionLocal, Message, Conversation
-from sqlalchemy import func
+from ..core.metrics import get_metrics_recorder
 import json
 import os
 
@@ -16,8 +16,6 @@ class MonitoringAgent(BaseAgent):
             description="Agent de surveillance et monitoring du système optimisé"
         )
         self.logger = logging.getLogger(__name__)
-        self.metrics_cache = {}
-        self.cache_ttl = 300  # 5 minutes
         
         # Configuration Redis avec fallback
         self.redis_client = None
@@ -198,103 +196,41 @@ class MonitoringAgent(BaseAgent):
             }
     
     async def get_performance_metrics(self) -> Dict[str, Any]:
-        """Récupérer les métriques de performance"""
-        # Vérifier le cache
-        cache_key = f"performance_metrics_{datetime.utcnow().strftime('%Y%m%d_%H')}"
-        if cache_key in self.metrics_cache:
-            cache_time, cached_data = self.metrics_cache[cache_key]
-            if time.time() - cache_time < self.cache_ttl:
-                return cached_data
-        
-        db = SessionLocal()
+        """Récupérer les métriques de performance (compteurs incrémentaux sur 24h, O(1) en lecture)"""
         try:
-            # Métriques des dernières 24h
-            since = datetime.utcnow() - timedelta(hours=24)
-            
-            # Nombre total de conversations
-            total_conversations = db.query(Conversation).filter(
-                Conversation.started_at >= since
-            ).count()
-            
-            # Nombre total de messages
-            total_messages = db.query(Message).filter(
-                Message.timestamp >= since
-            ).count()
-            
-            # Temps de réponse moyen (avec gestion d'erreur)
-            avg_response_time = 0
-            try:
-                avg_response_time = db.query(
-                    func.avg(Message.metadata["processing_time"].astext.cast(float))
-                ).filter(
-                    Message.sender_type == "bot",
-                    Message.timestamp >= since,
-                    Message.metadata.has_key("processing_time")
-                ).scalar() or 0
-            except Exception as e:
-                self.logger.warning(f"Erreur calcul temps de réponse: {str(e)}")
-            
-            # Taux d'escalade
-            escalated_conversations = db.query(Conversation).filter(
-                Conversation.started_at >= since,
-                Conversation.status == "escalated"
-            ).count()
-            
-            escalation_rate = (escalated_conversations / max(1, total_conversations)) * 100
-            
-            # Intents les plus fréquents
-            intent_stats = []
-            try:
-                intent_stats = db.query(
-                    Message.intent,
-                    func.count(Message.intent)
-                ).filter(
-                    Message.timestamp >= since,
-                    Message.sender_type == "user"
-                ).group_by(Message.intent).all()
-            except Exception as e:
-                self.logger.warning(f"Erreur statistiques intents: {str(e)}")
-            
-            # Agents les plus utilisés
-            agent_stats = {}
-            try:
-                messages_with_agents = db.query(Message).filter(
-                    Message.timestamp >= since,
-                    Message.sender_type == "bot",
-                    Message.agent_used.isnot(None)
-                ).all()
-                
-                for message in messages_with_agents:
-                    if message.agent_used:
-                        agents = message.agent_used.split(",")
-                        for agent in agents:
-                            agent = agent.strip()
-                            agent_stats[agent] = agent_stats.get(agent, 0) + 1
-            except Exception as e:
-                self.logger.warning(f"Erreur statistiques agents: {str(e)}")
+            window = get_metrics_recorder().window(24)
+            conversations = int(window.get("conversations", 0))
+            turns = int(window.get("turns", 0))
+            # Un tour = un message utilisateur + une réponse du bot
+            total_messages = turns * 2
+            
+            intent_stats = {
+                field[len("intent:"):]: int(count)
+                for field, count in window.items() if field.startswith("intent:")
+            }
+            agent_stats = {
+                field[len("agent:"):]: int(count)
+                for field, count in window.items() if field.startswith("agent:")
+            }
             
-            metrics = {
+            return {
                 "period": "24h",
-                "total_conversations": total_conversations,
+                "total_conversations": conversations,
                 "total_messages": total_messages,
-                "average_response_time": round(avg_response_time, 2),
-                "escalation_rate": round(escalation_rate, 2),
-                "top_intents": dict(intent_stats[:10]),
+                "average_response_time": round(window.get("latency_sum", 0) / max(1, window.get("latency_count", 0)), 2),
+                # Part des conversations escaladées (au plus 100 % : une conversation commencée
+                # avant la fenêtre peut y être escaladée)
+                "escalation_rate": round(min(1.0, window.get("escalated_conversations", 0) / max(1, conversations)) * 100, 2),
+                "error_rate": round(window.get("errors", 0) / max(1, turns) * 100, 2),
+                "top_intents": dict(sorted(intent_stats.items(), key=lambda x: x[1], reverse=True)[:10]),
                 "agent_usage": dict(sorted(agent_stats.items(), key=lambda x: x[1], reverse=True)[:10]),
-                "messages_per_conversation": round(total_messages / max(1, total_conversations), 2),
+                "messages_per_conversation": round(total_messages / max(1, conversations), 2),
                 "timestamp": datetime.utcnow().isoformat()
             }
             
-            # Mettre en cache
-            self.metrics_cache[cache_key] = (time.time(), metrics)
-            
-            return metrics
-            
         except Exception as e:
             self.logger.error(f"Erreur métriques performance: {str(e)}")
             return {"error": str(e)}
-        finally:
-            db.close()
     
     async def check_alerts(self) -> Dict[str, Any]:
         """Vérifier les conditions d'alerte"""
@@ -443,40 +379,3 @@ class MonitoringAgent(BaseAgent):
             recommendations.append("Performances satisfaisantes - continuer le monitoring")
         
         return recommendations
-    
-    async def clear_cache(self) -> Dict[str, Any]:
-        """Vider le cache des métriques"""
-        try:
-            cache_size = len(self.metrics_cache)
-            self.metrics_cache.clear()
-            return {
-                "success": True,
-                "cache_cleared": True,
-                "items_removed": cache_size,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        except Exception as e:
-            return {"error": str(e)}
-    
-    async def get_cache_status(self) -> Dict[str, Any]:
-        """Obtenir le statut du cache"""
-        try:
-            current_time = time.time()
-            active_items = 0
-            expired_items = 0
-            
-            for cache_time, _ in self.metrics_cache.values():
-                if current_time - cache_time < self.cache_ttl:
-                    active_items += 1
-                else:
-                    expired_items += 1
-            
-            return {
-                "total_items": len(self.metrics_cache),
-                "active_items": active_items,
-                "expired_items": expired_items,
-                "cache_ttl_seconds": self.cache_ttl,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        except Exception as e:
-            return {"error": str(e)}
@@ -6,10 +6,10 @@ import logging
 from datetime import datetime
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_
-from sentence_transformers import SentenceTransformer
 
 # Import de la couche d'abstraction des bases de données
 from ..core.db_connection import get_postgres_session, get_qdrant_client
+from ..core.embeddings import get_sentence_encoder
 
 # Import des modèles (à adapter selon ta structure)
 try:
@@ -29,11 +29,8 @@ class ProductSearchAgent(BaseAgent):
         self.logger = logging.getLogger(__name__)
         self.default_limit = 20
         self.max_limit = 100
-        # Modèle d'embedding léger compatible avec Qdrant (384)
-        try:
-            self.embedder = SentenceTransformer("all-MiniLM-L6-v2")
-        except Exception:
-            self.embedder = None
+        # Modèle d'embedding léger compatible avec Qdrant (384), partagé par le processus
+        self.embedder = get_sentence_encoder()
     
     def get_system_prompt(self) -> str:
         return """
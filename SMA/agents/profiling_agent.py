@@ -350,8 +350,9 @@ class CustomerProfilingAgent(BaseAgent):
                     user.profile = profile
                     session.commit()
                     
-                    # Sauvegarder aussi dans MongoDB pour l'analytics
-                    self.db_manager.mongo_db.user_profiles.update_one(
+                    # Sauvegarder aussi dans MongoDB pour l'analytics (écriture différée, par lots)
+                    self.db_manager.analytics.update(
+                        "user_profiles",
                         {"user_id": user_id},
                         {"$set": profile},
                         upsert=True
@@ -7,10 +7,12 @@ except ImportError:
     # Fallback si les modèles ne sont pas disponibles
     SessionLocal = None
 try:
-    from catalogue.backend.models import User, Product, Order, OrderItem
+    from catalogue.backend.models import User, Product, Order, OrderItem, Category
+    from catalogue.backend.analytics import customer_stats, product_brand
 except ImportError:
     # Fallback si les modèles ne sont pas disponibles
-    User = Product = Order = OrderItem = None
+    User = Product = Order = OrderItem = Category = None
+    customer_stats = product_brand = None
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 import logging
@@ -191,38 +193,27 @@ class RecommendationAgent(BaseAgent):
     async def get_brand_based_recommendations(self, user_id: int, db: Session, limit: int) -> List[Dict]:
         """Recommandations basées sur les marques préférées"""
         try:
-            # Analyser les marques préférées depuis l'historique
-            brand_counts = {}
-            orders = db.query(Order).filter(Order.user_id == user_id).limit(50).all()
-            
-            for order in orders:
-                if hasattr(order, 'items') and order.items:
-                    for item in order.items:
-                        if hasattr(item, 'product') and item.product:
-                            brand = getattr(item.product, 'brand', None)
-                            if brand:
-                                quantity = getattr(item, 'quantity', 1)
-                                brand_counts[brand] = brand_counts.get(brand, 0) + quantity
-            
-            preferred_brands = sorted(brand_counts.items(), key=lambda x: x[1], reverse=True)[:3]
-            
-            if not preferred_brands:
+            # Marques préférées agrégées en base (une requête groupée)
+            brand_names = list(customer_stats(db, user_id, top=3).top_brands)
+            
+            if not brand_names:
                 return []
             
             # Recommander des produits des marques préférées
-            brand_names = [brand[0] for brand in preferred_brands]
-            brand_products = db.query(Product).filter(
-                Product.brand.in_(brand_names),
-                Product.is_active == True,
-                Product.stock_quantity > 0
-            ).order_by(desc(Product.rating)).limit(limit).all()
+            brand = product_brand()
+            brand_products = db.query(
+                Product.id, Product.nom, Product.prix, Category.nom.label("category"), brand.label("brand")
+            ).outerjoin(Category, Category.id == Product.categorie_id).filter(
+                brand.in_(brand_names),
+                Product.stock > 0
+            ).order_by(desc(Product.stock)).limit(limit).all()
             
             recommendations = []
             for product in brand_products:
                 recommendations.append({
                     "product_id": product.id,
-                    "name": product.name,
-                    "price": product.price,
+                    "name": product.nom,
+                    "price": float(product.prix),
                     "category": product.category,
                     "brand": product.brand,
                     "score": 0.7,
@@ -1,5 +1,36 @@
 from .base_agent import BaseAgent
-from typing import Dict, Any, List
+from ..core.response_cache import CacheKey
+from typing import Dict, Any, List, Optional
+
+# Consignes d'adaptation par segment, intégrées au prompt de synthèse (un seul appel LLM)
+ADAPTATION_INSTRUCTIONS = {
+    "vip": """
+        Adaptez le texte pour un client VIP en:
+        - Utilisant un ton plus personnalisé
+        - Mentionnant des avantages exclusifs si pertinent
+        - Montrant de la reconnaissance pour la fidélité
+        """,
+    "new_customer": """
+        Adaptez le texte pour un nouveau client en:
+        - Utilisant un ton accueillant
+        - Expliquant les services disponibles
+        - Encourageant l'exploration
+        """
+}
+
+NO_PRODUCTS_TEXT = "Aucun produit trouvé pour votre recherche."
+NO_RECOMMENDATIONS_TEXT = "Je n'ai pas pu générer de recommandations personnalisées pour le moment."
+GENERAL_TEMPLATES = {
+    "greeting": "Bonjour ! Comment puis-je vous aider aujourd’hui ?",
+    "order_status": "Pour vérifier le statut de vos commandes, j'ai besoin de quelques informations :\n\n• Numéro de commande\n• Ou votre email et date de commande\n\nJe peux aussi vous aider à suivre vos livraisons en temps réel.",
+    "recommendation": "Excellente idée ! Je vais analyser vos préférences pour vous proposer des recommandations personnalisées.\n\n🎯 **Recommandations en cours de génération...**\n\nBasées sur vos achats précédents et les tendances actuelles.",
+    "customer_service": "Je suis là pour vous aider ! Pouvez-vous me décrire votre problème ou votre question ?\n\nJe peux vous assister pour :\n• Problèmes de commande\n• Questions sur les produits\n• Retours et remboursements\n• Informations générales",
+    "bot_role": "Je suis un assistant virtuel conçu pour vous aider à trouver des produits, gérer vos commandes et répondre à vos questions sur notre boutique.",
+    # Réponse générique mais dynamique
+    "default": "Merci pour votre message. Dites-moi simplement ce dont vous avez besoin (ex: rechercher un produit, suivre une commande, obtenir une recommandation)."
+}
+# Textes fixes : leur version adaptée est calculée une fois par segment
+STATIC_TEMPLATES = frozenset([NO_PRODUCTS_TEXT, NO_RECOMMENDATIONS_TEXT, *GENERAL_TEMPLATES.values()])
 
 class SummarizerAgent(BaseAgent):
     def __init__(self):
@@ -7,6 +38,8 @@ class SummarizerAgent(BaseAgent):
             name="summarizer_agent",
             description="Agent de synthèse et structuration des informations"
         )
+        # (segment, texte fixe) -> texte adapté
+        self._adapted_templates: Dict[tuple, str] = {}
     
     def get_system_prompt(self) -> str:
         return """
@@ -40,6 +73,7 @@ class SummarizerAgent(BaseAgent):
         user_profile = state.get("user_profile", {})
         user_message = state.get("user_message", "")
         intent = state.get("intent", "")
+        conversation = state.get("conversation_context", "")
         
         # Enrichir les données brutes avec le contexte
         enriched_data = {
@@ -49,26 +83,64 @@ class SummarizerAgent(BaseAgent):
             "user_profile": user_profile
         }
         
+        # Les consignes d'adaptation au profil sont incluses dans le prompt de synthèse :
+        # un seul appel LLM par tour (aucun pour les profils anonymes ou par défaut)
+        segment = self.adaptation_segment(user_profile)
+        adaptation = ADAPTATION_INSTRUCTIONS.get(segment, "")
+        
         if content_type == "product_summary":
-            summary = await self.summarize_products(raw_data.get("products", []))
+            summary = await self.summarize_products(raw_data.get("products", []), conversation, adaptation,
+                                                    question=user_message)
         elif content_type == "recommendations":
-            summary = await self.summarize_recommendations(raw_data.get("recommendations", []))
+            summary = await self.summarize_recommendations(raw_data.get("recommendations", []), conversation, adaptation)
         elif content_type == "order_status":
-            summary = await self.summarize_order_status(raw_data)
+            summary = await self.summarize_order_status(raw_data, conversation, adaptation)
         elif content_type == "cart_summary":
             summary = await self.summarize_cart(raw_data.get("cart", {}))
         else:
             summary = await self.general_summary(enriched_data)
         
-        # Adapter selon le profil utilisateur
-        adapted_summary = await self.adapt_to_user(summary, user_profile)
-        state["response_text"] = adapted_summary
+        if segment and summary in STATIC_TEMPLATES:
+            summary = await self.adapt_template(summary, segment)
+        state["response_text"] = summary
         return state
     
-    async def summarize_products(self, products: List[Dict]) -> str:
-        """Résumer une liste de produits"""
+    @staticmethod
+    def adaptation_segment(user_profile: Dict) -> Optional[str]:
+        """Segment justifiant une adaptation du ton ; None pour les profils anonymes ou par défaut"""
+        if not user_profile or not user_profile.get("user_id"):
+            return None
+        if user_profile.get("is_vip"):
+            return "vip"
+        segment = user_profile.get("segment", "")
+        # Le profil calculé porte {"segment": ..., "confidence": ...}
+        if isinstance(segment, dict):
+            segment = segment.get("segment", "")
+        return segment if segment in ADAPTATION_INSTRUCTIONS else None
+    
+    async def adapt_template(self, template: str, segment: str) -> str:
+        """Version adaptée d'un texte fixe, générée une fois par segment"""
+        key = (segment, template)
+        adapted = self._adapted_templates.get(key)
+        if adapted is None:
+            prompt = self.build_prompt(f"""
+            {ADAPTATION_INSTRUCTIONS[segment]}
+            Texte original: {template}
+            """)
+            try:
+                adapted = await self.llm.generate(prompt, agent=self.name)
+            except Exception as e:
+                # Ne pas mettre en cache un échec : texte d'origine pour ce tour
+                self.logger.warning(f"Adaptation du modèle '{segment}' impossible: {e}")
+                return template
+            self._adapted_templates[key] = adapted
+        return adapted
+    
+    async def summarize_products(self, products: List[Dict], conversation: str = "", adaptation: str = "",
+                                 question: str = "") -> str:
+        """Résumer une liste de produits ; sans adaptation au profil, le résumé passe par le cache sémantique"""
         if not products:
-            return "Aucun produit trouvé pour votre recherche."
+            return NO_PRODUCTS_TEXT
         
         context = {
             "total_products": len(products),
@@ -95,13 +167,22 @@ class SummarizerAgent(BaseAgent):
         - Souligne les points forts
         - Encourage à explorer davantage
         """
-        
-        return await self.generate_response(prompt, context)
+        prompt += adaptation
+        
+        # Résumé non personnalisé : réutilisable pour une question proche sur les mêmes produits,
+        # invalidé quand l'un d'eux change dans le catalogue. Mis en cache, il est généré sans
+        # l'historique de la session (voir generate_response)
+        cache_key = None
+        if not adaptation and question:
+            cache_key = CacheKey("product_summary", question,
+                                 tuple(p["id"] for p in products[:5] if p.get("id") is not None))
+        return await self.generate_response(prompt, context, conversation=conversation, cache_key=cache_key,
+                                           stream=True)
     
-    async def summarize_recommendations(self, recommendations: List[Dict]) -> str:
+    async def summarize_recommendations(self, recommendations: List[Dict], conversation: str = "", adaptation: str = "") -> str:
         """Résumer des recommandations personnalisées"""
         if not recommendations:
-            return "Je n'ai pas pu générer de recommandations personnalisées pour le moment."
+            return NO_RECOMMENDATIONS_TEXT
         
         context = {"recommendations": recommendations[:5]}
         
@@ -123,10 +204,11 @@ class SummarizerAgent(BaseAgent):
         - Encourage à découvrir les produits
         - Reste naturel et conversationnel
         """
+        prompt += adaptation
         
-        return await self.generate_response(prompt, context)
+        return await self.generate_response(prompt, context, conversation=conversation, stream=True)
     
-    async def summarize_order_status(self, order_data: Dict) -> str:
+    async def summarize_order_status(self, order_data: Dict, conversation: str = "", adaptation: str = "") -> str:
         """Résumer le statut d'une commande"""
         context = {"order": order_data}
         
@@ -143,41 +225,21 @@ class SummarizerAgent(BaseAgent):
         - Rassure le client
         - Propose de l'aide si nécessaire
         """
+        prompt += adaptation
         
-        return await self.generate_response(prompt, context)
+        return await self.generate_response(prompt, context, conversation=conversation, stream=True)
     
     async def adapt_to_user(self, summary: str, user_profile: Dict) -> str:
-        """Adapter le résumé selon le profil utilisateur"""
-        if not user_profile:
+        """Adapter un texte déjà rédigé selon le profil utilisateur (appel LLM séparé)"""
+        segment = self.adaptation_segment(user_profile)
+        if not segment:
             return summary
-        
-        segment = user_profile.get("segment", "")
-        is_vip = user_profile.get("is_vip", False)
-        
-        if is_vip:
-            # Ton plus personnalisé pour les VIP
-            adaptation_prompt = f"""
-            Adaptez ce texte pour un client VIP en:
-            - Utilisant un ton plus personnalisé
-            - Mentionnant des avantages exclusifs si pertinent
-            - Montrant de la reconnaissance pour la fidélité
-            
+        if summary in STATIC_TEMPLATES:
+            return await self.adapt_template(summary, segment)
+        return await self.generate_response(f"""
+            {ADAPTATION_INSTRUCTIONS[segment]}
             Texte original: {summary}
-            """
-        elif segment == "new_customer":
-            # Ton plus accueillant pour les nouveaux
-            adaptation_prompt = f"""
-            Adaptez ce texte pour un nouveau client en:
-            - Utilisant un ton accueillant
-            - Expliquant les services disponibles
-            - Encourageant l'exploration
-            
-            Texte original: {summary}
-            """
-        else:
-            return summary
-        
-        return await self.generate_response(adaptation_prompt)
+            """)
 
     async def general_summary(self, raw_data: Dict[str, Any]) -> str:
         """Générer un résumé général à partir de données brutes"""
@@ -185,27 +247,10 @@ class SummarizerAgent(BaseAgent):
         user_message = raw_data.get("user_message", "")
         
         # Réponses contextuelles selon l'intention
-        if intent == "greeting":
-            return "Bonjour ! Comment puis-je vous aider aujourd’hui ?"
-        
-        elif intent == "product_search":
+        if intent == "product_search":
             return f"Je vais rechercher des produits pour vous. Votre demande était : '{user_message}'\n\n🔍 **Recherche en cours...**\n\nSi aucun produit n'est trouvé, je peux vous proposer des alternatives ou des recommandations similaires."
         
-        elif intent == "order_status":
-            return "Pour vérifier le statut de vos commandes, j'ai besoin de quelques informations :\n\n• Numéro de commande\n• Ou votre email et date de commande\n\nJe peux aussi vous aider à suivre vos livraisons en temps réel."
-        
-        elif intent == "recommendation":
-            return "Excellente idée ! Je vais analyser vos préférences pour vous proposer des recommandations personnalisées.\n\n🎯 **Recommandations en cours de génération...**\n\nBasées sur vos achats précédents et les tendances actuelles."
-        
-        elif intent == "customer_service":
-            return "Je suis là pour vous aider ! Pouvez-vous me décrire votre problème ou votre question ?\n\nJe peux vous assister pour :\n• Problèmes de commande\n• Questions sur les produits\n• Retours et remboursements\n• Informations générales"
-        
-        elif intent == "bot_role":
-            return "Je suis un assistant virtuel conçu pour vous aider à trouver des produits, gérer vos commandes et répondre à vos questions sur notre boutique."
-        
-        else:
-            # Réponse générique mais dynamique
-            return "Merci pour votre message. Dites-moi simplement ce dont vous avez besoin (ex: rechercher un produit, suivre une commande, obtenir une recommandation)."
+        return GENERAL_TEMPLATES.get(intent, GENERAL_TEMPLATES["default"])
 
     async def summarize_cart(self, cart: Dict[str, Any]) -> str:
         if not cart or cart.get("is_empty"):
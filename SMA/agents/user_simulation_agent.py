@@ -1,30 +1,140 @@
-from .base_agent import BaseAgent
-from typing import Dict, Any, Optional
+"""
+Agent utilisateur simulé et générateur de charge
+
+Un UserSimulationAgent joue un scénario d'utilisateur e-commerce (connexion,
+recherche, panier, questions au chatbot en HTTP ou WebSocket). Il ne fait pas
+partie du graphe de conversation : aucun message de chat ne peut déclencher
+de trafic sortant. Lancé seul, le module démarre N utilisateurs virtuels
+concurrents (tâches asyncio partageant un client httpx), avec un mélange
+pondéré de scénarios, des temps de réflexion et une montée en charge
+progressive :
+
+    python -m SMA.agents.user_simulation_agent [utilisateurs] [durée_s] [montée_s] [réflexion_s]
+
+Le rapport donne le débit et les latences p50/p95/p99 par point d'accès
+(/chat, /ws, /api/cart, /api/products, /api/auth) et par intention retournée
+par le graphe. Les URL visées viennent de SIMULATION_CHAT_URL et
+SIMULATION_CATALOGUE_URL (services locaux de substitution possibles).
+"""
+
+import asyncio
+import json
+import math
 import random
+import sys
 import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, Any, List, Optional
+
 import httpx
 
+from .base_agent import BaseAgent
+from ..core.config import settings
+
+REQUEST_TIMEOUT = 30.0
+
+SEARCH_QUERIES = ["smartphone", "casque", "ordinateur portable", "montre connectée", "tablette", "écouteurs"]
+
+CHAT_MESSAGES = {
+    "browse": [
+        "Je cherche un smartphone à moins de 500 euros",
+        "Quels casques bluetooth me conseillez-vous ?",
+        "Montre-moi des ordinateurs portables pour le gaming",
+        "Compare les deux premiers produits"
+    ],
+    "buyer": [
+        "Ajoute le premier produit à mon panier",
+        "Qu'est-ce qu'il y a dans mon panier ?",
+        "Je veux commander ce produit"
+    ],
+    "support": [
+        "Quels sont les délais de livraison ?",
+        "Comment retourner un article ?",
+        "Quels moyens de paiement acceptez-vous ?",
+        "J'ai oublié mon mot de passe"
+    ]
+}
+
+# Scénarios : suite d'actions (méthodes action_*), et leur poids dans le mélange
+SCENARIOS = {
+    "browse": ["search_products", "chat", "browse_categories", "search_products", "chat"],
+    "buyer": ["connect_or_signup", "search_products", "add_to_cart", "view_cart", "chat"],
+    "support": ["contact_support", "contact_support", "chat"],
+    "realtime": ["ws_chat"]
+}
+SCENARIO_WEIGHTS = {"browse": 4, "buyer": 3, "support": 2, "realtime": 1}
+
+def _percentile(values: List[float], q: float) -> float:
+    """Percentile par rang sur des valeurs triées"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+class LatencyRecorder:
+    """Latences par point d'accès et par intention, partagées par les utilisateurs virtuels"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.scenarios: Counter = Counter()
+        self.started = time.monotonic()
+
+    def record(self, name: str, seconds: float, ok: bool = True):
+        self.samples[name].append(seconds)
+        if not ok:
+            self.errors[name] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+
+        def stats(name: str) -> Dict[str, Any]:
+            values = sorted(self.samples[name])
+            return {
+                "requests": len(values),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(_percentile(values, 0.50) * 1000, 1),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(_percentile(values, 0.99) * 1000, 1)
+            }
+
+        return {
+            "duration_s": round(elapsed, 1),
+            "scenarios": dict(self.scenarios),
+            "endpoints": {name: stats(name) for name in sorted(self.samples) if not name.startswith("intent:")},
+            "intents": {name[7:]: stats(name) for name in sorted(self.samples) if name.startswith("intent:")}
+        }
+
 class UserSimulationAgent(BaseAgent):
     """
     Agent SMA simulant un utilisateur humain sur un site e-commerce.
-    Il peut se connecter, rechercher des produits, ajouter au panier, passer commande, laisser des avis, etc.
+    Il peut se connecter, rechercher des produits, ajouter au panier, interroger le chatbot, etc.
     Les comportements sont variés et peuvent être scriptés ou aléatoires.
     """
 
-    def __init__(self, user_profile: Optional[Dict[str, Any]] = None, scenario: Optional[str] = None):
+    def __init__(self, user_profile: Optional[Dict[str, Any]] = None, scenario: Optional[str] = None,
+                 client: Optional[httpx.AsyncClient] = None, recorder: Optional[LatencyRecorder] = None):
         """
         Initialise l'agent avec un profil utilisateur et un scénario optionnel.
         :param user_profile: Dictionnaire décrivant le profil (préférences, historique, etc.)
-        :param scenario: Nom ou description du scénario à jouer
+        :param scenario: Nom du scénario à jouer (clé de SCENARIOS)
+        :param client: Client HTTP partagé (générateur de charge) ; sinon un client par requête
+        :param recorder: Collecteur des latences (générateur de charge)
         """
         super().__init__(name="user_simulation_agent", description="Agent simulant un utilisateur e-commerce")
         self.user_profile = user_profile or {
-            "email": f"user{random.randint(1000,9999)}@test.com",
+            "email": f"user{uuid.uuid4().hex[:10]}@test.com",
             "password": "test1234",
             "prenom": "Test",
             "nom": "Utilisateur"
         }
         self.scenario = scenario
+        self.client = client
+        self.recorder = recorder
+        self.catalogue_url = settings.SIMULATION_CATALOGUE_URL.rstrip("/")
+        self.chat_url = settings.SIMULATION_CHAT_URL.rstrip("/")
+        self.session_id = f"sim_{uuid.uuid4().hex[:12]}"
         self.state = {}
 
     def get_system_prompt(self) -> str:
@@ -39,163 +149,240 @@ class UserSimulationAgent(BaseAgent):
         :param state: Etat courant du SMA
         :return: Etat mis à jour
         """
-        # TODO: Enchaîner les actions selon le scénario ou un comportement aléatoire
-        await self.simulate_behavior()
+        await self.run_scenario(state.get("simulation_scenario") or self.scenario or "buyer")
         return state
 
     async def simulate_behavior(self):
         """
         Simule une séquence d'actions utilisateur (connexion, navigation, achat, etc.)
         """
-        await self.action_connect_or_signup()
-        await self.action_search_products(query="smartphone", filters={"price_max": 500})
-        await self.action_add_to_cart()
-        # TODO: Enchaîner les autres actions
-        # await self.action_browse_categories()
-        # ...
+        await self.run_scenario(self.scenario or "buyer")
+
+    async def run_scenario(self, name: str, think_time: float = 0.0, deadline: Optional[float] = None):
+        """
+        Enchaîne les actions du scénario `name`, avec un temps de réflexion
+        aléatoire (moyenne `think_time` secondes) entre deux actions.
+        """
+        for action in SCENARIOS[name]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            await getattr(self, f"action_{action}")()
+            if think_time:
+                await asyncio.sleep(random.expovariate(1 / think_time))
+
+    async def _send(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str,
+                    **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+        except Exception as e:
+            self.logger.debug(f"[AUI] Erreur {endpoint}: {e}")
+            if self.recorder is not None:
+                self.recorder.record(endpoint, time.perf_counter() - start, ok=False)
+            return None
+        if self.recorder is not None:
+            self.recorder.record(endpoint, time.perf_counter() - start, ok=resp.status_code < 400)
+        if resp.status_code >= 400:
+            self.logger.debug(f"[AUI] Échec {endpoint} ({resp.status_code}): {resp.text[:200]}")
+        return resp
+
+    async def _request(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """Requête chronométrée sous le nom `endpoint` ; None si le service ne répond pas"""
+        token = self.state.get("token")
+        if token:
+            kwargs.setdefault("headers", {})["Authorization"] = f"Bearer {token}"
+        if self.client is not None:
+            return await self._send(self.client, endpoint, method, url, **kwargs)
+        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
+            return await self._send(client, endpoint, method, url, **kwargs)
+
+    def _record_intent(self, intent: Optional[str], seconds: float):
+        if self.recorder is not None:
+            self.recorder.record(f"intent:{intent or 'unknown'}", seconds)
 
     async def action_connect_or_signup(self):
         """
         Tente de se connecter via l'API backend, ou s'inscrit si l'utilisateur n'existe pas.
         Stocke le token/session dans l'état de l'agent.
         """
-        base_url = "http://localhost:8000"  # À adapter selon config
-        email = self.user_profile["email"]
-        password = self.user_profile["password"]
-        async with httpx.AsyncClient() as client:
-            # Tentative de connexion
-            try:
-                resp = await client.post(f"{base_url}/api/auth/login", json={
-                    "email": email,
-                    "password": password
-                })
-                if resp.status_code == 200:
-                    data = resp.json()
-                    self.state["token"] = data.get("access_token")
-                    self.state["user_id"] = data.get("user_id")
-                    print(f"[AUI] Connecté comme {email}")
-                    return
-            except Exception as e:
-                print(f"[AUI] Erreur connexion: {e}")
+        if self.state.get("token"):
+            return
+        credentials = {"email": self.user_profile["email"], "password": self.user_profile["password"]}
+        resp = await self._request("/api/auth", "POST", f"{self.catalogue_url}/api/auth/login", json=credentials)
+        if resp is None or resp.status_code != 200:
             # Si échec, inscription
-            try:
-                resp = await client.post(f"{base_url}/api/auth/register", json={
-                    "email": email,
-                    "password": password,
-                    "username": self.user_profile["prenom"].lower()
-                })
-                if resp.status_code in (200, 201):
-                    data = resp.json()
-                    self.state["token"] = data.get("access_token")
-                    self.state["user_id"] = data.get("user_id")
-                    print(f"[AUI] Inscrit et connecté comme {email}")
-                    return
-                else:
-                    print(f"[AUI] Échec inscription: {resp.text}")
-            except Exception as e:
-                print(f"[AUI] Erreur inscription: {e}")
+            resp = await self._request("/api/auth", "POST", f"{self.catalogue_url}/api/auth/register", json={
+                **credentials,
+                "username": f"{self.user_profile['prenom'].lower()}_{uuid.uuid4().hex[:8]}"
+            })
+        if resp is not None and resp.status_code in (200, 201):
+            data = resp.json()
+            self.state["token"] = data.get("access_token")
+            self.state["user_id"] = data.get("user_id")
+            self.logger.debug(f"[AUI] Connecté comme {self.user_profile['email']}")
 
     async def action_browse_categories(self):
         """
         Simule la navigation dans les catégories de produits.
         """
-        # TODO: Appeler l'API de catalogue pour lister les catégories
-        pass
+        resp = await self._request("/api/products", "GET", f"{self.catalogue_url}/api/products/categories")
+        if resp is not None and resp.status_code == 200:
+            self.state["categories"] = resp.json()
 
-    async def action_search_products(self, query: str = "", filters: Optional[Dict[str, Any]] = None):
+    async def action_search_products(self, query: Optional[str] = None, filters: Optional[Dict[str, Any]] = None):
         """
         Effectue une recherche de produits via l'API backend.
-        :param query: Terme de recherche (ex: "smartphone")
+        :param query: Terme de recherche (ex: "smartphone"), aléatoire par défaut
         :param filters: Dictionnaire de filtres (ex: {"price_max": 500})
         Stocke les résultats dans l'état de l'agent.
         """
-        base_url = "http://localhost:8000"  # À adapter selon config
-        token = self.state.get("token")
-        params = {"q": query}
+        params = {"q": query or random.choice(SEARCH_QUERIES)}
         if filters:
             params.update(filters)
-        headers = {"Authorization": f"Bearer {token}"} if token else {}
-        try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(f"{base_url}/api/products/", params=params, headers=headers)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    self.state["search_results"] = data
-                    print(f"[AUI] Recherche produits: {len(self.state['search_results'])} résultats trouvés.")
-                else:
-                    print(f"[AUI] Échec recherche produits: {resp.text}")
-        except Exception as e:
-            print(f"[AUI] Erreur recherche produits: {e}")
-
-    async def action_compare_products(self):
-        """
-        Simule la comparaison de plusieurs produits.
-        """
-        # TODO: Implémenter la logique de comparaison
-        pass
+        resp = await self._request("/api/products", "GET", f"{self.catalogue_url}/api/products/", params=params)
+        if resp is not None and resp.status_code == 200:
+            self.state["search_results"] = resp.json()
 
     async def action_add_to_cart(self, product_id: Optional[int] = None, quantity: int = 1):
         """
         Ajoute un produit au panier via l'API backend.
-        :param product_id: ID du produit à ajouter (si None, prend le premier résultat de recherche)
+        :param product_id: ID du produit à ajouter (si None, prend un résultat de recherche)
         :param quantity: Quantité à ajouter
         Stocke l'état du panier dans l'agent.
         """
-        base_url = "http://localhost:8000"  # À adapter selon config
-        token = self.state.get("token")
         user_id = self.state.get("user_id")
-        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        if user_id is None:
+            return
         # Sélectionner un produit si non spécifié
         if product_id is None:
-            results = self.state.get("search_results", [])
+            results = self.state.get("search_results") or []
             if not results:
-                print("[AUI] Aucun produit à ajouter au panier.")
                 return
-            product_id = results[0].get("id") if isinstance(results[0], dict) else results[0]
-        try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.post(f"{base_url}/api/cart/add", json={
-                    "user_id": user_id,
-                    "product_id": product_id,
-                    "quantite": quantity
-                }, headers=headers)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    self.state["cart"] = data
-                    print(f"[AUI] Produit {product_id} ajouté au panier.")
-                else:
-                    print(f"[AUI] Échec ajout panier: {resp.text}")
-        except Exception as e:
-            print(f"[AUI] Erreur ajout panier: {e}")
+            choice = random.choice(results)
+            product_id = choice.get("id") if isinstance(choice, dict) else choice
+        resp = await self._request("/api/cart", "POST", f"{self.catalogue_url}/api/cart/add", json={
+            "user_id": user_id,
+            "product_id": product_id,
+            "quantite": quantity
+        })
+        if resp is not None and resp.status_code == 200:
+            self.state["cart"] = resp.json()
+
+    async def action_view_cart(self):
+        """
+        Consulte le panier de l'utilisateur.
+        """
+        user_id = self.state.get("user_id")
+        if user_id is None:
+            return
+        resp = await self._request("/api/cart", "GET", f"{self.catalogue_url}/api/cart/{user_id}")
+        if resp is not None and resp.status_code == 200:
+            self.state["cart"] = resp.json()
 
-    async def action_checkout(self):
+    async def action_chat(self, message: Optional[str] = None):
         """
-        Simule le passage de commande.
+        Envoie un message au chatbot (POST /chat) ; l'intention retournée est chronométrée à part.
         """
-        # TODO: Appeler l'API commande
-        pass
+        message = message or random.choice(CHAT_MESSAGES[self.scenario if self.scenario in CHAT_MESSAGES else "browse"])
+        start = time.perf_counter()
+        resp = await self._request("/chat", "POST", f"{self.chat_url}/chat", json={
+            "message": message,
+            "session_id": self.session_id,
+            "user_id": self.state.get("user_id")
+        })
+        if resp is not None and resp.status_code == 200:
+            data = resp.json()
+            self.state["last_response"] = data.get("response")
+            self._record_intent(data.get("intent"), time.perf_counter() - start)
 
-    async def action_leave_review(self):
+    async def action_ws_chat(self, messages: Optional[List[str]] = None):
         """
-        Simule la rédaction d'un avis sur un produit.
+        Conversation sur le WebSocket /ws : latence du premier fragment et de la réponse complète.
         """
-        # TODO: Appeler l'API avis
-        pass
+        import websockets
+        messages = messages or random.sample(CHAT_MESSAGES["browse"] + CHAT_MESSAGES["support"], 3)
+        url = f"{self.chat_url.replace('http', 'ws', 1)}/ws/{self.session_id}"
+        if self.state.get("user_id") is not None:
+            url += f"?user_id={self.state['user_id']}"
+        start = time.perf_counter()
+        try:
+            async with websockets.connect(url, open_timeout=REQUEST_TIMEOUT) as ws:
+                for message in messages:
+                    start = time.perf_counter()
+                    await ws.send(json.dumps({"message": message}))
+                    first_delta = None
+                    while True:
+                        frame = json.loads(await asyncio.wait_for(ws.recv(), REQUEST_TIMEOUT))
+                        kind = frame.get("type")
+                        if kind == "delta" and first_delta is None:
+                            first_delta = time.perf_counter() - start
+                        elif kind in ("response", "error"):
+                            break
+                    elapsed = time.perf_counter() - start
+                    if self.recorder is not None:
+                        self.recorder.record("/ws", elapsed, ok=kind == "response")
+                        if first_delta is not None:
+                            self.recorder.record("/ws (premier fragment)", first_delta)
+                    if kind == "response":
+                        self._record_intent(frame.get("intent"), elapsed)
+        except Exception as e:
+            self.logger.debug(f"[AUI] Erreur WebSocket: {e}")
+            if self.recorder is not None:
+                self.recorder.record("/ws", time.perf_counter() - start, ok=False)
 
     async def action_contact_support(self):
         """
         Simule une question ou une demande au service client.
         """
-        # TODO: Appeler l'API support client
-        pass
-
-# Exemple de scénario utilisateur (à adapter dans simulate_behavior)
-# 1. Connexion ou inscription
-# 2. Recherche d'un produit (ex: "smartphone")
-# 3. Navigation sur plusieurs pages de résultats
-# 4. Ajout d'un produit au panier, hésitation, retrait/ajout
-# 5. Passage de commande
-# 6. Rédaction d'un avis
-# 7. Question au service client
-#
-# TODO: Implémenter la logique de scénario et d'aléa pour simuler un vrai comportement humain
+        await self.action_chat(random.choice(CHAT_MESSAGES["support"]))
+
+async def run_load(users: int, duration: float, ramp_up: float = 0.0, think_time: float = 1.0,
+                   weights: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Lance `users` utilisateurs virtuels pendant `duration` secondes. Le i-ème
+    démarre après ramp_up * i / users secondes ; chacun enchaîne des scénarios
+    tirés selon `weights` jusqu'à la fin du test.
+    """
+    weights = weights or SCENARIO_WEIGHTS
+    names, scenario_weights = list(weights), list(weights.values())
+    recorder = LatencyRecorder()
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        async def virtual_user(index: int):
+            await asyncio.sleep(ramp_up * index / users)
+            # Un utilisateur garde son compte et sa session de chat d'un scénario à l'autre
+            agent = UserSimulationAgent(client=client, recorder=recorder)
+            while time.monotonic() < deadline:
+                scenario = agent.scenario = random.choices(names, scenario_weights)[0]
+                await agent.run_scenario(scenario, think_time, deadline)
+                recorder.scenarios[scenario] += 1
+
+        await asyncio.gather(*(virtual_user(i) for i in range(users)))
+    return recorder.summary()
+
+def format_report(summary: Dict[str, Any]) -> str:
+    lines = [f"✅ {summary['duration_s']}s, scénarios joués: {summary['scenarios']}"]
+    for title, section in (("Point d'accès", summary["endpoints"]), ("Intention", summary["intents"])):
+        lines.append(f"\n{title:<26} {'req':>6} {'err':>5} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for name, stats in section.items():
+            lines.append(
+                f"{name:<26} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>7} "
+                f"{stats['p50_ms']:>6}ms {stats['p95_ms']:>6}ms {stats['p99_ms']:>6}ms"
+            )
+    return "\n".join(lines)
+
+def main(argv: List[str]) -> int:
+    users = int(argv[0]) if len(argv) > 0 else 20
+    duration = float(argv[1]) if len(argv) > 1 else 60.0
+    ramp_up = float(argv[2]) if len(argv) > 2 else 10.0
+    think_time = float(argv[3]) if len(argv) > 3 else 1.0
+    print(f"🔍 {users} utilisateurs virtuels, {duration:.0f}s (montée {ramp_up:.0f}s, réflexion {think_time}s)")
+    print(f"Chat: {settings.SIMULATION_CHAT_URL}  Catalogue: {settings.SIMULATION_CATALOGUE_URL}")
+    summary = asyncio.run(run_load(users, duration, ramp_up, think_time))
+    print(format_report(summary))
+    return 0 if summary["endpoints"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,2 +1,2 @@
 """SMA.core - FastAPI app, config, db, orchestrator"""
-__all__ = ["main", "config", "database", "auth", "orchestrator"]
+__all__ = ["main", "config", "database", "auth", "orchestrator", "session_store"]
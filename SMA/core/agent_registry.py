@@ -0,0 +1,96 @@
+"""
+Registre d'agents à construction paresseuse
+
+Un agent (et le module qui le définit : SentenceTransformer, CLIP, clients
+Qdrant/Redis, modèle Gemini...) n'est importé et construit qu'à sa première
+utilisation. La construction est protégée par un verrou par agent, et un
+préchauffage optionnel en arrière-plan évite de payer ce coût sur la
+première requête.
+
+Depuis la boucle asyncio, utiliser `await registry.aget(name)` : un agent pas
+encore construit est résolu dans l'exécuteur, et la boucle n'attend pas le
+verrou tenu par le thread de préchauffage.
+"""
+
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Une fabrique est soit un callable, soit "module:Classe" (import relatif possible)
+AgentFactory = Union[str, Callable[[], Any]]
+
+class AgentRegistry(Mapping):
+    """Mapping nom -> agent ; l'agent est construit au premier accès"""
+
+    def __init__(self, factories: Dict[str, AgentFactory], package: Optional[str] = None):
+        self._factories = dict(factories)
+        self._package = package
+        self._instances: Dict[str, Any] = {}
+        self._locks = {name: threading.Lock() for name in self._factories}
+        # Durée de construction (secondes) de chaque agent chargé
+        self.load_times: Dict[str, float] = {}
+
+    def _resolve(self, factory: AgentFactory) -> Callable[[], Any]:
+        if callable(factory):
+            return factory
+        module_name, _, attribute = factory.partition(":")
+        module = importlib.import_module(module_name, package=self._package)
+        return getattr(module, attribute)
+
+    def __getitem__(self, name: str) -> Any:
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(name)
+        with self._locks[name]:
+            # Double vérification : un autre thread a pu construire l'agent entre-temps
+            instance = self._instances.get(name)
+            if instance is None:
+                start = time.perf_counter()
+                instance = self._resolve(self._factories[name])()
+                self.load_times[name] = time.perf_counter() - start
+                self._instances[name] = instance
+                logger.info(f"Agent {name} chargé en {self.load_times[name]:.2f}s")
+        return instance
+
+    async def aget(self, name: str) -> Any:
+        """Accès non bloquant pour la boucle asyncio"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        if name not in self._factories:
+            raise KeyError(name)
+        return await asyncio.get_running_loop().run_in_executor(None, self.__getitem__, name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._factories)
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._factories
+
+    def loaded(self) -> List[str]:
+        return [name for name in self._factories if name in self._instances]
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> threading.Thread:
+        """Construire les agents en arrière-plan (les échecs sont journalisés, pas levés)"""
+        targets = list(names) if names is not None else list(self._factories)
+
+        def run():
+            for name in targets:
+                try:
+                    self[name]
+                except Exception as e:
+                    logger.error(f"Préchauffage de l'agent {name} échoué: {e}")
+
+        thread = threading.Thread(target=run, name="agent-warmup", daemon=True)
+        thread.start()
+        return thread
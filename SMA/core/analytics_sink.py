@@ -0,0 +1,174 @@
+"""
+Écritures analytiques MongoDB en différé, par lots
+
+Les journaux de support et les copies analytiques des profils ne doivent pas
+retarder la réponse : l'agent dépose le document dans une file bornée et
+reprend aussitôt. Un thread d'écriture vide la file par lots :
+- insertions regroupées en un `insert_many(ordered=False)` par collection ;
+- mises à jour regroupées en un `bulk_write` par collection (ordonné, pour
+  que deux mises à jour du même document s'appliquent dans l'ordre).
+
+Un lot part dès ANALYTICS_BATCH_SIZE opérations ou après
+ANALYTICS_FLUSH_INTERVAL secondes. Au-delà de ANALYTICS_MAX_BUFFER opérations
+en attente (MongoDB lent ou absent), les nouvelles sont abandonnées et
+comptées. La file est vidée à l'arrêt (événement shutdown de l'API, ou fin
+du processus).
+
+Seul SMA.core.database.DatabaseManager crée un puits (attribut `analytics`),
+utilisé par CustomerServiceAgent.log_support_request et par
+CustomerProfilingAgent._update_user_profile de SMA/agents/profiling_agent.py.
+Aucun de ces chemins n'est emprunté par l'API de chat : l'orchestrateur
+enregistre le CustomerProfilingAgent de customer_profiling_agent.py, qui
+écrit dans PostgreSQL (db_connection), et aucun agent actif n'écrit dans
+MongoDB. Le vidage à l'arrêt ne fait donc rien tant qu'aucun
+DatabaseManager n'est créé.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+INSERT, UPDATE = "insert", "update"
+
+_STOP = object()
+
+class AnalyticsSink:
+    def __init__(self, database, batch_size: int = 500, flush_interval: float = 1.0, max_buffer: int = 10000):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_buffer)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="analytics-sink", daemon=True)
+        self._thread.start()
+        with _sinks_lock:
+            _sinks.append(self)
+
+    def _enqueue(self, operation: Tuple) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(operation)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f"File analytique pleine, {self.dropped} écritures abandonnées")
+            return False
+
+    def insert(self, collection: str, document: Dict[str, Any]) -> bool:
+        """Dépose un document à insérer ; False s'il est abandonné (file pleine)"""
+        return self._enqueue((INSERT, collection, document))
+
+    def update(self, collection: str, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> bool:
+        """Dépose une mise à jour (équivalent différé de update_one)"""
+        return self._enqueue((UPDATE, collection, (filter, update, upsert)))
+
+    def _run(self):
+        batch: List[Tuple] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                operation = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                operation = None
+            if operation is _STOP:
+                # Vider ce qui reste avant de s'arrêter
+                while True:
+                    try:
+                        pending = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pending is not _STOP:
+                        batch.append(pending)
+                self._write(batch)
+                return
+            if operation is not None:
+                batch.append(operation)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch: List[Tuple]):
+        if not batch:
+            return
+        inserts: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        updates: Dict[str, List[Tuple]] = defaultdict(list)
+        for kind, collection, payload in batch:
+            (inserts if kind == INSERT else updates)[collection].append(payload)
+
+        for collection, documents in inserts.items():
+            try:
+                self.database[collection].insert_many(documents, ordered=False)
+                self.written += len(documents)
+            except Exception as e:
+                self.failed += len(documents)
+                logger.error(f"Insertion analytique {collection} ({len(documents)} documents) impossible: {e}")
+
+        if updates:
+            from pymongo import UpdateOne
+        for collection, operations in updates.items():
+            try:
+                self.database[collection].bulk_write(
+                    [UpdateOne(filter, update, upsert=upsert) for filter, update, upsert in operations]
+                )
+                self.written += len(operations)
+            except Exception as e:
+                self.failed += len(operations)
+                logger.error(f"Mise à jour analytique {collection} ({len(operations)} opérations) impossible: {e}")
+
+    def close(self, timeout: float = 10.0):
+        """Écrit les opérations en attente puis arrête le thread"""
+        if self._closed:
+            return
+        self._closed = True
+        # Le marqueur d'arrêt passe même si la file est pleine : le thread la vide
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Arrêt de la file analytique incomplet ({self._queue.qsize()} opérations en attente)")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+_sinks: List[AnalyticsSink] = []
+_sinks_lock = threading.Lock()
+
+def create_analytics_sink(database) -> AnalyticsSink:
+    """File d'écriture analytique vers la base MongoDB `database`"""
+    return AnalyticsSink(
+        database,
+        batch_size=settings.ANALYTICS_BATCH_SIZE,
+        flush_interval=settings.ANALYTICS_FLUSH_INTERVAL,
+        max_buffer=settings.ANALYTICS_MAX_BUFFER
+    )
+
+def close_analytics_sinks(timeout: float = 10.0):
+    """Vide et arrête toutes les files analytiques du processus"""
+    with _sinks_lock:
+        sinks = list(_sinks)
+        _sinks.clear()
+    for sink in sinks:
+        sink.close(timeout)
+
+atexit.register(close_analytics_sinks)
@@ -77,6 +77,16 @@ def get_current_active_user(current_user: User = Depends(get_current_user)) -> U
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+def is_admin(user: User) -> bool:
+    """Administrateur : email listé dans ADMIN_EMAILS"""
+    return bool(user.email) and user.email.lower() in settings.ADMIN_EMAILS
+
+def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    """Obtenir l'utilisateur actuel s'il est administrateur"""
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Droits administrateur requis")
+    return current_user
+
 def create_user(email: str, username: str, password: str) -> User:
     """Créer un nouvel utilisateur"""
     db = SessionLocal()
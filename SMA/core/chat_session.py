@@ -1,14 +1,36 @@
 import uuid
-from typing import Dict, List, Optional
-import json
-from datetime import datetime, timedelta
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from datetime import datetime
+
+from sqlalchemy import func
+
+from .config import settings
+from .database import DatabaseManager, Conversation, ConversationMessage, ConversationArchive
+from .session_store import MESSAGES, SessionStore, get_session_store
+from ..models.message_models import AgentMessage, MessageType
+from ..models.context_models import UserContext
+
+def _serialize_message(msg: AgentMessage) -> Dict[str, Any]:
+    return {
+        "type": msg.type,
+        "content": msg.content,
+        "sender": msg.sender,
+        "timestamp": msg.timestamp.isoformat(),
+        "metadata": msg.metadata.dict() if msg.metadata else None
+    }
 
 class ChatSession:
-    def __init__(self, session_id: str, user_id: str, db_manager: DatabaseManager):
+    def __init__(self, session_id: str, user_id: str, db_manager: DatabaseManager,
+                 session_store: Optional[SessionStore] = None):
         self.session_id = session_id
         self.user_id = user_id
         self.db_manager = db_manager
-        self.messages: List[AgentMessage] = []
+        self.session_store = session_store or get_session_store()
+        # Fenêtre récente bornée : l'historique complet est en base
+        self.messages: Deque[AgentMessage] = deque(maxlen=settings.SESSION_HISTORY_WINDOW)
+        self._conversation_id: Optional[str] = None
+        self._message_count = 0
         self.context = UserContext(
             user_id=user_id,
             session_id=session_id,
@@ -23,20 +45,27 @@ class ChatSession:
     def add_message(self, message: AgentMessage):
         """Ajoute un message à la session"""
         self.messages.append(message)
-        self.context.conversation_history.append(message)
+        history = self.context.conversation_history
+        history.append(message)
+        if len(history) > settings.SESSION_HISTORY_WINDOW:
+            del history[:-settings.SESSION_HISTORY_WINDOW]
         self.last_activity = datetime.now()
         
-        # Sauvegarder dans la base de données
-        self._save_to_db()
+        # Persister uniquement le nouveau message (ajout seul)
+        self._append_to_db(message)
+        
+        # Mise en cache dans le store partagé (Redis en multi-workers)
+        self._cache_message(message)
         
-        # Mise en cache Redis
-        self._cache_session()
+        # Compaction périodique des longues conversations
+        interval = settings.CONVERSATION_COMPACTION_INTERVAL
+        if interval > 0 and self._message_count % interval == 0:
+            self.compact()
     
-    def _save_to_db(self):
-        """Sauvegarde la session dans PostgreSQL"""
-        with self.db_manager.get_session() as session:
+    def _ensure_conversation(self, session) -> str:
+        """Récupère ou crée la conversation (une seule fois par session)"""
+        if self._conversation_id is None:
             conversation = session.query(Conversation).filter_by(session_id=self.session_id).first()
-            
             if not conversation:
                 conversation = Conversation(
                     id=str(uuid.uuid4()),
@@ -48,55 +77,92 @@ class ChatSession:
                     escalated=self.context.escalated
                 )
                 session.add(conversation)
-            
-            # Convertir les messages en format sérialisable
-            messages_data = [
-                {
-                    "type": msg.type,
-                    "content": msg.content,
-                    "sender": msg.sender,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "metadata": msg.metadata
-                }
-                for msg in self.messages
-            ]
-            
-            conversation.messages = messages_data
-            conversation.intent = self.context.current_intent
-            conversation.sentiment_score = self.context.sentiment_score
-            conversation.escalated = self.context.escalated
-            conversation.updated_at = datetime.now()
-            
+                session.flush()
+            self._conversation_id = conversation.id
+            self._message_count = self._count_messages(session, conversation.id)
+        return self._conversation_id
+    
+    @staticmethod
+    def _count_messages(session, conversation_id: str) -> int:
+        """Messages déjà persistés (lignes + blocs archivés), compté une fois par session"""
+        rows = session.query(func.count(ConversationMessage.id)).filter_by(conversation_id=conversation_id).scalar()
+        archived = session.query(func.coalesce(func.sum(ConversationArchive.message_count), 0)).filter_by(
+            conversation_id=conversation_id
+        ).scalar()
+        return (rows or 0) + (archived or 0)
+    
+    def _append_to_db(self, message: AgentMessage):
+        """Insère une ligne de message et met à jour le contexte de la conversation"""
+        with self.db_manager.get_session() as session:
+            conversation_id = self._ensure_conversation(session)
+            data = _serialize_message(message)
+            session.add(ConversationMessage(
+                id=str(uuid.uuid4()),
+                conversation_id=conversation_id,
+                type=data["type"],
+                content=data["content"],
+                sender=data["sender"],
+                timestamp=message.timestamp,
+                meta_data=data["metadata"]
+            ))
+            session.query(Conversation).filter_by(id=conversation_id).update({
+                Conversation.intent: self.context.current_intent,
+                Conversation.sentiment_score: self.context.sentiment_score,
+                Conversation.escalated: self.context.escalated,
+                Conversation.updated_at: datetime.now()
+            }, synchronize_session=False)
             session.commit()
+        self._message_count += 1
     
-    def _cache_session(self):
-        """Met en cache la session dans Redis"""
-        session_data = {
-            "session_id": self.session_id,
-            "user_id": self.user_id,
-            "messages": [
-                {
-                    "type": msg.type,
-                    "content": msg.content,
-                    "sender": msg.sender,
-                    "timestamp": msg.timestamp.isoformat(),
-                    "metadata": msg.metadata
-                }
-                for msg in self.messages[-10:]  # Garder les 10 derniers messages
-            ],
-            "context": {
-                "current_intent": self.context.current_intent,
-                "sentiment_score": self.context.sentiment_score,
-                "escalated": self.context.escalated
-            },
-            "last_activity": self.last_activity.isoformat()
-        }
-        
-        # Expiration après 1 heure d'inactivité
-        self.db_manager.redis_client.setex(
-            f"session:{self.session_id}",
-            timedelta(hours=1),
-            json.dumps(session_data)
+    def compact(self, keep_recent: Optional[int] = None):
+        """
+        Regroupe les messages anciens en un bloc d'archive et supprime leurs lignes.
+        Les `keep_recent` derniers messages restent en lignes individuelles.
+        """
+        keep_recent = settings.SESSION_HISTORY_WINDOW if keep_recent is None else keep_recent
+        with self.db_manager.get_session() as session:
+            conversation_id = self._ensure_conversation(session)
+            query = session.query(ConversationMessage).filter_by(conversation_id=conversation_id)
+            old_rows = (
+                query.order_by(ConversationMessage.timestamp.desc())
+                .offset(keep_recent)
+                .all()
+            )
+            if not old_rows:
+                return
+            old_rows.reverse()
+            session.add(ConversationArchive(
+                id=str(uuid.uuid4()),
+                conversation_id=conversation_id,
+                first_timestamp=old_rows[0].timestamp,
+                last_timestamp=old_rows[-1].timestamp,
+                message_count=len(old_rows),
+                messages=[
+                    {
+                        "type": row.type,
+                        "content": row.content,
+                        "sender": row.sender,
+                        "timestamp": row.timestamp.isoformat(),
+                        "metadata": row.meta_data
+                    }
+                    for row in old_rows
+                ]
+            ))
+            session.query(ConversationMessage).filter(
+                ConversationMessage.id.in_([row.id for row in old_rows])
+            ).delete(synchronize_session=False)
+            session.commit()
+    
+    def _cache_message(self, message: AgentMessage):
+        """Ajoute le message à la fenêtre partagée (bornée et expirée par TTL)"""
+        self.session_store.append(self.session_id, _serialize_message(message), stream=MESSAGES)
+        self.session_store.set_meta(
+            self.session_id,
+            user_id=self.user_id,
+            current_intent=self.context.current_intent,
+            sentiment_score=self.context.sentiment_score,
+            escalated=self.context.escalated,
+            last_activity=self.last_activity.isoformat()
         )
     
     def is_expired(self, timeout_minutes: int = 30) -> bool:
@@ -104,15 +170,22 @@ class ChatSession:
         return (datetime.now() - self.last_activity).total_seconds() > (timeout_minutes * 60)
 
 class SessionManager:
-    def __init__(self, db_manager: DatabaseManager, config: Any):
+    def __init__(self, db_manager: DatabaseManager, config: Any, session_store: Optional[SessionStore] = None):
         self.db_manager = db_manager
         self.config = config
+        self.session_store = session_store or get_session_store()
+        # Cache local au worker ; la source de vérité partagée est le session_store
         self.active_sessions: Dict[str, ChatSession] = {}
     
     def create_session(self, user_id: str) -> ChatSession:
         """Crée une nouvelle session de chat"""
         session_id = str(uuid.uuid4())
-        session = ChatSession(session_id, user_id, self.db_manager)
+        session = ChatSession(session_id, user_id, self.db_manager, self.session_store)
+        self.session_store.set_meta(
+            session_id,
+            user_id=user_id,
+            last_activity=session.last_activity.isoformat()
+        )
         self.active_sessions[session_id] = session
         return session
     
@@ -127,19 +200,19 @@ class SessionManager:
                 # Supprimer la session expirée
                 del self.active_sessions[session_id]
         
-        # Vérifier dans Redis
-        cached_data = self.db_manager.redis_client.get(f"session:{session_id}")
-        if cached_data:
-            return self._restore_session_from_cache(session_id, json.loads(cached_data))
+        # Vérifier dans le store partagé (session créée par un autre worker)
+        meta = self.session_store.get_meta(session_id)
+        if meta:
+            return self._restore_session_from_cache(session_id, meta)
         
         return None
     
-    def _restore_session_from_cache(self, session_id: str, data: Dict) -> ChatSession:
-        """Restaure une session depuis le cache Redis"""
-        session = ChatSession(session_id, data["user_id"], self.db_manager)
+    def _restore_session_from_cache(self, session_id: str, meta: Dict) -> ChatSession:
+        """Restaure une session depuis le store partagé"""
+        session = ChatSession(session_id, meta.get("user_id"), self.db_manager, self.session_store)
         
-        # Restaurer les messages
-        for msg_data in data["messages"]:
+        # Restaurer la fenêtre de messages
+        for msg_data in self.session_store.get_history(session_id, stream=MESSAGES):
             message = AgentMessage(
                 type=MessageType(msg_data["type"]),
                 content=msg_data["content"],
@@ -151,12 +224,12 @@ class SessionManager:
             session.context.conversation_history.append(message)
         
         # Restaurer le contexte
-        context_data = data["context"]
-        session.context.current_intent = context_data["current_intent"]
-        session.context.sentiment_score = context_data["sentiment_score"]
-        session.context.escalated = context_data["escalated"]
+        session.context.current_intent = meta.get("current_intent")
+        session.context.sentiment_score = meta.get("sentiment_score", 0.0)
+        session.context.escalated = meta.get("escalated", False)
         
-        session.last_activity = datetime.fromisoformat(data["last_activity"])
+        if meta.get("last_activity"):
+            session.last_activity = datetime.fromisoformat(meta["last_activity"])
         
         # Remettre en mémoire
         self.active_sessions[session_id] = session
@@ -172,6 +245,6 @@ class SessionManager:
         
         for session_id in expired_sessions:
             del self.active_sessions[session_id]
-            # Supprimer aussi du cache Redis
-            self.db_manager.redis_client.delete(f"session:{session_id}")
+            # Supprimer aussi du store partagé
+            self.session_store.delete(session_id)
 
@@ -0,0 +1,115 @@
+"""
+Fenêtre de contexte conversationnel pour les prompts LLM
+
+Garde, par session, les derniers tours mot pour mot dans un budget de tokens
+et résume les tours plus anciens de façon incrémentale. Le résumé est mis en
+cache dans les métadonnées du store de session et n'est recalculé que lorsque
+la fenêtre glisse (de nouveaux tours sortent de la partie verbatim).
+"""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from .config import settings
+from .session_store import SessionStore, get_session_store
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """Estimation rapide (~4 caractères par token) sans tokenizer"""
+    return max(1, len(text) // 4) if text else 0
+
+class ConversationContextManager:
+    """Construit un contexte borné (résumé + tours récents) pour une session"""
+
+    SUMMARY_KEY = "context_summary"
+    SUMMARY_UPTO_KEY = "context_summary_upto"
+
+    def __init__(
+        self,
+        session_store: Optional[SessionStore] = None,
+        token_budget: Optional[int] = None,
+        summary_budget: Optional[int] = None,
+        max_turn_chars: int = 600
+    ):
+        self.session_store = session_store or get_session_store()
+        self.token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+        self.summary_budget = summary_budget or settings.CONTEXT_SUMMARY_TOKENS
+        self.max_turn_chars = max_turn_chars
+
+    def build(self, session_id: str) -> Dict[str, Any]:
+        """
+        Retourne {"summary", "turns", "prompt", "tokens"} pour la session.
+        `prompt` est le texte prêt à injecter dans un prompt LLM.
+        """
+        history = self.session_store.get_history(session_id)
+        verbatim_budget = max(0, self.token_budget - self.summary_budget)
+
+        # Parcourir du plus récent au plus ancien jusqu'à épuisement du budget
+        recent: List[Dict[str, Any]] = []
+        used = 0
+        for turn in reversed(history):
+            cost = estimate_tokens(self._render_turn(turn))
+            if used + cost > verbatim_budget:
+                break
+            recent.append(turn)
+            used += cost
+        recent.reverse()
+
+        older = history[:len(history) - len(recent)]
+        summary = self._update_summary(session_id, older) if older else self._cached_summary(session_id)
+        prompt = self.render(summary, recent)
+        return {
+            "summary": summary,
+            "turns": recent,
+            "prompt": prompt,
+            "tokens": estimate_tokens(prompt)
+        }
+
+    def render(self, summary: str, turns: List[Dict[str, Any]]) -> str:
+        parts = []
+        if summary:
+            parts.append(f"Résumé des échanges précédents:\n{summary}")
+        if turns:
+            parts.append("Derniers échanges:\n" + "\n".join(self._render_turn(turn) for turn in turns))
+        return "\n\n".join(parts)
+
+    def _render_turn(self, turn: Dict[str, Any]) -> str:
+        message = (turn.get("message") or "")[:self.max_turn_chars]
+        response = (turn.get("response") or "")[:self.max_turn_chars]
+        return f"Client: {message}\nAssistant: {response}"
+
+    def _cached_summary(self, session_id: str) -> str:
+        return self.session_store.get_meta(session_id).get(self.SUMMARY_KEY, "")
+
+    def _update_summary(self, session_id: str, older: List[Dict[str, Any]]) -> str:
+        """Intègre au résumé les tours sortis de la fenêtre depuis le dernier calcul"""
+        meta = self.session_store.get_meta(session_id)
+        summary = meta.get(self.SUMMARY_KEY, "")
+        upto = meta.get(self.SUMMARY_UPTO_KEY, "")
+
+        new_turns = [turn for turn in older if (turn.get("timestamp") or "") > upto]
+        if not new_turns:
+            return summary
+
+        summary = self._fold(summary, new_turns)
+        try:
+            self.session_store.set_meta(
+                session_id,
+                **{self.SUMMARY_KEY: summary, self.SUMMARY_UPTO_KEY: new_turns[-1].get("timestamp", "")}
+            )
+        except Exception as e:
+            logger.warning(f"Résumé de contexte non mis en cache: {e}")
+        return summary
+
+    def _fold(self, summary: str, turns: List[Dict[str, Any]]) -> str:
+        """Résumé extractif : une ligne par tour, les plus anciennes lignes sont abandonnées"""
+        lines = summary.splitlines() if summary else []
+        for turn in turns:
+            message = " ".join((turn.get("message") or "").split())[:120]
+            intent = turn.get("intent") or "inconnu"
+            lines.append(f"- {message} [{intent}]")
+
+        while lines and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        return "\n".join(lines)
@@ -8,6 +8,8 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 import json
 
+from .analytics_sink import create_analytics_sink
+
 Base = declarative_base()
 
 class User(Base):
@@ -49,6 +51,30 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class ConversationMessage(Base):
+    """Un message par ligne : persistance en ajout seul"""
+    __tablename__ = "conversation_messages"
+    
+    id = Column(String, primary_key=True)
+    conversation_id = Column(String, index=True)
+    type = Column(String)
+    content = Column(Text)
+    sender = Column(String)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    meta_data = Column(JSON)
+
+class ConversationArchive(Base):
+    """Bloc de messages anciens regroupés lors de la compaction"""
+    __tablename__ = "conversation_archives"
+    
+    id = Column(String, primary_key=True)
+    conversation_id = Column(String, index=True)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    message_count = Column(Integer)
+    messages = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Order(Base):
     __tablename__ = "orders"
     
@@ -83,6 +109,8 @@ class DatabaseManager:
         # MongoDB pour analytics
         self.mongo_client = MongoClient(config.database.mongo_url)
         self.mongo_db = self.mongo_client[config.database.mongo_db]
+        # Écritures analytiques en différé, par lots (hors du chemin des réponses)
+        self.analytics = create_analytics_sink(self.mongo_db)
         
         # Créer les tables
         Base.metadata.create_all(bind=self.engine)
@@ -92,4 +120,5 @@ class DatabaseManager:
     
     def close_connections(self):
         self.redis_client.close()
+        self.analytics.close()
         self.mongo_client.close()
\ No newline at end of file
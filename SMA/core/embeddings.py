@@ -0,0 +1,32 @@
+"""
+Encodeur de phrases partagé
+
+all-MiniLM-L6-v2 (384 dimensions, compatible avec les collections Qdrant) est
+chargé une seule fois par processus et partagé par la recherche produits et le
+classifieur d'intention.
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+_encoder = None
+_encoder_failed = False
+_encoder_lock = threading.Lock()
+
+def get_sentence_encoder():
+    """Retourne le SentenceTransformer du processus, ou None s'il est indisponible"""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        with _encoder_lock:
+            if _encoder is None and not _encoder_failed:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _encoder = SentenceTransformer(EMBEDDING_MODEL)
+                except Exception as e:
+                    logger.warning(f"Encodeur {EMBEDDING_MODEL} indisponible: {e}")
+                    _encoder_failed = True
+    return _encoder
@@ -0,0 +1,279 @@
+"""
+Index de recherche de la FAQ / base de connaissances
+
+Chaque entrée (question, réponse, mots-clés) est indexée deux fois :
+- embedding MiniLM normalisé, une ligne d'une matrice gardée en mémoire :
+  la similarité cosinus avec toutes les entrées est un seul produit
+  matrice-vecteur ;
+- index inversé BM25 sur les termes normalisés (sans accents) de la
+  question, des mots-clés et de la réponse.
+Le score final combine les deux (FAQ_SEMANTIC_WEIGHT pour le cosinus, le
+reste pour BM25 ramené entre 0 et 1). BM25 est rapporté à la somme des IDF
+des termes de la question, soit le score d'une entrée de longueur moyenne
+qui les contient tous : un seul mot commun sur cinq ne donne qu'un
+cinquième du score lexical. Sans encodeur, seul BM25 est utilisé.
+
+Les entrées sont synchronisées par source ("local", "kb") avec une signature
+de leur contenu : seules les entrées nouvelles ou modifiées sont ré-encodées,
+les entrées disparues sont retirées. La table KnowledgeBase est relue au plus
+toutes les FAQ_REFRESH_SECONDS secondes ; un écrivain de la base peut forcer
+la relecture avec notify_faq_change().
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .config import settings
+from .embeddings import get_sentence_encoder
+from .intent_engine import normalize
+
+logger = logging.getLogger(__name__)
+
+# Paramètres BM25 usuels
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Mots trop fréquents pour discriminer deux entrées de FAQ
+STOP_WORDS = frozenset(
+    "a au aux avec ce ces dans de des du en est et il je la le les leur ma mais me mes mon ne "
+    "nos notre nous on ou par pas pour qu que qui sa se ses son sont sur ta te tes ton tu un une "
+    "vos votre vous y".split()
+)
+
+class FAQEntry(NamedTuple):
+    id: str
+    category: str
+    question: str
+    answer: str
+    keywords: Tuple[str, ...] = ()
+
+    def signature(self) -> str:
+        content = "\x1f".join((self.category, self.question, self.answer, *self.keywords))
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in normalize(text).split() if len(token) > 1 and token not in STOP_WORDS]
+
+def _document_terms(entry: FAQEntry) -> Counter:
+    # La question et les mots-clés comptent double face au texte de la réponse
+    terms = Counter(tokenize(" ".join((entry.question, *entry.keywords))) * 2)
+    terms.update(tokenize(entry.answer))
+    return terms
+
+class FAQIndex:
+    def __init__(self, encoder=None, semantic_weight: float = 0.6, min_score: float = 0.3):
+        self.encoder = encoder
+        self.semantic_weight = semantic_weight if encoder is not None else 0.0
+        self.min_score = min_score
+        # Lignes de l'index : l'entrée, ses termes et sa ligne dans la matrice ont le même rang
+        self._ids: List[str] = []
+        self._entries: List[FAQEntry] = []
+        self._terms: List[Counter] = []
+        self._lengths: List[int] = []
+        self._signatures: Dict[str, str] = {}
+        self._rows: Dict[str, int] = {}
+        self._sources: Dict[str, set] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._total_length = 0
+        self._matrix = None
+        self._lock = threading.RLock()
+        self._encode = lru_cache(maxsize=512)(self._encode_text)
+        self.refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _encode_text(self, text: str):
+        import numpy as np
+        vector = np.asarray(self.encoder.encode(text), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _index_terms(self, row: int, terms: Counter):
+        for term, count in terms.items():
+            self._postings.setdefault(term, {})[row] = count
+        self._lengths[row] = sum(terms.values())
+        self._total_length += self._lengths[row]
+
+    def _unindex_terms(self, row: int, terms: Counter):
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(row, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths[row]
+
+    def _remove_row(self, entry_id: str):
+        """Retire une entrée ; la dernière ligne prend sa place (matrice compacte)"""
+        row = self._rows.pop(entry_id)
+        last = len(self._ids) - 1
+        self._unindex_terms(row, self._terms[row])
+        if row != last:
+            moved_terms = self._terms[last]
+            self._unindex_terms(last, moved_terms)
+            self._ids[row], self._entries[row], self._terms[row] = self._ids[last], self._entries[last], moved_terms
+            self._rows[self._ids[row]] = row
+            self._index_terms(row, moved_terms)
+            if self._matrix is not None:
+                self._matrix[row] = self._matrix[last]
+        self._ids.pop()
+        self._entries.pop()
+        self._terms.pop()
+        self._lengths.pop()
+        if self._matrix is not None:
+            self._matrix = self._matrix[:last]
+        del self._signatures[entry_id]
+
+    def sync(self, source: str, entries: Iterable[FAQEntry]) -> Dict[str, int]:
+        """
+        Aligne les entrées de `source` sur `entries` : ajoute, met à jour ou
+        retire ; seules les entrées modifiées sont ré-encodées.
+        """
+        entries = {entry.id: entry for entry in entries}
+        with self._lock:
+            previous = self._sources.get(source, set())
+            changed = [e for e in entries.values() if self._signatures.get(e.id) != e.signature()]
+        # Encodage hors verrou : c'est l'étape coûteuse
+        vectors = {}
+        if self.encoder is not None and changed:
+            import numpy as np
+            encoded = self.encoder.encode([f"{e.question}. {e.answer}" for e in changed])
+            encoded = np.asarray(encoded, dtype=np.float32)
+            encoded /= np.maximum(np.linalg.norm(encoded, axis=1, keepdims=True), 1e-12)
+            vectors = {entry.id: vector for entry, vector in zip(changed, encoded)}
+
+        with self._lock:
+            removed = [entry_id for entry_id in previous if entry_id not in entries]
+            for entry_id in removed:
+                if entry_id in self._rows:
+                    self._remove_row(entry_id)
+            added = []
+            for entry in changed:
+                terms = _document_terms(entry)
+                row = self._rows.get(entry.id)
+                if row is None:
+                    added.append(entry)
+                    row = len(self._ids)
+                    self._rows[entry.id] = row
+                    self._ids.append(entry.id)
+                    self._entries.append(entry)
+                    self._terms.append(terms)
+                    self._lengths.append(0)
+                else:
+                    self._unindex_terms(row, self._terms[row])
+                    self._entries[row], self._terms[row] = entry, terms
+                    if self._matrix is not None and entry.id in vectors:
+                        self._matrix[row] = vectors[entry.id]
+                self._index_terms(row, terms)
+                self._signatures[entry.id] = entry.signature()
+            if vectors and added:
+                import numpy as np
+                new_rows = np.vstack([vectors[entry.id] for entry in added])
+                self._matrix = new_rows if self._matrix is None else np.vstack([self._matrix, new_rows])
+            self._sources[source] = set(entries)
+        return {"updated": len(changed) - len(added), "added": len(added), "removed": len(removed)}
+
+    def _bm25(self, tokens: List[str]):
+        """Scores BM25 de chaque entrée ramenés entre 0 et 1"""
+        import numpy as np
+        count = len(self._ids)
+        scores = np.zeros(count, dtype=np.float32)
+        average_length = self._total_length / count
+        # Score d'une entrée de longueur moyenne contenant une fois chaque terme :
+        # les termes absents de l'index comptent avec l'IDF maximal
+        ceiling = 0.0
+        for term in set(tokens):
+            postings = self._postings.get(term) or {}
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            ceiling += idf
+            for row, frequency in postings.items():
+                norm = frequency + BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[row] / average_length)
+                scores[row] += idf * frequency * (BM25_K1 + 1) / norm
+        if ceiling > 0:
+            scores = np.clip(scores / ceiling, 0.0, 1.0)
+        return scores
+
+    def search(self, question: str, k: int = 5, category: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Les `k` entrées les plus pertinentes au-dessus de min_score, meilleure d'abord"""
+        import numpy as np
+        if not len(self) or not question:
+            return []
+        query = self._encode(normalize(question)) if self.semantic_weight else None
+        with self._lock:
+            if not self._ids:
+                return []
+            lexical = self._bm25(tokenize(question))
+            scores = lexical * (1 - self.semantic_weight)
+            if query is not None and self._matrix is not None:
+                scores += np.clip(self._matrix @ query, 0.0, 1.0) * self.semantic_weight
+            if category is not None:
+                scores[[entry.category != category for entry in self._entries]] = 0.0
+            count = min(k, len(scores))
+            top = np.argpartition(-scores, count - 1)[:count]
+            ranked = sorted(top, key=lambda row: -scores[row])
+            return [
+                {
+                    "id": self._entries[row].id,
+                    "question": self._entries[row].question,
+                    "answer": self._entries[row].answer,
+                    "category": self._entries[row].category,
+                    "relevance_score": round(float(scores[row]), 3),
+                    "keywords": list(self._entries[row].keywords)
+                }
+                for row in ranked if scores[row] >= self.min_score
+            ]
+
+    def refresh_if_stale(self, load_entries: Callable[[], Iterable[FAQEntry]], source: str = "kb"):
+        """Relit une source si la dernière lecture date de plus de FAQ_REFRESH_SECONDS"""
+        if time.monotonic() - self.refreshed_at < settings.FAQ_REFRESH_SECONDS:
+            return
+        self.refreshed_at = time.monotonic()
+        try:
+            changes = self.sync(source, load_entries())
+            if any(changes.values()):
+                logger.info(f"Index FAQ ({source}) mis à jour: {changes}")
+        except Exception as e:
+            logger.warning(f"Relecture de la base de connaissances impossible: {e}")
+
+def knowledge_base_loader(session_factory: Callable) -> Callable[[], List[FAQEntry]]:
+    """Lecture des entrées de la table KnowledgeBase (colonnes utiles seulement)"""
+    def load() -> List[FAQEntry]:
+        from .database import KnowledgeBase
+        db = session_factory()
+        try:
+            rows = db.query(
+                KnowledgeBase.id, KnowledgeBase.category, KnowledgeBase.question,
+                KnowledgeBase.answer, KnowledgeBase.keywords
+            ).all()
+        finally:
+            db.close()
+        return [
+            FAQEntry(f"kb:{row.id}", row.category or "", row.question or "", row.answer or "",
+                     tuple(row.keywords or ()))
+            for row in rows
+        ]
+    return load
+
+_index: Optional[FAQIndex] = None
+_index_lock = threading.Lock()
+
+def get_faq_index() -> FAQIndex:
+    """Index FAQ du processus (recherche lexicale seule si l'encodeur est indisponible)"""
+    global _index
+    if _index is None:
+        encoder = get_sentence_encoder()
+        with _index_lock:
+            if _index is None:
+                _index = FAQIndex(encoder, settings.FAQ_SEMANTIC_WEIGHT, settings.FAQ_MIN_SCORE)
+    return _index
+
+def notify_faq_change():
+    """À appeler après une écriture de KnowledgeBase : relecture à la prochaine recherche"""
+    if _index is not None:
+        _index.refreshed_at = 0.0
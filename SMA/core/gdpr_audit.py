@@ -0,0 +1,153 @@
+"""
+Audit RGPD des données stockées, en flux
+
+Les messages utilisateurs sont parcourus par lots ordonnés par id (pagination
+par clé : `id > dernier id vu`), chaque lot dans sa propre transaction courte.
+Sur PostgreSQL la recherche des termes sensibles est faite par le serveur
+(`~*`) : seul un agrégat par lot remonte. Sur les autres bases, les lignes
+(id, contenu) sont lues en flux (yield_per) et testées avec une expression
+compilée. La mémoire reste bornée quelle que soit la taille de la table.
+
+Après chaque lot, le dernier id et les compteurs partiels sont enregistrés
+comme point de reprise de la tâche (voir gdpr_jobs).
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Termes signalant un message potentiellement sensible (recherche insensible à la casse)
+SENSITIVE_TERMS = ("email", "telephone", "adresse", "carte", "iban")
+SENSITIVE_PATTERN = "|".join(re.escape(term) for term in SENSITIVE_TERMS)
+_SENSITIVE_RE = re.compile(SENSITIVE_PATTERN, re.IGNORECASE)
+
+# Un seul agrégat par lot : nombre de lignes, lignes sensibles, dernier id
+_PG_BATCH_SQL = """
+    SELECT count(*), count(*) FILTER (WHERE content ~* :pattern), max(id)
+    FROM (
+        SELECT id, content FROM messages
+        WHERE sender_type = 'user' AND id > :after_id
+        ORDER BY id
+        LIMIT :batch_size
+    ) batch
+"""
+
+def scan_batch(db, after_id: int, batch_size: int) -> Tuple[int, int, Optional[int]]:
+    """Un lot de messages utilisateurs après `after_id` : (lus, sensibles, dernier id)"""
+    if db.bind.dialect.name == "postgresql":
+        scanned, sensitive, last_id = db.execute(
+            text(_PG_BATCH_SQL),
+            {"pattern": SENSITIVE_PATTERN, "after_id": after_id, "batch_size": batch_size}
+        ).one()
+        return scanned, sensitive, last_id
+
+    from ..models.database import Message
+    rows = (
+        db.query(Message.id, Message.content)
+        .filter(Message.sender_type == "user", Message.id > after_id)
+        .order_by(Message.id)
+        .limit(batch_size)
+        .yield_per(1000)
+    )
+    scanned = sensitive = 0
+    last_id = None
+    for message_id, content in rows:
+        scanned += 1
+        last_id = message_id
+        if content and _SENSITIVE_RE.search(content):
+            sensitive += 1
+    return scanned, sensitive, last_id
+
+def collect_statistics(db) -> Dict[str, int]:
+    """Compteurs globaux (requêtes COUNT, sans chargement de lignes)"""
+    from ..models.database import Conversation, Message, User
+    cutoff_date = datetime.utcnow() - timedelta(days=730)
+    inactive_cutoff = datetime.utcnow() - timedelta(days=365)
+    return {
+        "total_users": db.query(User).count(),
+        "active_users": db.query(User).filter(User.is_active == True).count(),
+        "total_conversations": db.query(Conversation).count(),
+        "total_messages": db.query(Message).count(),
+        "total_user_messages": db.query(Message).filter(Message.sender_type == "user").count(),
+        # Données anciennes (> 2 ans)
+        "old_conversations": db.query(Conversation).filter(Conversation.started_at < cutoff_date).count(),
+        # Utilisateurs inscrits depuis plus d'un an et toujours actifs
+        "potentially_inactive_users": db.query(User).filter(
+            User.created_at < inactive_cutoff,
+            User.is_active == True
+        ).count()
+    }
+
+def compliance_score(metrics: Dict[str, float]) -> float:
+    """Score de conformité RGPD à partir des ratios de données anciennes, sensibles et inactives"""
+    score = 100
+    # Pénaliser les données anciennes
+    score -= metrics["old_data_ratio"] * 30
+    # Pénaliser les données sensibles non filtrées
+    score -= metrics["sensitive_ratio"] * 40
+    # Pénaliser les utilisateurs inactifs
+    score -= metrics["inactive_ratio"] * 20
+    return max(0, min(100, round(score, 1)))
+
+def audit_report(statistics: Dict[str, int]) -> Dict[str, Any]:
+    """Rapport d'audit : statistiques, score et recommandations"""
+    recommendations: List[str] = []
+    if statistics["old_conversations"] > 0:
+        recommendations.append(f"Examiner {statistics['old_conversations']} conversations anciennes pour archivage/suppression")
+    if statistics["potentially_sensitive_messages"] > statistics["total_messages"] * 0.1:
+        recommendations.append("Taux élevé de messages potentiellement sensibles - réviser les filtres")
+    if statistics["potentially_inactive_users"] > 0:
+        recommendations.append(f"Contacter {statistics['potentially_inactive_users']} utilisateurs inactifs pour confirmation")
+
+    return {
+        "audit_timestamp": datetime.utcnow().isoformat(),
+        "statistics": statistics,
+        "compliance_score": compliance_score({
+            "old_data_ratio": statistics["old_conversations"] / max(1, statistics["total_conversations"]),
+            "sensitive_ratio": statistics["potentially_sensitive_messages"] / max(1, statistics["total_messages"]),
+            "inactive_ratio": statistics["potentially_inactive_users"] / max(1, statistics["total_users"])
+        }),
+        "recommendations": recommendations
+    }
+
+def run_audit(session_factory: Callable, report: Callable[[float, Dict[str, Any]], None],
+              checkpoint: Optional[Dict[str, Any]] = None, batch_size: int = 5000) -> Dict[str, Any]:
+    """Audit complet, repris depuis `checkpoint` s'il est fourni"""
+    state = dict(checkpoint or {})
+    db = session_factory()
+    try:
+        if "statistics" not in state:
+            state.update(statistics=collect_statistics(db), after_id=0, scanned=0, sensitive=0)
+            db.rollback()
+            report(0.0, state)
+        total = max(1, state["statistics"]["total_user_messages"])
+
+        while True:
+            scanned, sensitive, last_id = scan_batch(db, state["after_id"], batch_size)
+            # Fin de la transaction de lecture : pas de snapshot gardé pendant tout l'audit
+            db.rollback()
+            if not scanned:
+                break
+            state["after_id"] = last_id
+            state["scanned"] += scanned
+            state["sensitive"] += sensitive
+            report(state["scanned"] / total, state)
+    finally:
+        db.close()
+
+    statistics = {**state["statistics"], "potentially_sensitive_messages": state["sensitive"],
+                  "scanned_user_messages": state["scanned"]}
+    return audit_report(statistics)
+
+def run_audit_job(job, report: Callable[[float, Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Gestionnaire de la tâche "audit" (voir gdpr_jobs)"""
+    from ..models.database import SessionLocal
+    batch_size = int(job.params.get("batch_size") or settings.GDPR_AUDIT_BATCH_SIZE)
+    return run_audit(SessionLocal, report, job.checkpoint, batch_size)
@@ -0,0 +1,198 @@
+"""
+Tâches RGPD en arrière-plan
+
+Les traitements RGPD longs (audit des messages, effacement, export) ne
+tournent pas dans la requête HTTP : ils sont soumis comme tâches, exécutées
+dans un pool de threads (SQLAlchemy synchrone) et suivies par leur état.
+
+L'état de chaque tâche est un fichier JSON dans GDPR_JOBS_DIR, réécrit de
+façon atomique à chaque point de reprise : progression, compteurs et position
+du curseur. Une tâche interrompue (arrêt du processus, erreur) reprend à son
+dernier point de reprise avec `resume()` ou
+`python -m SMA.core.gdpr_jobs resume <job_id>`.
+
+Un gestionnaire de tâche reçoit la tâche et une fonction `report(progress,
+checkpoint)` ; il retourne le résultat final (dict sérialisable en JSON).
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, COMPLETED, FAILED = "pending", "running", "completed", "failed"
+
+@dataclass
+class GDPRJob:
+    kind: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = PENDING
+    # Fraction traitée, entre 0 et 1
+    progress: float = 0.0
+    # Position de reprise propre au gestionnaire (curseur, compteurs partiels)
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    updated_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+JobHandler = Callable[[GDPRJob, Callable[[float, Dict[str, Any]], None]], Dict[str, Any]]
+
+class JobStore:
+    """États des tâches, un fichier JSON par tâche"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        # Identifiants hexadécimaux uniquement : pas de chemin arbitraire
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def save(self, job: GDPRJob):
+        job.updated_at = datetime.utcnow().isoformat()
+        path = self._path(job.id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False, default=str)
+        os.replace(tmp, path)
+
+    def load(self, job_id: str) -> Optional[GDPRJob]:
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                return GDPRJob(**json.load(f))
+        except (KeyError, FileNotFoundError):
+            return None
+
+    def list(self, kind: Optional[str] = None) -> List[GDPRJob]:
+        jobs = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".json"):
+                job = self.load(name[:-5])
+                if job is not None and (kind is None or job.kind == kind):
+                    jobs.append(job)
+        return jobs
+
+class JobRunner:
+    def __init__(self, store: JobStore, max_workers: int = 1):
+        self.store = store
+        self.handlers: Dict[str, JobHandler] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gdpr-job")
+        # Tâches en cours dans ce processus (évite une double reprise)
+        self._active: set = set()
+        self._lock = threading.Lock()
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> GDPRJob:
+        if kind not in self.handlers:
+            raise ValueError(f"Type de tâche RGPD inconnu: {kind}")
+        job = GDPRJob(kind=kind, params=params or {})
+        self.store.save(job)
+        self._start(job)
+        return job
+
+    def resume(self, job_id: str) -> Optional[GDPRJob]:
+        """Relance une tâche interrompue depuis son dernier point de reprise"""
+        job = self.store.load(job_id)
+        if job is None or job.status == COMPLETED:
+            return job
+        with self._lock:
+            if job.id in self._active:
+                return job
+        job.status, job.error = PENDING, None
+        self.store.save(job)
+        self._start(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[GDPRJob]:
+        return self.store.load(job_id)
+
+    def _start(self, job: GDPRJob):
+        with self._lock:
+            self._active.add(job.id)
+        self._executor.submit(self._run, job)
+
+    def _run(self, job: GDPRJob):
+        handler = self.handlers[job.kind]
+
+        def report(progress: float, checkpoint: Dict[str, Any]):
+            job.progress = round(min(max(progress, 0.0), 1.0), 4)
+            job.checkpoint = checkpoint
+            self.store.save(job)
+
+        try:
+            job.status = RUNNING
+            self.store.save(job)
+            job.result = handler(job, report)
+            job.status, job.progress = COMPLETED, 1.0
+            logger.info(f"Tâche RGPD {job.kind} {job.id} terminée")
+        except Exception as e:
+            logger.error(f"Tâche RGPD {job.kind} {job.id} en échec: {e}")
+            job.status, job.error = FAILED, str(e)
+        finally:
+            self.store.save(job)
+            with self._lock:
+                self._active.discard(job.id)
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+def get_gdpr_jobs() -> JobRunner:
+    """Exécuteur de tâches RGPD du processus, avec les gestionnaires enregistrés"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                from .gdpr_audit import run_audit_job
+                from .gdpr_user_data import run_erasure_job, run_export_job
+                runner = JobRunner(JobStore(settings.GDPR_JOBS_DIR))
+                runner.register("audit", run_audit_job)
+                runner.register("erasure", run_erasure_job)
+                runner.register("export", run_export_job)
+                _runner = runner
+    return _runner
+
+def main(argv: List[str]) -> int:
+    """python -m SMA.core.gdpr_jobs (list | status <id> | resume <id> | run audit)"""
+    runner = get_gdpr_jobs()
+    command = argv[0] if argv else "list"
+    if command == "list":
+        for job in runner.store.list():
+            print(f"{job.id}  {job.kind:<8} {job.status:<10} {job.progress:.0%}  {job.updated_at}")
+        return 0
+    if command in ("status", "resume", "run") and len(argv) == 2:
+        if command == "status":
+            job = runner.get(argv[1])
+        else:
+            job = runner.resume(argv[1]) if command == "resume" else runner.submit(argv[1])
+            # Attendre la fin de la tâche en ligne de commande
+            runner._executor.shutdown(wait=True)
+            job = runner.get(job.id) if job else None
+        if job is None:
+            print(f"Tâche introuvable: {argv[1]}")
+            return 1
+        print(json.dumps(job.to_dict(), ensure_ascii=False, indent=2, default=str))
+        return 0 if job.status != FAILED else 1
+    print(main.__doc__)
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,240 @@
+"""
+Effacement et export des données d'un utilisateur (droits RGPD), par lots
+
+Effacement : les messages puis les conversations de l'utilisateur sont
+supprimés par lots de GDPR_DELETE_BATCH_SIZE lignes, une transaction courte
+par lot (aucun verrou long sur les tables). Les suppressions étant
+idempotentes, une tâche interrompue reprend simplement où elle s'était
+arrêtée. L'utilisateur est ensuite anonymisé (intégrité référentielle des
+commandes préservée).
+
+Export : les données sont écrites en NDJSON (une ligne JSON par
+enregistrement, champ "type") dans une archive ZIP sur disque, en lisant les
+messages par pagination sur la clé et les commandes en flux : la mémoire ne
+dépend pas du volume de l'utilisateur. Une archive incomplète ne peut pas
+être prolongée : un export interrompu recommence au début.
+"""
+
+import json
+import os
+import zipfile
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator
+
+from sqlalchemy import select
+
+from .config import settings
+
+EXPORT_MEMBER = "user_data.ndjson"
+
+Report = Callable[[float, Dict[str, Any]], None]
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+def _delete_in_batches(db, model, ids_query, batch_size: int, on_batch: Callable[[int], None]) -> int:
+    """Supprime les lignes de `ids_query` par lots ; une transaction par lot"""
+    deleted = 0
+    while True:
+        ids = [row[0] for row in ids_query.limit(batch_size).all()]
+        if not ids:
+            return deleted
+        count = db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        deleted += count
+        on_batch(count)
+
+def erase_user_data(session_factory: Callable, user_id: int, report: Report,
+                    checkpoint: Dict[str, Any] = None, batch_size: int = 1000) -> Dict[str, Any]:
+    """Droit à l'oubli : suppression par lots puis anonymisation du compte"""
+    from ..models.database import Conversation, Message, User
+    state = dict(checkpoint or {})
+    db = session_factory()
+    try:
+        conversation_ids = db.query(Conversation.id).filter(Conversation.user_id == user_id)
+        message_ids = db.query(Message.id).filter(
+            Message.conversation_id.in_(select(Conversation.id).where(Conversation.user_id == user_id))
+        )
+        if "total" not in state:
+            messages = message_ids.count()
+            conversations = conversation_ids.count()
+            db.rollback()
+            state.update(total=messages + conversations, messages_deleted=0, conversations_deleted=0)
+            report(0.0, state)
+        total = max(1, state["total"])
+
+        def progress(field_name: str):
+            def on_batch(count: int):
+                state[field_name] += count
+                report((state["messages_deleted"] + state["conversations_deleted"]) / total, state)
+            return on_batch
+
+        _delete_in_batches(db, Message, message_ids, batch_size, progress("messages_deleted"))
+        _delete_in_batches(db, Conversation, conversation_ids, batch_size, progress("conversations_deleted"))
+
+        # Anonymiser l'utilisateur plutôt que le supprimer (pour préserver l'intégrité référentielle)
+        user = db.query(User).filter(User.id == user_id).first()
+        if user:
+            user.email = f"deleted_user_{user_id}@anonymized.com"
+            user.username = f"deleted_user_{user_id}"
+            user.hashed_password = "DELETED"
+            user.is_active = False
+            user.preferences = {}
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    # Plus aucun instantané de profil ne doit survivre à l'effacement
+    try:
+        from .profile_store import get_profile_store
+        get_profile_store().invalidate(user_id)
+    except Exception:
+        pass
+
+    return {
+        "success": True,
+        "user_anonymized": user is not None,
+        "conversations_deleted": state["conversations_deleted"],
+        "messages_deleted": state["messages_deleted"],
+        "deletion_timestamp": datetime.utcnow().isoformat()
+    }
+
+def iter_user_records(db, user_id: int, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Enregistrements exportables de l'utilisateur, produits au fil de la lecture"""
+    from ..models.database import Conversation, Message, Order, OrderItem, Product, User
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        return
+    yield {
+        "type": "user",
+        "id": user.id,
+        "email": user.email,
+        "username": user.username,
+        "created_at": _isoformat(user.created_at),
+        "is_vip": user.is_vip,
+        "preferences": user.preferences
+    }
+
+    has_conversations = False
+    for conv in db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.id).yield_per(batch_size):
+        has_conversations = True
+        yield {
+            "type": "conversation",
+            "id": conv.id,
+            "session_id": conv.session_id,
+            "started_at": _isoformat(conv.started_at),
+            "ended_at": _isoformat(conv.ended_at),
+            "status": conv.status
+        }
+
+    # Messages par pagination sur la clé : jamais plus d'un lot en mémoire
+    after_id = 0
+    columns = (Message.id, Message.conversation_id, Message.sender_type, Message.content,
+               Message.intent, Message.timestamp, Message.agent_used)
+    while has_conversations:
+        rows = (
+            db.query(*columns)
+            .join(Conversation, Message.conversation_id == Conversation.id)
+            .filter(Conversation.user_id == user_id, Message.id > after_id)
+            .order_by(Message.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        for message_id, conversation_id, sender_type, content, intent, timestamp, agent_used in rows:
+            yield {
+                "type": "message",
+                "id": message_id,
+                "conversation_id": conversation_id,
+                "sender_type": sender_type,
+                "content": content,
+                "intent": intent,
+                "timestamp": _isoformat(timestamp),
+                "agent_used": agent_used
+            }
+        after_id = rows[-1][0]
+
+    # Commandes et lignes en une requête ordonnée : une commande est émise dès sa dernière ligne lue
+    order = None
+    lines = (
+        db.query(Order.id, Order.total_amount, Order.status, Order.created_at,
+                 Product.name, OrderItem.quantity, OrderItem.price)
+        .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .filter(Order.user_id == user_id)
+        .order_by(Order.id)
+        .yield_per(batch_size)
+    )
+    for order_id, total_amount, status, created_at, product_name, quantity, price in lines:
+        if order is None or order["id"] != order_id:
+            if order is not None:
+                yield order
+            order = {
+                "type": "order",
+                "id": order_id,
+                "total_amount": total_amount,
+                "status": status,
+                "created_at": _isoformat(created_at),
+                "items": []
+            }
+        if quantity is not None:
+            order["items"].append({"product_name": product_name, "quantity": quantity, "price": price})
+    if order is not None:
+        yield order
+
+def export_user_data(session_factory: Callable, user_id: int, path: str, report: Report,
+                     batch_size: int = 1000) -> Dict[str, Any]:
+    """Droit d'accès : archive ZIP contenant un fichier NDJSON, écrite en flux"""
+    from ..models.database import Conversation, Message
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = session_factory()
+    counts: Dict[str, int] = {}
+    try:
+        expected = 1 + db.query(Message.id).join(Conversation, Message.conversation_id == Conversation.id).filter(
+            Conversation.user_id == user_id
+        ).count()
+        tmp = f"{path}.part"
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            # Taille inconnue à l'avance : ZIP64 pour les très gros exports
+            with archive.open(EXPORT_MEMBER, "w", force_zip64=True) as member:
+                for written, record in enumerate(iter_user_records(db, user_id, batch_size), 1):
+                    member.write((json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+                    counts[record["type"]] = counts.get(record["type"], 0) + 1
+                    if written % batch_size == 0:
+                        report(min(0.99, written / expected), {"records": counts})
+        if not counts.get("user"):
+            os.remove(tmp)
+            raise LookupError("Utilisateur non trouvé")
+        os.replace(tmp, path)
+    finally:
+        db.close()
+
+    return {
+        "success": True,
+        "path": path,
+        "size_bytes": os.path.getsize(path),
+        "format": f"zip/{EXPORT_MEMBER}",
+        "total_conversations": counts.get("conversation", 0),
+        "total_messages": counts.get("message", 0),
+        "total_orders": counts.get("order", 0),
+        "export_timestamp": datetime.utcnow().isoformat()
+    }
+
+def export_path(job_id: str) -> str:
+    return os.path.join(settings.GDPR_JOBS_DIR, "exports", f"{job_id}.zip")
+
+def run_erasure_job(job, report: Report) -> Dict[str, Any]:
+    """Gestionnaire de la tâche "erasure" (voir gdpr_jobs)"""
+    from ..models.database import SessionLocal
+    return erase_user_data(SessionLocal, int(job.params["user_id"]), report, job.checkpoint,
+                           settings.GDPR_DELETE_BATCH_SIZE)
+
+def run_export_job(job, report: Report) -> Dict[str, Any]:
+    """Gestionnaire de la tâche "export" (voir gdpr_jobs)"""
+    from ..models.database import SessionLocal
+    return export_user_data(SessionLocal, int(job.params["user_id"]), export_path(job.id), report,
+                            settings.GDPR_EXPORT_BATCH_SIZE)
@@ -0,0 +1,376 @@
+"""
+Classifieur d'intention et d'escalade local
+
+Plus proche centroïde sur les embeddings MiniLM (normalisés) : une intention
+est représentée par la moyenne des messages qui la portent. Les similarités
+cosinus passent par un softmax dont la température est calibrée par
+validation croisée "leave-one-out" (centroïde recalculé sans l'exemple). La
+confiance retournée est donc une probabilité calibrée, et la probabilité
+d'escalade est la masse des intentions d'escalade.
+
+Entraînement : messages utilisateurs journalisés (Message.intent) complétés
+par quelques exemples de démarrage, pour les intentions que l'analyse par
+mots-clés ne produit jamais (plaintes, remboursements...).
+
+    python -m SMA.core.intent_classifier [limite_messages]
+
+Le script mesure en leave-one-out la précision aux seuils
+INTENT_CONFIDENCE_THRESHOLD et ESCALATION_CONFIDENCE_THRESHOLD (et la part des
+messages au-dessus du seuil). Seul un modèle entraîné sur des messages
+journalisés est utilisé à l'exécution : sans lui, les agents gardent l'analyse
+par mots-clés et le LLM.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import settings
+from .embeddings import get_sentence_encoder
+
+logger = logging.getLogger(__name__)
+
+# Intentions qui justifient un transfert vers un conseiller humain
+ESCALATION_INTENTS = frozenset({
+    "complaint", "refund_request", "technical_problem", "complex_return", "billing_issue", "escalation"
+})
+
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "greeting": ["Bonjour", "Salut !", "Hello", "Bonsoir, vous allez bien ?"],
+    "bot_role": ["Qui es-tu ?", "Quel est ton rôle ?", "À quoi sers-tu ?", "Présente-toi"],
+    "product_search": [
+        "Je cherche un smartphone", "Montre-moi des ordinateurs portables",
+        "Vous vendez des casques audio ?", "Je voudrais une tablette pour dessiner"
+    ],
+    "availability_check": [
+        "Est-ce que l'iPhone 15 est en stock ?", "Ce produit est-il disponible ?",
+        "Vous avez encore la taille M ?", "Quand sera-t-il de nouveau disponible ?"
+    ],
+    "price_check": [
+        "Combien coûte ce clavier ?", "Quel est le prix de la souris ?",
+        "C'est combien ?", "Le tarif de cet écran ?"
+    ],
+    "recommendation": [
+        "Que me conseillez-vous ?", "Une idée de cadeau pour mon frère ?",
+        "Recommande-moi un bon laptop", "Des suggestions pour moi ?"
+    ],
+    "cart_management": [
+        "Ajoute ce produit au panier", "Montre mon panier",
+        "Retire l'article 12 du panier", "Vide mon panier"
+    ],
+    "order_status": [
+        "Où en est ma commande ?", "Quand vais-je recevoir mon colis ?",
+        "Suivi de ma livraison", "Statut de la commande 1542"
+    ],
+    "customer_service": [
+        "J'ai besoin d'aide", "Comment changer mon mot de passe ?",
+        "Comment fonctionne la livraison ?", "Quels sont vos horaires ?"
+    ],
+    "complaint": [
+        "C'est inadmissible, je suis très mécontent", "Votre service est catastrophique",
+        "Je veux parler à un responsable", "Ça fait trois fois que je demande, c'est scandaleux"
+    ],
+    "refund_request": [
+        "Je veux être remboursé", "Remboursez-moi ma commande",
+        "Comment obtenir un remboursement ?", "J'exige le remboursement de l'article défectueux"
+    ],
+    "technical_problem": [
+        "Le paiement ne passe pas", "Le site plante quand je valide",
+        "Je n'arrive pas à me connecter à mon compte", "J'ai une erreur au moment de payer"
+    ],
+}
+
+class IntentPrediction(NamedTuple):
+    intent: str
+    # Probabilité calibrée de l'intention retenue
+    confidence: float
+    # Probabilité que le message justifie une escalade
+    escalation: float
+
+class IntentClassifier:
+    """Plus proche centroïde sur embeddings normalisés, softmax à température calibrée"""
+
+    def __init__(self, encoder, cache_size: int = 256):
+        self.encoder = encoder
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.temperature = 0.05
+        # Messages journalisés ayant servi à l'entraînement (0 : exemples de démarrage seuls)
+        self.logged_examples = 0
+        self._escalation_mask: Optional[np.ndarray] = None
+        # Le même message est souvent classé deux fois par tour (intention puis escalade)
+        self._cache: "OrderedDict[str, IntentPrediction]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.is_ready and self.logged_examples > 0
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        return np.asarray(
+            self.encoder.encode(list(texts), normalize_embeddings=True, convert_to_numpy=True),
+            dtype=np.float32
+        )
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], logged_examples: int = 0) -> "IntentClassifier":
+        self.logged_examples = logged_examples
+        embeddings = self._embed(texts)
+        classes = sorted(set(labels))
+        index = {label: i for i, label in enumerate(classes)}
+        y = np.array([index[label] for label in labels])
+
+        sums = np.zeros((len(classes), embeddings.shape[1]), dtype=np.float32)
+        np.add.at(sums, y, embeddings)
+        counts = np.bincount(y, minlength=len(classes)).astype(np.float32)
+
+        self._set_model(classes, self._normalize(sums / counts[:, None]))
+        self.temperature = self._calibrate(embeddings, y, sums, counts)
+        return self
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _set_model(self, labels: List[str], centroids: np.ndarray):
+        self.labels = list(labels)
+        self.centroids = centroids.astype(np.float32)
+        self._escalation_mask = np.array([label in ESCALATION_INTENTS for label in self.labels])
+        self._cache.clear()
+
+    def _loo_similarities(self, embeddings: np.ndarray, y: np.ndarray,
+                          sums: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Similarités aux centroïdes, celui de la classe de l'exemple recalculé sans lui"""
+        similarities = embeddings @ self.centroids.T
+        rows = np.arange(len(y))
+        usable = counts[y] > 1
+        own = (sums[y] - embeddings) / np.maximum(counts[y] - 1, 1)[:, None]
+        similarities[rows, y] = np.sum(embeddings * self._normalize(own), axis=1)
+        return similarities[usable], y[usable]
+
+    def _calibrate(self, embeddings: np.ndarray, y: np.ndarray,
+                   sums: np.ndarray, counts: np.ndarray) -> float:
+        """Température minimisant la log-vraisemblance négative leave-one-out"""
+        similarities, targets = self._loo_similarities(embeddings, y, sums, counts)
+        if len(targets) == 0:
+            return self.temperature
+        best, best_nll = self.temperature, float("inf")
+        for temperature in np.geomspace(0.005, 0.5, 40):
+            probabilities = self._softmax(similarities / temperature)
+            nll = -np.mean(np.log(probabilities[np.arange(len(targets)), targets] + 1e-12))
+            if nll < best_nll:
+                best, best_nll = float(temperature), nll
+        return best
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict(self, text: str) -> IntentPrediction:
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+
+        probabilities = self._softmax((self._embed([text])[0] @ self.centroids.T) / self.temperature)
+        best = int(np.argmax(probabilities))
+        prediction = IntentPrediction(
+            self.labels[best],
+            float(probabilities[best]),
+            float(probabilities[self._escalation_mask].sum())
+        )
+
+        with self._lock:
+            self._cache[text] = prediction
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return prediction
+
+    def evaluate(self, texts: Sequence[str], labels: Sequence[str],
+                 intent_threshold: float = 0.6, escalation_threshold: float = 0.8) -> Dict[str, float]:
+        """
+        Mesures leave-one-out : exactitude et confiance moyenne (écart = défaut
+        de calibration), puis précision et couverture des décisions prises
+        au-dessus des seuils (intention retenue, escalade oui/non).
+        """
+        embeddings = self._embed(texts)
+        index = {label: i for i, label in enumerate(self.labels)}
+        y = np.array([index[label] for label in labels])
+        sums = np.zeros_like(self.centroids)
+        np.add.at(sums, y, embeddings)
+        counts = np.bincount(y, minlength=len(self.labels)).astype(np.float32)
+        similarities, targets = self._loo_similarities(embeddings, y, sums, counts)
+        probabilities = self._softmax(similarities / self.temperature)
+        predicted = probabilities.argmax(axis=1)
+        confident = probabilities.max(axis=1) >= intent_threshold
+
+        escalation = probabilities[:, self._escalation_mask].sum(axis=1)
+        should_escalate = self._escalation_mask[targets]
+        decided = np.maximum(escalation, 1 - escalation) >= escalation_threshold
+        return {
+            "examples": float(len(targets)),
+            "accuracy": float(np.mean(predicted == targets)),
+            "mean_confidence": float(np.mean(probabilities.max(axis=1))),
+            "intent_coverage": float(np.mean(confident)),
+            "intent_precision": float(np.mean(predicted[confident] == targets[confident])) if confident.any() else 0.0,
+            "escalation_coverage": float(np.mean(decided)),
+            "escalation_precision": float(
+                np.mean((escalation[decided] >= 0.5) == should_escalate[decided])
+            ) if decided.any() else 0.0
+        }
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, labels=np.array(self.labels), centroids=self.centroids,
+                     temperature=np.array(self.temperature), logged_examples=np.array(self.logged_examples))
+
+    def load(self, path: str) -> "IntentClassifier":
+        with np.load(path, allow_pickle=False) as data:
+            self._set_model([str(label) for label in data["labels"]], data["centroids"])
+            self.temperature = float(data["temperature"])
+            self.logged_examples = int(data["logged_examples"]) if "logged_examples" in data else 0
+        return self
+
+def seed_dataset() -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    for intent, examples in SEED_EXAMPLES.items():
+        texts.extend(examples)
+        labels.extend([intent] * len(examples))
+    return texts, labels
+
+def load_training_messages(limit: int = 50000, min_examples: int = 3) -> Tuple[List[str], List[str]]:
+    """Messages utilisateurs étiquetés (Message.intent), dédoublonnés"""
+    from ..models.database import SessionLocal, Message
+
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(Message.content, Message.intent)
+            .filter(
+                Message.sender_type == "user",
+                Message.intent.isnot(None),
+                Message.intent.notin_(["", "unknown"])
+            )
+            .order_by(Message.id.desc())
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+
+    pairs = {(content.strip(), intent) for content, intent in rows if content and content.strip()}
+    counts: Dict[str, int] = {}
+    for _, intent in pairs:
+        counts[intent] = counts.get(intent, 0) + 1
+    kept = [(content, intent) for content, intent in pairs if counts[intent] >= min_examples]
+    return [content for content, _ in kept], [intent for _, intent in kept]
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_failed = False
+_classifier_lock = threading.Lock()
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """
+    Classifieur du processus, s'il existe un modèle entraîné sur des messages
+    journalisés (INTENT_MODEL_PATH) ; sinon None. Les exemples de démarrage
+    seuls sont trop peu nombreux pour que la confiance calibrée soit fiable.
+    """
+    global _classifier, _classifier_failed
+    if _classifier is None and not _classifier_failed:
+        with _classifier_lock:
+            if _classifier is None and not _classifier_failed:
+                if not os.path.exists(settings.INTENT_MODEL_PATH):
+                    logger.info("Pas de modèle d'intention entraîné : analyse par mots-clés et LLM")
+                    _classifier_failed = True
+                    return None
+                encoder = get_sentence_encoder()
+                if encoder is None:
+                    _classifier_failed = True
+                    return None
+                try:
+                    classifier = IntentClassifier(encoder).load(settings.INTENT_MODEL_PATH)
+                    if classifier.is_trained:
+                        _classifier = classifier
+                    else:
+                        logger.warning(f"Modèle d'intention sans messages journalisés ignoré: {settings.INTENT_MODEL_PATH}")
+                        _classifier_failed = True
+                except Exception as e:
+                    logger.warning(f"Classifieur d'intention indisponible: {e}")
+                    _classifier_failed = True
+    return _classifier
+
+async def predict_intent(text: str) -> Optional[IntentPrediction]:
+    """Prédiction hors de la boucle d'événements ; None si le classifieur est indisponible"""
+    if not text or not text.strip() or _classifier_failed:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        classifier = await loop.run_in_executor(None, get_intent_classifier)
+        if classifier is None:
+            return None
+        return await loop.run_in_executor(None, classifier.predict, text)
+    except Exception as e:
+        logger.error(f"Erreur classification d'intention: {e}")
+        return None
+
+def main(limit: int = 50000) -> int:
+    encoder = get_sentence_encoder()
+    if encoder is None:
+        print("❌ Encodeur de phrases indisponible")
+        return 1
+
+    texts, labels = seed_dataset()
+    logged_texts: List[str] = []
+    try:
+        logged_texts, logged_labels = load_training_messages(limit)
+        texts += logged_texts
+        labels += logged_labels
+        print(f"🔍 {len(logged_texts)} messages journalisés + {len(SEED_EXAMPLES)} intentions de démarrage")
+    except Exception as e:
+        print(f"⚠️ Messages journalisés indisponibles ({e}), exemples de démarrage seuls")
+
+    classifier = IntentClassifier(encoder).fit(texts, labels, logged_examples=len(logged_texts))
+    intent_threshold = settings.INTENT_CONFIDENCE_THRESHOLD
+    escalation_threshold = settings.ESCALATION_CONFIDENCE_THRESHOLD
+    metrics = classifier.evaluate(texts, labels, intent_threshold, escalation_threshold)
+    print(f"✅ {len(classifier.labels)} intentions, température {classifier.temperature:.3f}")
+    print(f"Leave-one-out: exactitude {metrics['accuracy']:.2%}, confiance moyenne {metrics['mean_confidence']:.2%}")
+    print(f"Intention, seuil {intent_threshold}: précision {metrics['intent_precision']:.2%} "
+          f"sur {metrics['intent_coverage']:.2%} des messages")
+    print(f"Escalade, seuil {escalation_threshold}: précision {metrics['escalation_precision']:.2%} "
+          f"sur {metrics['escalation_coverage']:.2%} des messages")
+
+    start = time.perf_counter()
+    for text in texts[:200]:
+        classifier._cache.clear()
+        classifier.predict(text)
+    elapsed = (time.perf_counter() - start) / min(len(texts), 200)
+    print(f"Latence de prédiction: {elapsed * 1000:.1f}ms par message")
+
+    if not classifier.is_trained:
+        print("❌ Sans messages journalisés, le modèle n'est pas enregistré (il serait ignoré à l'exécution)")
+        return 1
+    classifier.save(settings.INTENT_MODEL_PATH)
+    print(f"Modèle enregistré dans {settings.INTENT_MODEL_PATH}")
+    return 0
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000))
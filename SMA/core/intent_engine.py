@@ -0,0 +1,238 @@
+"""
+Moteur d'intention partagé
+
+Les mots-clés d'intention, d'action panier et de user stories sont compilés une
+seule fois en un automate (trie de mots). Une seule passe sur les mots du texte
+normalisé (minuscules, sans accents, ponctuation réduite à des espaces) donne
+l'intention, l'action panier et les user stories ; à chaque position, le
+mot-clé le plus long l'emporte.
+
+Règles de correspondance :
+- un mot-clé correspond à un mot entier, pluriel en s/x accepté ("commandes") ;
+- un mot-clé terminé par "*" est un radical ("recommand*" -> "recommandation").
+
+Comme les liens de sortie d'un automate d'Aho-Corasick, un mot-clé hérite des étiquettes des
+mots-clés qu'il contient ("vider le panier" porte aussi celles de "panier") :
+la correspondance la plus longue ne masque donc aucune étiquette.
+"""
+
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Intentions par ordre de priorité (la première trouvée l'emporte)
+INTENT_KEYWORDS: List[Tuple[str, List[str]]] = [
+    ("bot_role", [
+        "rôle", "role", "mission", "qui es-tu", "ta fonction", "ta mission", "à quoi sers-tu",
+        "présente-toi", "about you", "your role", "who are you"
+    ]),
+    ("greeting", ["bonjour", "salut", "hello", "hi", "hey"]),
+    ("cart_management", [
+        "panier", "cart", "basket", "voir mon panier", "mon panier", "afficher panier",
+        "ajouter au panier", "ajouter", "ajoute", "mets", "mettre dans le panier", "add to cart",
+        "supprimer du panier", "retirer", "enlever du panier", "remove from cart",
+        "modifier quantité", "changer quantité", "quantité",
+        "vider le panier", "vider panier", "clear cart",
+        "أضف", "ضع", "سلة", "عربة"
+    ]),
+    ("order_status", [
+        "commande", "order", "statut", "status", "suivi", "livraison", "delivery", "tracking",
+        "طلب", "حالة", "توصيل", "تتبع"
+    ]),
+    ("recommendation", ["recommand*", "suggestion", "cadeau", "gift"]),
+    ("customer_service", [
+        "aid*", "help", "problème", "souci", "support", "assistance", "assist",
+        "مساعدة", "دعم"
+    ]),
+    ("product_search", [
+        "liste", "produits", "catalogue",
+        "cherche", "recherche", "trouve", "montre", "affiche", "search", "find", "show", "display",
+        "ابحث", "اعثر", "أظهر", "عرض"
+    ]),
+    ("availability_check", ["avez", "disponible", "stock", "avoir", "est ce que"]),
+    ("price_check", ["prix", "coût", "tarif", "combien"]),
+    ("product_search", [
+        "iphone", "samsung", "laptop", "ordinateur", "smartphone", "tablette", "écran", "clavier", "souris"
+    ]),
+]
+
+# Actions panier par ordre de priorité ; "view" par défaut
+CART_ACTION_KEYWORDS: List[Tuple[str, List[str]]] = [
+    ("clear", ["vider le panier", "vider panier", "empty cart", "clear cart"]),
+    ("remove", ["retirer", "supprimer du panier", "enlever du panier", "remove from cart", "supprimer"]),
+    ("update", ["modifier quantité", "changer quantité", "mettre", "quantité", "update quantity", "modifier"]),
+    ("add", ["ajouter au panier", "ajouter", "ajoute", "mets", "add to cart", "mettre dans le panier"]),
+    ("view", ["voir mon panier", "mon panier", "panier", "cart", "voir panier", "afficher panier"]),
+]
+
+USER_STORY_KEYWORDS: Dict[str, List[str]] = {
+    "recherche": ["US2", "US3"],
+    "produit": ["US1", "US2", "US4"],
+    "panier": ["US6", "US7", "US8"],
+    "commande": ["US9", "US11", "US12"],
+    "livraison": ["US13", "US14"],
+    "retour": ["US15"],
+    "retourner": [],  # Retour ou recherche selon le contexte : voir _return_stories
+    "remboursement": ["US15"],
+    "échanger": ["US15"],
+    "récupérer": ["US15"],
+    "aide": ["US17", "US18"],
+    "recommandation": ["US1", "US22"],
+    "promotion": ["US5", "US20"],
+    "paiement": ["US10", "US23"],
+    "sécurité": ["US23", "US24"],
+    "voix": ["US30"],
+    "image": ["US31"],
+    "vidéo": ["US32"],
+    "social": ["US36", "US37"],
+    "durabilité": ["US42", "US43", "US44"],
+    "accessibilité": ["US33", "US34", "US35"]
+}
+
+_SEPARATORS = re.compile(r"[\s\-'’_.,;:!?()\"]+")
+# Diacritiques latins et arabes (harakat) après décomposition NFKD
+_COMBINING = re.compile("[\u0300-\u036f\u064b-\u065f\u0670]")
+
+def normalize(text: str) -> str:
+    """Minuscules, sans accents, séparateurs réduits à un espace"""
+    text = text.lower()
+    if not text.isascii():
+        text = _COMBINING.sub("", unicodedata.normalize("NFKD", text))
+    return _SEPARATORS.sub(" ", text).strip()
+
+class IntentMatch(NamedTuple):
+    # None si aucun mot-clé d'intention : chaque appelant applique son défaut
+    intent: Optional[str]
+    cart_action: str
+    user_stories: Tuple[str, ...]
+    # Mots-clés reconnus (normalisés), dans l'ordre du texte
+    keywords: Tuple[str, ...]
+
+class _Labels:
+    __slots__ = ("intents", "actions", "stories")
+
+    def __init__(self):
+        self.intents: Set[Tuple[int, str]] = set()
+        self.actions: Set[Tuple[int, str]] = set()
+        self.stories: Set[str] = set()
+
+    def merge(self, other: "_Labels"):
+        self.intents |= other.intents
+        self.actions |= other.actions
+        self.stories |= other.stories
+
+class _Node:
+    __slots__ = ("children", "stems", "stem_prefixes", "keyword")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Radicaux : (préfixe, nœud), testés par startswith
+        self.stems: List[Tuple[str, "_Node"]] = []
+        self.stem_prefixes: Tuple[str, ...] = ()
+        # Mot-clé (normalisé) se terminant sur ce nœud
+        self.keyword: Optional[str] = None
+
+    def step(self, word: str) -> List["_Node"]:
+        child = self.children.get(word)
+        if child is None and word[-1:] in ("s", "x"):
+            child = self.children.get(word[:-1])
+        nodes = [child] if child is not None else []
+        if self.stem_prefixes and word.startswith(self.stem_prefixes):
+            nodes.extend(node for stem, node in self.stems if word.startswith(stem))
+        return nodes
+
+class IntentEngine:
+    """Automate de mots-clés compilé une fois ; analyze() fait une seule passe sur le texte"""
+
+    def __init__(self, intent_keywords=INTENT_KEYWORDS, cart_action_keywords=CART_ACTION_KEYWORDS,
+                 user_story_keywords=USER_STORY_KEYWORDS):
+        self._root = _Node()
+        self._labels: Dict[str, _Labels] = {}
+
+        for priority, (intent, keywords) in enumerate(intent_keywords):
+            for keyword in keywords:
+                self._add(keyword).intents.add((priority, intent))
+        for priority, (action, keywords) in enumerate(cart_action_keywords):
+            for keyword in keywords:
+                self._add(keyword).actions.add((priority, action))
+        for keyword, stories in user_story_keywords.items():
+            self._add(keyword).stories.update(stories)
+
+        # Fermeture : chaque mot-clé hérite des étiquettes des mots-clés qu'il contient
+        own = {keyword: _Labels() for keyword in self._labels}
+        for keyword, label in own.items():
+            label.merge(self._labels[keyword])
+        for keyword, label in self._labels.items():
+            words = keyword.rstrip("*").split()
+            for start in range(len(words)):
+                for _, inner in self._matches(words, start):
+                    label.merge(own[inner])
+
+    def _add(self, keyword: str) -> _Labels:
+        stem = keyword.endswith("*")
+        words = normalize(keyword.rstrip("*")).split()
+        key = " ".join(words) + ("*" if stem else "")
+        node = self._root
+        for position, word in enumerate(words):
+            if stem and position == len(words) - 1:
+                match = next((n for s, n in node.stems if s == word), None)
+                if match is None:
+                    match = _Node()
+                    node.stems.append((word, match))
+                    node.stem_prefixes += (word,)
+                node = match
+            else:
+                node = node.children.setdefault(word, _Node())
+        node.keyword = key
+        return self._labels.setdefault(key, _Labels())
+
+    def _matches(self, words: List[str], start: int, frontier: Optional[List[_Node]] = None) -> List[Tuple[int, str]]:
+        """Mots-clés commençant à `start` : [(position de fin, mot-clé)]"""
+        found = []
+        position = start
+        if frontier is None:
+            frontier = [self._root]
+        else:
+            # Premier mot déjà consommé par l'appelant
+            position += 1
+            found.extend((position, node.keyword) for node in frontier if node.keyword)
+        while frontier and position < len(words):
+            frontier = [child for node in frontier for child in node.step(words[position])]
+            position += 1
+            found.extend((position, node.keyword) for node in frontier if node.keyword)
+        return found
+
+    def analyze(self, text: str) -> IntentMatch:
+        words = normalize(text or "").split()
+        found = _Labels()
+        keywords = []
+        position = 0
+        while position < len(words):
+            first = self._root.step(words[position])
+            matches = self._matches(words, position, first) if first else None
+            if not matches:
+                position += 1
+                continue
+            end, keyword = max(matches)
+            keywords.append(keyword.rstrip("*"))
+            found.merge(self._labels[keyword])
+            position = end
+
+        intent = min(found.intents)[1] if found.intents else None
+        cart_action = min(found.actions)[1] if found.actions else "view"
+        stories = found.stories
+        if "retourner" in keywords:
+            stories = self._return_stories(stories, words)
+        return IntentMatch(intent, cart_action, tuple(sorted(stories)), tuple(keywords))
+
+    @staticmethod
+    def _return_stories(stories: Set[str], words: List[str]) -> Set[str]:
+        # "retourner un produit" -> retour (US15) ; "retourner tous les produits" -> recherche (US2)
+        if "produit" in words and len(words) <= 4:
+            return stories | {"US15"}
+        if "produits" in words or "tous" in words:
+            return stories | {"US2"}
+        return stories | {"US15"}
+
+# Construit une fois au chargement du module et partagé par tous les agents
+intent_engine = IntentEngine()
@@ -0,0 +1,374 @@
+"""
+Passerelle LLM partagée
+
+Tous les agents passent par une seule instance (un seul GenerativeModel) qui
+applique, pour le processus :
+- un sémaphore de concurrence et des seaux à jetons (requêtes et tokens par
+  minute) calés sur le quota Gemini ;
+- la fusion des requêtes identiques en cours (single-flight) : un prompt déjà
+  en vol n'est envoyé qu'une fois, les appelants suivants attendent sa réponse ;
+- une échéance par appel, qui couvre attente, appel et nouvelles tentatives ;
+- des nouvelles tentatives espacées avec gigue, limitées par un budget global
+  (une fraction des appels) pour ne pas amplifier une surcharge ;
+- des métriques de latence et de tokens par agent ;
+- un mode streaming (stream()) soumis aux mêmes limites, qui mesure le délai
+  du premier fragment.
+
+Sous la charge, un appel qui ne peut pas être servi avant son échéance lève
+LLMUnavailable : l'agent répond alors en mode dégradé au lieu d'empiler des 429.
+"""
+
+import asyncio
+import hashlib
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+import google.generativeai as genai
+
+from .config import settings
+from .context_window import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+genai.configure(api_key=settings.GEMINI_API_KEY)
+
+class LLMUnavailable(Exception):
+    """Appel LLM impossible avant l'échéance (quota, surcharge, erreurs répétées)"""
+
+class TokenBucket:
+    """Seau à jetons thread-safe ; rate_per_second <= 0 désactive la limite"""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """Réserve `amount` jetons ; retourne l'attente nécessaire (secondes)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Une demande plus grosse que le seau ne doit pas bloquer indéfiniment
+            amount = min(amount, self.capacity)
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def _refund(self, amount: float):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+    async def acquire(self, amount: float, deadline: float):
+        if self.rate <= 0:
+            return
+        wait = self._reserve(amount)
+        if wait and time.monotonic() + wait > deadline:
+            self._refund(amount)
+            raise LLMUnavailable("limite de débit atteinte")
+        if wait:
+            await asyncio.sleep(wait)
+
+class RetryBudget:
+    """Chaque appel crédite `ratio` nouvelle tentative, plus un minimum par seconde"""
+
+    def __init__(self, ratio: float, min_per_second: float = 1.0, capacity: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = capacity
+        self._balance = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._balance = min(self.capacity, self._balance + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill()
+            self._balance = min(self.capacity, self._balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self._balance >= 1:
+                self._balance -= 1
+                return True
+            return False
+
+class AgentMetrics:
+    """Compteurs et latences récentes d'un agent"""
+
+    def __init__(self, window: int = 500):
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.errors = 0
+        self.rejected = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies_ms: Deque[float] = deque(maxlen=window)
+        # Délai du premier fragment des appels en streaming
+        self.first_token_ms: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies_ms)
+        first_tokens = sorted(self.first_token_ms)
+
+        def percentile(q: float, values=latencies) -> float:
+            return round(values[min(len(values) - 1, int(q * len(values)))], 1) if values else 0.0
+
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "latency_max_ms": round(latencies[-1], 1) if latencies else 0.0,
+            "first_token_p50_ms": percentile(0.5, first_tokens),
+            "first_token_p95_ms": percentile(0.95, first_tokens)
+        }
+
+_RETRYABLE_MARKERS = ("429", "quota", "resource exhausted", "resourceexhausted", "503", "unavailable",
+                      "500", "internal", "deadline", "timeout")
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in _RETRYABLE_MARKERS)
+
+def _chunk_text(chunk) -> str:
+    # Un fragment sans texte (filtrage, métadonnées seules) lève ValueError sur .text
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+class _LoopState:
+    """Primitives asyncio liées à une boucle d'événements"""
+
+    def __init__(self, max_concurrency: int):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+class LLMGateway:
+    def __init__(self, model_name: str, max_concurrency: int, requests_per_minute: float,
+                 tokens_per_minute: float, deadline_seconds: float, max_retries: int,
+                 retry_budget_ratio: float, retry_base_delay: float = 0.5):
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self.max_concurrency = max_concurrency
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        # Rafale autorisée : dix secondes de quota (les quotas Gemini sont par minute)
+        self.request_bucket = TokenBucket(requests_per_minute / 60, requests_per_minute / 6)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 6)
+        self.retry_budget = RetryBudget(retry_budget_ratio)
+        self._metrics: Dict[str, AgentMetrics] = {}
+        self._metrics_lock = threading.Lock()
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _LoopState]" = weakref.WeakKeyDictionary()
+
+    def _loop_state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None:
+            state = self._loops[loop] = _LoopState(self.max_concurrency)
+        return state
+
+    def _agent_metrics(self, agent: str) -> AgentMetrics:
+        with self._metrics_lock:
+            metrics = self._metrics.get(agent)
+            if metrics is None:
+                metrics = self._metrics[agent] = AgentMetrics()
+            return metrics
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        with self._metrics_lock:
+            return {agent: metrics.snapshot() for agent, metrics in self._metrics.items()}
+
+    async def generate(self, prompt: str, agent: str = "default", deadline: Optional[float] = None) -> str:
+        """Texte généré pour `prompt` ; lève LLMUnavailable si l'échéance ne peut être tenue"""
+        metrics = self._agent_metrics(agent)
+        metrics.calls += 1
+        start = time.monotonic()
+        state = self._loop_state()
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+        pending = state.inflight.get(key)
+        if pending is not None:
+            # Même prompt déjà en vol : partager sa réponse
+            metrics.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            finally:
+                metrics.latencies_ms.append((time.monotonic() - start) * 1000)
+
+        future = asyncio.get_running_loop().create_future()
+        state.inflight[key] = future
+        try:
+            text = await self._call(prompt, metrics, state, start + (deadline or self.deadline_seconds))
+            future.set_result(text)
+            return text
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else LLMUnavailable("appel annulé"))
+            # Éviter "exception never retrieved" quand personne n'attendait
+            future.exception()
+            raise
+        finally:
+            state.inflight.pop(key, None)
+            metrics.latencies_ms.append((time.monotonic() - start) * 1000)
+
+    async def _admit(self, prompt_tokens: int, state: _LoopState, deadline: float):
+        """Seaux à jetons puis sémaphore ; l'appelant libère le sémaphore"""
+        await self.request_bucket.acquire(1, deadline)
+        await self.token_bucket.acquire(prompt_tokens, deadline)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMUnavailable("échéance dépassée avant l'appel")
+        try:
+            await asyncio.wait_for(state.semaphore.acquire(), remaining)
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("trop d'appels LLM concurrents")
+
+    def _retry_delay(self, error: Exception, attempt: int, metrics: AgentMetrics, deadline: float) -> float:
+        """Délai avant la prochaine tentative ; lève si l'erreur ne justifie pas de réessayer"""
+        retryable = _is_retryable(error)
+        if not retryable or attempt >= self.max_retries or not self.retry_budget.try_withdraw():
+            metrics.errors += 1
+            if retryable:
+                raise LLMUnavailable(str(error) or type(error).__name__) from error
+            raise error
+        # Backoff exponentiel avec gigue complète
+        delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            metrics.errors += 1
+            raise LLMUnavailable(str(error) or type(error).__name__) from error
+        metrics.retries += 1
+        logger.warning(f"Appel LLM en échec ({error}), nouvelle tentative {attempt + 1} dans {delay:.2f}s")
+        return delay
+
+    async def _call(self, prompt: str, metrics: AgentMetrics, state: _LoopState, deadline: float) -> str:
+        self.retry_budget.deposit()
+        prompt_tokens = estimate_tokens(prompt)
+        attempt = 0
+        while True:
+            try:
+                await self._admit(prompt_tokens, state, deadline)
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(prompt), deadline - time.monotonic()
+                    )
+                finally:
+                    state.semaphore.release()
+                self._record_usage(metrics, response, prompt_tokens)
+                return response.text
+            except LLMUnavailable:
+                metrics.rejected += 1
+                raise
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, metrics, deadline)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def stream(self, prompt: str, agent: str = "default", deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """
+        Fragments du texte généré pour `prompt`, au fil de l'eau (mode stream du SDK).
+        L'échéance couvre l'attente et le premier fragment ; ensuite, chaque fragment
+        doit arriver dans LLM_DEADLINE_SECONDS. Les nouvelles tentatives ne sont
+        possibles qu'avant le premier fragment.
+        """
+        metrics = self._agent_metrics(agent)
+        metrics.calls += 1
+        start = time.monotonic()
+        state = self._loop_state()
+        deadline = start + (deadline or self.deadline_seconds)
+        self.retry_budget.deposit()
+        prompt_tokens = estimate_tokens(prompt)
+        attempt = 0
+        started = False
+        try:
+            while True:
+                try:
+                    await self._admit(prompt_tokens, state, deadline)
+                    try:
+                        response = await asyncio.wait_for(
+                            self.model.generate_content_async(prompt, stream=True), deadline - time.monotonic()
+                        )
+                        chunks = response.__aiter__()
+                        while True:
+                            timeout = self.deadline_seconds if started else deadline - time.monotonic()
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+                            except StopAsyncIteration:
+                                break
+                            text = _chunk_text(chunk)
+                            if not text:
+                                continue
+                            if not started:
+                                started = True
+                                metrics.first_token_ms.append((time.monotonic() - start) * 1000)
+                            yield text
+                    finally:
+                        state.semaphore.release()
+                    self._record_usage(metrics, response, prompt_tokens)
+                    return
+                except LLMUnavailable:
+                    metrics.rejected += 1
+                    raise
+                except Exception as e:
+                    if started:
+                        # Texte déjà transmis : une nouvelle tentative le dupliquerait
+                        metrics.errors += 1
+                        raise LLMUnavailable(str(e) or type(e).__name__) from e
+                    delay = self._retry_delay(e, attempt, metrics, deadline)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+        finally:
+            metrics.latencies_ms.append((time.monotonic() - start) * 1000)
+
+    @staticmethod
+    def _record_usage(metrics: AgentMetrics, response, prompt_tokens: int):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "prompt_token_count", None):
+            metrics.prompt_tokens += usage.prompt_token_count
+            metrics.completion_tokens += getattr(usage, "candidates_token_count", 0) or 0
+        else:
+            metrics.prompt_tokens += prompt_tokens
+            try:
+                metrics.completion_tokens += estimate_tokens(response.text)
+            except Exception:
+                pass
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """Passerelle LLM du processus"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    model_name=settings.LLM_MODEL,
+                    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+                    requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+                    tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE,
+                    deadline_seconds=settings.LLM_DEADLINE_SECONDS,
+                    max_retries=settings.LLM_MAX_RETRIES,
+                    retry_budget_ratio=settings.LLM_RETRY_BUDGET_RATIO
+                )
+    return _gateway
@@ -2,11 +2,12 @@
 Application principale FastAPI pour le SMA
 """
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
+import asyncio
 import json
 import logging
 import base64
@@ -15,6 +16,15 @@ from datetime import datetime
 # Import des modules du SMA
 from .orchestrator import chatbot_orchestrator
 from .voice_endpoints import voice_router  # Nouveau import
+from .session_store import get_session_store
+from .config import settings
+from .llm_gateway import get_llm_gateway
+from .response_cache import get_response_cache
+from .response_stream import format_sse
+from .metrics import get_metrics_recorder
+from .gdpr_jobs import COMPLETED, get_gdpr_jobs
+from .analytics_sink import close_analytics_sinks
+from .auth import get_current_active_user, get_current_admin_user, is_admin
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -30,8 +40,9 @@ app = FastAPI(
 # Configuration CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # En production, spécifier les domaines autorisés
-    allow_credentials=True,
+    allow_origins=settings.CORS_ORIGINS,  # En production, spécifier les domaines autorisés (CORS_ORIGINS)
+    # Jamais de requêtes avec cookies depuis n'importe quelle origine
+    allow_credentials="*" not in settings.CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -59,8 +70,13 @@ class ChatResponse(BaseModel):
 
 # Gestionnaire de connexions WebSocket
 class ConnectionManager:
+    """
+    Les WebSockets restent locaux au worker ; les messages destinés à une
+    session détenue par un autre worker passent par le pub/sub du store.
+    """
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        self.session_store = get_session_store()
     
     async def connect(self, websocket: WebSocket, session_id: str):
         await websocket.accept()
@@ -74,14 +90,64 @@ class ConnectionManager:
     
     async def send_message(self, session_id: str, message: Dict[str, Any]):
         if session_id in self.active_connections:
+            await self.deliver_local(session_id, message)
+        else:
+            # Le WebSocket appartient peut-être à un autre worker
             try:
-                await self.active_connections[session_id].send_text(json.dumps(message))
+                await self.session_store.publish(session_id, message)
             except Exception as e:
-                logger.error(f"Erreur envoi message WebSocket: {e}")
-                self.disconnect(session_id)
+                logger.error(f"Erreur publication message WebSocket: {e}")
+    
+    async def deliver_local(self, session_id: str, message: Dict[str, Any]):
+        """Envoie sur le WebSocket local s'il existe (callback du pub/sub)"""
+        websocket = self.active_connections.get(session_id)
+        if websocket is None:
+            return
+        try:
+            await websocket.send_text(json.dumps(message))
+        except Exception as e:
+            logger.error(f"Erreur envoi message WebSocket: {e}")
+            self.disconnect(session_id)
 
 manager = ConnectionManager()
 
+@app.on_event("startup")
+async def start_session_fanout():
+    await manager.session_store.start_listener(manager.deliver_local)
+
+@app.on_event("startup")
+async def warm_up_agents():
+    # Les agents sont construits à la demande ; le préchauffage évite ce coût sur la première requête
+    if settings.AGENT_WARMUP:
+        chatbot_orchestrator.agents.warm_up()
+
+@app.on_event("startup")
+async def start_profile_refresher():
+    # Profils clients recalculés après chaque nouvelle commande
+    if settings.PROFILE_ORDER_POLL_SECONDS <= 0:
+        return
+    try:
+        agent = await chatbot_orchestrator.agents.aget("profiling_agent")
+    except Exception as e:
+        logger.error(f"Recalcul des profils après commande indisponible: {e}")
+        return
+    app.state.profile_refresher = asyncio.create_task(agent.run_order_refresher())
+
+@app.on_event("shutdown")
+async def stop_profile_refresher():
+    refresher = getattr(app.state, "profile_refresher", None)
+    if refresher is not None:
+        refresher.cancel()
+
+@app.on_event("shutdown")
+async def stop_session_fanout():
+    await manager.session_store.stop_listener()
+
+@app.on_event("shutdown")
+async def flush_analytics():
+    # Écrire les journaux analytiques encore en file avant l'arrêt
+    await asyncio.get_running_loop().run_in_executor(None, close_analytics_sinks)
+
 # Endpoints REST
 @app.get("/")
 async def root():
@@ -98,7 +164,8 @@ async def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "agents": list(chatbot_orchestrator.agents.keys())
+        "agents": list(chatbot_orchestrator.agents.keys()),
+        "agents_loaded": chatbot_orchestrator.agents.loaded()
     }
 
 @app.post("/chat", response_model=ChatResponse)
@@ -135,6 +202,28 @@ async def chat_endpoint(request: ChatMessage):
         logger.error(f"Erreur dans chat_endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatMessage):
+    """
+    Chat en Server-Sent Events : progression des nœuds ("node"), produits dès la
+    recherche ("products"), fragments du texte ("delta"), puis "response" avec le
+    même contenu que /chat. Messages texte uniquement (audio : /chat ou /ws).
+    """
+    if request.audio_data:
+        raise HTTPException(status_code=400, detail="Audio non supporté en streaming, utiliser /chat")
+    
+    async def events():
+        async for event in chatbot_orchestrator.stream_message(
+            message=request.message,
+            session_id=request.session_id,
+            user_id=request.user_id
+        ):
+            yield format_sse(event)
+    
+    # X-Accel-Buffering : empêcher nginx de retenir les événements
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Endpoint WebSocket
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str, user_id: Optional[int] = None):
@@ -204,11 +293,17 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str, user_id: Opt
                     })
                     continue
             
-            # Traiter le message texte normal
+            # Traiter le message texte normal : la réponse arrive en fragments "delta"
+            # pendant la génération, puis la trame "response" apporte le texte complet,
+            # les produits et le panier
+            async def forward_event(event: Dict[str, Any]):
+                await manager.send_message(session_id, {**event, "timestamp": datetime.utcnow().isoformat()})
+            
             result = await chatbot_orchestrator.process_message(
                 message=user_message,
                 session_id=session_id,
-                user_id=user_id
+                user_id=user_id,
+                on_event=forward_event
             )
             
             if result.get("success"):
@@ -246,8 +341,9 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str, user_id: Opt
 async def get_agents():
     """Obtenir la liste des agents disponibles"""
     agents_info = {}
-    for name, agent in chatbot_orchestrator.agents.items():
+    for name in chatbot_orchestrator.agents:
         try:
+            agent = await chatbot_orchestrator.agents.aget(name)
             agents_info[name] = agent.get_capabilities()
         except Exception as e:
             agents_info[name] = {"error": str(e)}
@@ -257,6 +353,82 @@ async def get_agents():
         "total_agents": len(chatbot_orchestrator.agents)
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Compteurs des tours au format Prometheus (agrégés sur tous les workers avec METRICS_BACKEND=redis)"""
+    return PlainTextResponse(get_metrics_recorder().render_prometheus(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/llm/metrics")
+async def get_llm_metrics():
+    """Métriques de la passerelle LLM par agent (appels, fusions, tentatives, latence, tokens)"""
+    return get_llm_gateway().metrics()
+
+@app.get("/llm/cache")
+async def get_response_cache_stats():
+    """Statistiques du cache sémantique des réponses (succès, succès par similarité, entrées périmées)"""
+    cache = get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+# Tâches RGPD (exécutées en arrière-plan, suivies par leur identifiant)
+@app.post("/gdpr/audit", status_code=202)
+async def start_gdpr_audit(admin=Depends(get_current_admin_user)):
+    """Lancer l'audit RGPD des données stockées"""
+    return get_gdpr_jobs().submit("audit").to_dict()
+
+def _check_gdpr_owner(user, user_id: int):
+    """Un utilisateur n'agit que sur ses propres données, sauf administrateur"""
+    if user.id != user_id and not is_admin(user):
+        raise HTTPException(status_code=403, detail="Accès refusé")
+
+def _get_owned_job(job_id: str, user):
+    """Tâche RGPD visible par l'utilisateur concerné ou un administrateur (404 sinon)"""
+    job = get_gdpr_jobs().get(job_id)
+    if job is None or (job.params.get("user_id") != user.id and not is_admin(user)):
+        raise HTTPException(status_code=404, detail="Tâche introuvable")
+    return job
+
+@app.post("/gdpr/users/{user_id}/erase", status_code=202)
+async def start_gdpr_erasure(user_id: int, current_user=Depends(get_current_active_user)):
+    """Droit à l'oubli : suppression par lots en tâche de fond"""
+    _check_gdpr_owner(current_user, user_id)
+    return get_gdpr_jobs().submit("erasure", {"user_id": user_id}).to_dict()
+
+@app.post("/gdpr/users/{user_id}/export", status_code=202)
+async def start_gdpr_export(user_id: int, current_user=Depends(get_current_active_user)):
+    """Droit d'accès : export NDJSON/ZIP écrit sur disque en tâche de fond"""
+    _check_gdpr_owner(current_user, user_id)
+    return get_gdpr_jobs().submit("export", {"user_id": user_id}).to_dict()
+
+@app.get("/gdpr/jobs/{job_id}")
+async def get_gdpr_job(job_id: str, current_user=Depends(get_current_active_user)):
+    """État d'une tâche RGPD : statut, progression, résultat ou erreur"""
+    return _get_owned_job(job_id, current_user).to_dict()
+
+@app.post("/gdpr/jobs/{job_id}/resume", status_code=202)
+async def resume_gdpr_job(job_id: str, admin=Depends(get_current_admin_user)):
+    """Reprendre une tâche RGPD interrompue depuis son dernier point de reprise"""
+    job = get_gdpr_jobs().resume(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Tâche introuvable")
+    return job.to_dict()
+
+@app.get("/gdpr/jobs/{job_id}/download")
+async def download_gdpr_export(job_id: str, current_user=Depends(get_current_active_user)):
+    """Archive d'un export RGPD terminé"""
+    job = _get_owned_job(job_id, current_user)
+    if job.kind != "export":
+        raise HTTPException(status_code=404, detail="Export introuvable")
+    if job.status != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Export non terminé ({job.status})")
+    return FileResponse(
+        job.result["path"],
+        media_type="application/zip",
+        filename=f"user_{job.params['user_id']}_data.zip"
+    )
+
 @app.get("/capabilities")
 async def get_system_capabilities():
     """Obtenir les capacités du système"""
@@ -0,0 +1,189 @@
+"""
+Métriques incrémentales des tours de conversation
+
+Chaque tour terminé incrémente des compteurs et un histogramme de latence :
+- totaux depuis le démarrage (compteurs Prometheus, monotones) ;
+- un seau par heure, conservé METRICS_WINDOW_HOURS heures, pour les tableaux
+  de bord sur fenêtre glissante (24 h par défaut).
+
+Avec METRICS_BACKEND=redis, les compteurs sont des hashes Redis partagés par
+tous les workers (un pipeline HINCRBY par tour) ; sinon ils restent dans le
+processus. La lecture d'une fenêtre additionne au plus un hash par heure :
+aucun parcours des tables messages/conversations.
+"""
+
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Bornes de l'histogramme de latence d'un tour (secondes)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+TOTAL_KEY = "metrics:total"
+HOUR_KEY_PREFIX = "metrics:hour:"
+
+def _hour(moment: Optional[datetime] = None) -> str:
+    return (moment or datetime.utcnow()).strftime("%Y%m%d%H")
+
+def _label(value: str) -> str:
+    # Valeur d'étiquette Prometheus : échapper antislash, guillemets et retours à la ligne
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _number(value: float) -> str:
+    # Entiers sans notation exponentielle (les compteurs dépassent vite 1e6)
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class MetricsRecorder:
+    def __init__(self, redis_client=None, window_hours: int = 24):
+        self.redis = redis_client
+        self.window_hours = window_hours
+        self._totals: Counter = Counter()
+        # Seaux horaires en mémoire, bornés à la fenêtre
+        self._hours: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def turn_fields(intent: str, agents: Iterable[str], processing_time: float, escalated: bool,
+                    success: bool, new_conversation: bool, escalated_conversation: bool = False) -> Counter:
+        """Incréments correspondant à un tour"""
+        fields = Counter({
+            "turns": 1,
+            "latency_sum": processing_time,
+            "latency_count": 1
+        })
+        if not success:
+            fields["errors"] += 1
+        if escalated:
+            fields["escalations"] += 1
+        if escalated_conversation:
+            # Première escalade de la conversation (base du taux d'escalade)
+            fields["escalated_conversations"] += 1
+        if new_conversation:
+            fields["conversations"] += 1
+        fields[f"intent:{intent or 'unknown'}"] += 1
+        for agent in set(agents):
+            fields[f"agent:{agent}"] += 1
+        # Histogramme cumulatif (sémantique "le" de Prometheus)
+        for bound in LATENCY_BUCKETS:
+            if processing_time <= bound:
+                fields[f"latency_le:{bound}"] += 1
+        fields["latency_le:+Inf"] += 1
+        return fields
+
+    def record_turn(self, intent: str, agents: Iterable[str], processing_time: float, escalated: bool = False,
+                    success: bool = True, new_conversation: bool = False, escalated_conversation: bool = False):
+        """
+        Enregistre un tour terminé (n'interrompt jamais le traitement).
+        Appel bloquant en mode Redis : depuis la boucle asyncio, passer par un exécuteur.
+        """
+        fields = self.turn_fields(intent, agents, processing_time, escalated, success, new_conversation,
+                                  escalated_conversation)
+        hour = _hour()
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                hour_key = HOUR_KEY_PREFIX + hour
+                for key in (TOTAL_KEY, hour_key):
+                    for field, amount in fields.items():
+                        if isinstance(amount, float):
+                            pipe.hincrbyfloat(key, field, amount)
+                        else:
+                            pipe.hincrby(key, field, amount)
+                pipe.expire(hour_key, (self.window_hours + 1) * 3600)
+                pipe.execute()
+                return
+            except Exception as e:
+                logger.warning(f"Métriques Redis indisponibles, enregistrement local: {e}")
+        with self._lock:
+            self._totals.update(fields)
+            self._hours.setdefault(hour, Counter()).update(fields)
+            if len(self._hours) > self.window_hours:
+                for old in sorted(self._hours)[:-self.window_hours]:
+                    del self._hours[old]
+
+    def _read(self, keys: List[str]) -> List[Dict[str, float]]:
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key in keys:
+                    pipe.hgetall(key)
+                return [{field: float(value) for field, value in raw.items()} for raw in pipe.execute()]
+            except Exception as e:
+                logger.warning(f"Lecture des métriques Redis impossible: {e}")
+        with self._lock:
+            local = {TOTAL_KEY: self._totals, **{HOUR_KEY_PREFIX + h: c for h, c in self._hours.items()}}
+            return [dict(local.get(key, {})) for key in keys]
+
+    def totals(self) -> Dict[str, float]:
+        return self._read([TOTAL_KEY])[0]
+
+    def window(self, hours: Optional[int] = None) -> Dict[str, float]:
+        """Compteurs additionnés sur les `hours` dernières heures (heure courante incluse)"""
+        hours = min(hours or self.window_hours, self.window_hours)
+        now = datetime.utcnow()
+        keys = [HOUR_KEY_PREFIX + _hour(now - timedelta(hours=offset)) for offset in range(hours)]
+        merged: Counter = Counter()
+        for bucket in self._read(keys):
+            merged.update(bucket)
+        return dict(merged)
+
+    def render_prometheus(self) -> str:
+        """Totaux au format texte d'exposition Prometheus"""
+        totals = self.totals()
+        lines = []
+
+        def counter(name: str, help_text: str, samples: List[tuple]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {_number(value)}")
+
+        counter("sma_turns_total", "Tours de conversation traités", [("", totals.get("turns", 0))])
+        counter("sma_turn_errors_total", "Tours terminés en erreur", [("", totals.get("errors", 0))])
+        counter("sma_escalations_total", "Tours escaladés vers un conseiller", [("", totals.get("escalations", 0))])
+        counter("sma_conversations_total", "Conversations démarrées", [("", totals.get("conversations", 0))])
+        counter("sma_escalated_conversations_total", "Conversations escaladées au moins une fois",
+                [("", totals.get("escalated_conversations", 0))])
+        counter("sma_intent_turns_total", "Tours par intention", [
+            (f'{{intent="{_label(field[7:])}"}}', value)
+            for field, value in sorted(totals.items()) if field.startswith("intent:")
+        ])
+        counter("sma_agent_runs_total", "Exécutions par agent", [
+            (f'{{agent="{_label(field[6:])}"}}', value)
+            for field, value in sorted(totals.items()) if field.startswith("agent:")
+        ])
+
+        lines.append("# HELP sma_turn_duration_seconds Durée de traitement d'un tour")
+        lines.append("# TYPE sma_turn_duration_seconds histogram")
+        for bound in [*(str(b) for b in LATENCY_BUCKETS), "+Inf"]:
+            lines.append(f'sma_turn_duration_seconds_bucket{{le="{bound}"}} {_number(totals.get(f"latency_le:{bound}", 0))}')
+        lines.append(f"sma_turn_duration_seconds_sum {_number(totals.get('latency_sum', 0))}")
+        lines.append(f"sma_turn_duration_seconds_count {_number(totals.get('latency_count', 0))}")
+        return "\n".join(lines) + "\n"
+
+_recorder: Optional[MetricsRecorder] = None
+_recorder_lock = threading.Lock()
+
+def get_metrics_recorder() -> MetricsRecorder:
+    """Métriques du processus (Redis si configuré, sinon mémoire)"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                redis_client = None
+                if settings.METRICS_BACKEND.lower() == "redis":
+                    try:
+                        import redis
+                        redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+                        redis_client.ping()
+                    except Exception as e:
+                        logger.warning(f"Redis indisponible ({e}), métriques en mémoire")
+                        redis_client = None
+                _recorder = MetricsRecorder(redis_client, settings.METRICS_WINDOW_HOURS)
+    return _recorder
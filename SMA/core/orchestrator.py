@@ -1,21 +1,23 @@
 # orchestrator.py
 from langgraph.graph import StateGraph, END
-from typing import Dict, Any, List, TypedDict, Annotated
+from typing import Dict, Any, List, TypedDict, Annotated, AsyncIterator, Callable, FrozenSet, Optional
+from dataclasses import dataclass, field
 from typing_extensions import TypedDict
 import operator
 import asyncio
+import logging
+import time
+from datetime import datetime
 
-# Importation des agents
-from ..agents.conversation_agent import ConversationAgent
-from ..agents.product_search_agent import ProductSearchAgent
-# from ..agents.recommendation_agent import RecommendationAgent  # DÉSACTIVÉ
-from ..agents.customer_profiling_agent import CustomerProfilingAgent
-from ..agents.summarizer_agent import SummarizerAgent
-from ..agents.escalation_agent import EscalationAgent
-from ..agents.order_management_agent import OrderManagementAgent
-from ..agents.cart_management_agent import CartManagementAgent
-from ..agents.voice_agent import VoiceAgent
-from ..agents.user_simulation_agent import UserSimulationAgent
+from .session_store import get_session_store
+from .context_window import ConversationContextManager
+from .agent_registry import AgentRegistry
+from .intent_engine import intent_engine
+from .intent_classifier import ESCALATION_INTENTS
+from .metrics import get_metrics_recorder
+from .response_stream import EventSink, deltas_sent, emit, is_streaming, streaming_to
+
+logger = logging.getLogger("chatbot.orchestrator")
 
 class ChatState(TypedDict):
     """État partagé entre tous les agents"""
@@ -30,9 +32,14 @@ class ChatState(TypedDict):
     is_audio_message: bool
     
     # Contexte de conversation
-    conversation_history: Annotated[List[Dict], operator.add]
+    # Fenêtre bornée construite par ConversationContextManager (pas de réduction
+    # par concaténation : chaque nœud renvoie l'état complet)
+    conversation_history: List[Dict]
+    conversation_context: str
     intent: str
     confidence: float
+    # Action panier issue de la même analyse que l'intention (voir intent_engine)
+    cart_action: str
     
     # Profil utilisateur
     user_profile: Dict[str, Any]
@@ -57,19 +64,73 @@ class ChatState(TypedDict):
     processing_time: float
     error_message: str
 
+@dataclass(frozen=True)
+class NodeIO:
+    """Champs de l'état lus et écrits par un nœud du graphe"""
+    reads: FrozenSet[str] = frozenset()
+    writes: FrozenSet[str] = frozenset()
+    # Lectures conditionnelles : champ -> prédicat sur l'état
+    reads_if: Dict[str, Callable[[Dict[str, Any]], bool]] = field(default_factory=dict)
+    
+    def required_reads(self, state: Dict[str, Any]) -> FrozenSet[str]:
+        conditional = {name for name, needed in self.reads_if.items() if needed(state)}
+        return self.reads | conditional
+
+# Seuls le résumé de produits/recommandations et l'escalade lisent le profil :
+# salutations, panier et commandes n'en ont pas besoin
+PERSONALIZED_CONTENT_TYPES = ("product_summary", "recommendations")
+
 class ChatBotOrchestrator:
     def __init__(self):
-        self.agents = {
-            "voice_agent": VoiceAgent(),
-            "conversation_agent": ConversationAgent(),
-            "product_search_agent": ProductSearchAgent(),
-            # "recommendation_agent": RecommendationAgent(),  # DÉSACTIVÉ
-            "profiling_agent": CustomerProfilingAgent(),
-            "summarizer_agent": SummarizerAgent(),
-            "escalation_agent": EscalationAgent(),
-            "order_management_agent": OrderManagementAgent(),
-            "cart_management_agent": CartManagementAgent(),
-            "user_simulation_agent": UserSimulationAgent()  # Ajout de l'agent utilisateur simulé
+        # Agents importés et construits à la première utilisation (voir AgentRegistry)
+        self.agents = AgentRegistry({
+            "voice_agent": "..agents.voice_agent:VoiceAgent",
+            "conversation_agent": "..agents.conversation_agent:ConversationAgent",
+            "product_search_agent": "..agents.product_search_agent:ProductSearchAgent",
+            # "recommendation_agent": "..agents.recommendation_agent:RecommendationAgent",  # DÉSACTIVÉ
+            "profiling_agent": "..agents.customer_profiling_agent:CustomerProfilingAgent",
+            "summarizer_agent": "..agents.summarizer_agent:SummarizerAgent",
+            "escalation_agent": "..agents.escalation_agent:EscalationAgent",
+            "order_management_agent": "..agents.order_management_agent:OrderManagementAgent",
+            "cart_management_agent": "..agents.cart_management_agent:CartManagementAgent"
+            # user_simulation_agent : générateur de charge lancé hors du chat (python -m SMA.agents.user_simulation_agent)
+        }, package=__package__)
+        
+        self.session_store = get_session_store()
+        self.context_manager = ConversationContextManager(self.session_store)
+        self.metrics = get_metrics_recorder()
+        
+        # Dépendances des nœuds : un champ fourni paresseusement (profil) n'est
+        # calculé qu'au moment où un nœud qui le lit va s'exécuter
+        self.node_io = {
+            "conversation_agent": NodeIO(
+                reads=frozenset({"user_message", "conversation_context"}),
+                writes=frozenset({"intent", "confidence", "cart_action"})
+            ),
+            "product_search_agent": NodeIO(
+                reads=frozenset({"user_message", "conversation_context"}),
+                writes=frozenset({"products"})
+            ),
+            "order_management_agent": NodeIO(
+                reads=frozenset({"intent", "user_message", "user_id"}),
+                writes=frozenset({"order_info"})
+            ),
+            "cart_management_agent": NodeIO(
+                reads=frozenset({"intent", "cart_action", "user_message", "user_id"}),
+                writes=frozenset({"cart", "response_text"})
+            ),
+            "summarizer_agent": NodeIO(
+                reads=frozenset({"intent", "user_message", "products", "recommendations", "order_info", "cart"}),
+                writes=frozenset({"response_text", "response_type"}),
+                reads_if={"user_profile": lambda state: self._determine_content_type(state) in PERSONALIZED_CONTENT_TYPES}
+            ),
+            "escalation_agent": NodeIO(
+                reads=frozenset({"user_message", "intent", "conversation_history", "user_profile"}),
+                writes=frozenset({"escalate", "response_text"})
+            ),
+        }
+        self.lazy_fields: Dict[str, Callable] = {
+            "user_profile": self._profiling_node
         }
         
         self.graph = self._build_graph()
@@ -78,19 +139,22 @@ class ChatBotOrchestrator:
         """Construire le graphe de workflow LangGraph"""
         workflow = StateGraph(ChatState)
         
-        # Ajouter les nœuds (agents)
-        workflow.add_node("voice_agent", self._voice_node)
-        workflow.add_node("conversation_agent", self._conversation_node)
-        workflow.add_node("profiling_agent", self._profiling_node)
-        workflow.add_node("product_search_agent", self._product_search_node)
-        # workflow.add_node("recommendation_agent", self._recommendation_node)  # DÉSACTIVÉ
-        workflow.add_node("order_management_agent", self._order_management_node)
-        workflow.add_node("cart_management_agent", self._cart_management_node)
-        workflow.add_node("summarizer_agent", self._summarizer_node)
-        workflow.add_node("escalation_agent", self._escalation_node)
-        workflow.add_node("final_response", self._final_response_node)
-        workflow.add_node("user_simulation_agent", self._user_simulation_node)
-        workflow.add_node("multimodal_agent", self._multimodal_node)
+        # Ajouter les nœuds (agents), chacun signalant sa fin aux clients diffusés
+        def add_node(name: str, node: Callable):
+            workflow.add_node(name, self._reporting(name, node))
+        
+        # Le profilage n'est plus un nœud systématique : il est résolu à la demande
+        # (voir node_io / lazy_fields)
+        add_node("voice_agent", self._voice_node)
+        add_node("conversation_agent", self._with_dependencies("conversation_agent", self._conversation_node))
+        add_node("product_search_agent", self._with_dependencies("product_search_agent", self._product_search_node))
+        # add_node("recommendation_agent", self._recommendation_node)  # DÉSACTIVÉ
+        add_node("order_management_agent", self._with_dependencies("order_management_agent", self._order_management_node))
+        add_node("cart_management_agent", self._with_dependencies("cart_management_agent", self._cart_management_node))
+        add_node("summarizer_agent", self._with_dependencies("summarizer_agent", self._summarizer_node))
+        add_node("escalation_agent", self._with_dependencies("escalation_agent", self._escalation_node))
+        add_node("final_response", self._final_response_node)
+        add_node("multimodal_agent", self._multimodal_node)
         
         # Définir les arêtes et conditions
         workflow.set_entry_point("voice_agent")
@@ -110,16 +174,7 @@ class ChatBotOrchestrator:
             "conversation_agent",
             self._route_after_conversation,
             {
-                "user_simulation_agent": "user_simulation_agent",
                 "multimodal_agent": "multimodal_agent",
-                "profiling_agent": "profiling_agent"
-            }
-        )
-        
-        workflow.add_conditional_edges(
-            "profiling_agent",
-            self._route_after_profiling,
-            {
                 "product_search_agent": "product_search_agent",
                 "order_management_agent": "order_management_agent",
                 "cart_management_agent": "cart_management_agent",
@@ -156,20 +211,46 @@ class ChatBotOrchestrator:
         workflow.add_edge("escalation_agent", "final_response")
         workflow.add_edge("final_response", END)
         
-        # Connecter user_simulation_agent au reste du workflow
-        workflow.add_edge("user_simulation_agent", "summarizer_agent")
-        
         # Connecter multimodal_agent au reste du workflow
         workflow.add_edge("multimodal_agent", "summarizer_agent")
         
         return workflow.compile()
     
+    def _with_dependencies(self, name: str, node: Callable) -> Callable:
+        """Envelopper un nœud pour résoudre ses lectures paresseuses avant exécution"""
+        io = self.node_io.get(name)
+        
+        async def run(state: ChatState) -> ChatState:
+            if io:
+                for field_name in io.required_reads(state):
+                    provider = self.lazy_fields.get(field_name)
+                    if provider and not state.get(field_name):
+                        state = await provider(state)
+            return await node(state)
+        
+        return run
+    
+    def _reporting(self, name: str, node: Callable) -> Callable:
+        """Envelopper un nœud pour publier un événement de progression à sa fin"""
+        async def run(state: ChatState) -> ChatState:
+            start = time.perf_counter()
+            state = await node(state)
+            await emit({
+                "type": "node",
+                "node": name,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1)
+            })
+            return state
+        
+        return run
+    
     # Nœuds d'exécution des agents
     async def _voice_node(self, state: ChatState) -> ChatState:
         """Nœud de l'agent de traitement vocal"""
         if state.get("is_audio_message") and state.get("audio_data"):
             # Traiter l'audio
-            audio_result = await self.agents["voice_agent"].process_audio(
+            agent = await self.agents.aget("voice_agent")
+            audio_result = await agent.process_audio(
                 state["audio_data"], 
                 state.get("audio_format", "webm")
             )
@@ -191,10 +272,12 @@ class ChatBotOrchestrator:
     
     async def _conversation_node(self, state: ChatState) -> ChatState:
         """Nœud de l'agent de conversation"""
-        result = await self.agents["conversation_agent"].execute(state)
+        agent = await self.agents.aget("conversation_agent")
+        result = await agent.execute(state)
         
         state.update({
             "intent": result.get("intent", "unknown"),
+            "cart_action": result.get("cart_action", ""),
             "agents_used": state.get("agents_used", []) + ["conversation_agent"],
             "confidence": result.get("confidence", 0.5)
         })
@@ -202,9 +285,10 @@ class ChatBotOrchestrator:
         return state
     
     async def _profiling_node(self, state: ChatState) -> ChatState:
-        """Nœud de l'agent de profilage"""
+        """Profilage (fournisseur paresseux de user_profile)"""
         if state.get("user_id"):
-            result = await self.agents["profiling_agent"].execute(state)
+            agent = await self.agents.aget("profiling_agent")
+            result = await agent.execute(state)
             state["user_profile"] = result.get("profile", {})
         else:
             state["user_profile"] = {"segment": "anonymous"}
@@ -215,7 +299,7 @@ class ChatBotOrchestrator:
     async def _product_search_node(self, state: ChatState) -> ChatState:
         """Nœud de l'agent de recherche de produits"""
         # Extraire les critères de recherche du message
-        search_criteria = await self._extract_search_criteria(state["user_message"])
+        search_criteria = await self._extract_search_criteria(state["user_message"], state.get("conversation_context", ""))
         
         search_state = {
             **state,
@@ -224,12 +308,15 @@ class ChatBotOrchestrator:
             "max_price": search_criteria.get("max_price")
         }
         
-        result = await self.agents["product_search_agent"].execute(search_state)
+        agent = await self.agents.aget("product_search_agent")
+        result = await agent.execute(search_state)
         
         state.update({
             "products": result.get("products", []),
             "agents_used": state.get("agents_used", []) + ["product_search_agent"]
         })
+        # Les produits s'affichent sans attendre la synthèse
+        await emit({"type": "products", "products": state["products"]})
         
         return state
     
@@ -258,7 +345,8 @@ class ChatBotOrchestrator:
             "action": order_action
         }
         
-        result = await self.agents["order_management_agent"].execute(order_state)
+        agent = await self.agents.aget("order_management_agent")
+        result = await agent.execute(order_state)
         
         state.update({
             "order_info": result,
@@ -269,7 +357,7 @@ class ChatBotOrchestrator:
     
     async def _cart_management_node(self, state: ChatState) -> ChatState:
         """Nœud de l'agent de gestion du panier"""
-        cart_action = self._determine_cart_action(state.get("intent", ""), state.get("user_message", ""))
+        cart_action = state.get("cart_action") or self._determine_cart_action(state.get("intent", ""), state.get("user_message", ""))
         product_id, quantity = self._extract_cart_params(state.get("user_message", ""))
         
         cart_state = {
@@ -280,7 +368,8 @@ class ChatBotOrchestrator:
         }
         
         # Utiliser la méthode execute améliorée du CartManagementAgent
-        result = await self.agents["cart_management_agent"].execute(cart_state)
+        agent = await self.agents.aget("cart_management_agent")
+        result = await agent.execute(cart_state)
         
         # Mettre à jour l'état avec le résultat
         if isinstance(result, dict):
@@ -311,7 +400,8 @@ class ChatBotOrchestrator:
             "raw_data": raw_data
         }
         
-        result = await self.agents["summarizer_agent"].execute(summary_state)
+        agent = await self.agents.aget("summarizer_agent")
+        result = await agent.execute(summary_state)
         
         # Récupérer la meilleure réponse possible sans l'écraser par une valeur vide
         summarized_text = (
@@ -334,7 +424,8 @@ class ChatBotOrchestrator:
     
     async def _escalation_node(self, state: ChatState) -> ChatState:
         """Nœud de l'agent d'escalade"""
-        result = await self.agents["escalation_agent"].execute(state)
+        agent = await self.agents.aget("escalation_agent")
+        result = await agent.execute(state)
         
         state.update({
             "escalate": result.get("escalate", False),
@@ -346,23 +437,21 @@ class ChatBotOrchestrator:
     
     async def _final_response_node(self, state: ChatState) -> ChatState:
         """Nœud de finalisation de la réponse"""
+        # Réponse non générée en direct (texte fixe, panier, recherche formatée) : la
+        # transmettre d'un bloc pour que le client diffusé reçoive toujours son texte
+        if is_streaming() and not deltas_sent() and state.get("response_text"):
+            await emit({"type": "delta", "text": state["response_text"]})
+        
         # Log de la conversation
         await self._log_conversation(state)
         
         return state
     
-    async def _user_simulation_node(self, state: ChatState) -> ChatState:
-        """
-        Nœud d'exécution de l'agent utilisateur simulé
-        """
-        agent = self.agents["user_simulation_agent"]
-        return await agent.execute(state)
-    
     async def _multimodal_node(self, state: ChatState) -> ChatState:
         """
         Nœud d'exécution de l'agent multimodal
         """
-        agent = self.agents["multimodal_agent"]
+        agent = await self.agents.aget("multimodal_agent")
         return await agent.execute(state)
     
     # Fonctions de routage conditionnel
@@ -375,8 +464,8 @@ class ChatBotOrchestrator:
         # Sinon, continuer avec le traitement normal
         return "conversation_agent"
     
-    def _route_after_profiling(self, state: ChatState) -> str:
-        """Router après le profilage utilisateur"""
+    def _route_by_intent(self, state: ChatState) -> str:
+        """Router vers l'agent correspondant à l'intention"""
         intent = state.get("intent", "")
         failed_attempts = state.get("failed_attempts", 0)
         
@@ -393,7 +482,7 @@ class ChatBotOrchestrator:
             return "order_management_agent"
         elif intent in ["cart_management", "cart_view", "view_cart", "panier"]:
             return "cart_management_agent"
-        elif intent in ["complaint", "refund_request", "escalation"]:
+        elif intent in ESCALATION_INTENTS:
             return "escalation_agent"
         elif intent in ["greeting", "general_chat", "help"]:
             return "summarizer_agent"
@@ -427,19 +516,16 @@ class ChatBotOrchestrator:
     def _route_after_conversation(self, state: ChatState) -> str:
         """
         Route après le nœud de conversation :
-        - Si le state contient 'simulate_user' à True, on appelle l'agent utilisateur simulé
         - Si c'est un message avec image (audio_data présent), on appelle l'agent multimodal
-        - Sinon, on continue le flux normal vers profiling_agent
+        - Sinon, on route selon l'intention (le profil est calculé seulement si un nœud le lit)
         """
-        if state.get("simulate_user"):
-            return "user_simulation_agent"
-        elif state.get("audio_data") and state.get("audio_format") in ["png", "jpg", "jpeg", "gif", "webp"]:
+        if state.get("audio_data") and state.get("audio_format") in ["png", "jpg", "jpeg", "gif", "webp"]:
             return "multimodal_agent"
         else:
-            return "profiling_agent"
+            return self._route_by_intent(state)
     
     # Fonctions utilitaires
-    async def _extract_search_criteria(self, message: str) -> Dict[str, Any]:
+    async def _extract_search_criteria(self, message: str, conversation: str = "") -> Dict[str, Any]:
         """Extraire les critères de recherche du message"""
         # Utiliser Gemini pour extraire les critères
         prompt = f"""
@@ -461,7 +547,8 @@ class ChatBotOrchestrator:
         }}
         """
         
-        response = await self.agents["conversation_agent"].generate_response(prompt)
+        agent = await self.agents.aget("conversation_agent")
+        response = await agent.generate_response(prompt, conversation=conversation)
         
         try:
             import json
@@ -492,18 +579,7 @@ class ChatBotOrchestrator:
     
     def _determine_cart_action(self, intent: str, message: str) -> str:
         """Déterminer l'action pour la gestion du panier"""
-        message_lower = message.lower()
-        if any(k in message_lower for k in ["vider le panier", "vider panier", "empty cart", "clear cart"]):
-            return "clear"
-        if any(k in message_lower for k in ["retirer", "supprimer du panier", "enlever du panier", "remove from cart", "supprimer"]):
-            return "remove"
-        if any(k in message_lower for k in ["modifier quantité", "changer quantité", "mettre", "quantité", "update quantity", "modifier"]):
-            return "update"
-        if any(k in message_lower for k in ["ajouter au panier", "ajouter", "add to cart", "mettre dans le panier"]):
-            return "add"
-        if any(k in message_lower for k in ["voir mon panier", "mon panier", "panier", "cart", "voir panier", "afficher panier"]):
-            return "view"
-        return "view"
+        return intent_engine.analyze(message).cart_action
 
     def _extract_cart_params(self, message: str) -> (int, int):
         """Extraire product_id et quantity à partir du message utilisateur."""
@@ -626,21 +702,66 @@ class ChatBotOrchestrator:
             except Exception:
                 pass
     
+    def _record_turn(self, session_id: str, user_id: Any, message: str, result_state: Dict[str, Any]):
+        """Ajouter le tour à l'historique partagé de la session (n'interrompt jamais le flux)"""
+        try:
+            self.session_store.append(session_id, {
+                "user": user_id,
+                "message": message,
+                "response": result_state.get("response_text", ""),
+                "intent": result_state.get("intent", ""),
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        except Exception as e:
+            logger.warning(f"Historique de session non enregistré: {e}")
+    
+    def _record_metrics(self, session_id: str, result: Dict[str, Any], new_conversation: bool):
+        """Compteurs incrémentaux du tour (lus par /metrics et le monitoring)"""
+        try:
+            escalated = bool(result.get("escalate"))
+            escalated_conversation = False
+            if escalated and not self.session_store.get_meta(session_id).get("escalated"):
+                # Une conversation n'est comptée qu'une fois dans le taux d'escalade
+                self.session_store.set_meta(session_id, escalated=True)
+                escalated_conversation = True
+            self.metrics.record_turn(
+                intent=result.get("intent", "unknown"),
+                agents=result.get("agents_used", []),
+                processing_time=result.get("processing_time", 0.0),
+                escalated=escalated,
+                success=bool(result.get("success")),
+                new_conversation=new_conversation,
+                escalated_conversation=escalated_conversation
+            )
+        except Exception as e:
+            logger.warning(f"Métriques du tour non enregistrées: {e}")
+    
+    def _schedule_metrics(self, session_id: str, result: Dict[str, Any], new_conversation: bool):
+        """Enregistrer les métriques dans un exécuteur : les appels Redis ne bloquent pas la boucle"""
+        asyncio.get_running_loop().run_in_executor(None, self._record_metrics, session_id, result, new_conversation)
+    
     # Interface principale
-    async def process_message(self, message: str, session_id: str, user_id: int = None, audio_data: bytes = None, audio_format: str = "webm") -> Dict[str, Any]:
-        """Traiter un message utilisateur dynamiquement avec les agents"""
+    async def process_message(self, message: str, session_id: str, user_id: int = None, audio_data: bytes = None, audio_format: str = "webm",
+                              on_event: Optional[EventSink] = None) -> Dict[str, Any]:
+        """
+        Traiter un message utilisateur dynamiquement avec les agents.
+        `on_event` reçoit les événements de diffusion (fragments "delta" de la
+        réponse) pendant le traitement ; le résultat retourné reste complet.
+        """
         import time
         import logging
         import traceback
         logger = logging.getLogger("chatbot.orchestrator")
         start_time = time.time()
+        new_conversation = False
         try:
             logger.info(f"[process_message] Début du traitement pour: {message}")
             
             # Si c'est un message audio, traiter directement avec l'agent voix
             if audio_data is not None:
                 logger.info(f"[process_message] Traitement audio pour session {session_id}")
-                audio_result = await self.agents["voice_agent"].process_audio(audio_data, audio_format)
+                agent = await self.agents.aget("voice_agent")
+                audio_result = await agent.process_audio(audio_data, audio_format)
                 
                 if audio_result["success"]:
                     return {
@@ -665,6 +786,14 @@ class ChatBotOrchestrator:
                         "recommendations": []
                     }
             
+            # Contexte conversationnel borné (tours récents + résumé des plus anciens)
+            try:
+                context = self.context_manager.build(session_id)
+            except Exception as e:
+                logger.warning(f"[process_message] Contexte de conversation indisponible: {e}")
+                context = {"turns": [], "prompt": ""}
+            new_conversation = not context["turns"]
+            
             # Initialiser l'état de la conversation
             state = {
                 "user_message": message,
@@ -673,9 +802,11 @@ class ChatBotOrchestrator:
                 "audio_data": audio_data,
                 "audio_format": audio_format,
                 "is_audio_message": audio_data is not None,
-                "conversation_history": [],
+                "conversation_history": context["turns"],
+                "conversation_context": context["prompt"],
                 "intent": "",
                 "confidence": 0.0,
+                "cart_action": "",
                 "user_profile": {},
                 "is_authenticated": user_id is not None,
                 "agents_used": [],
@@ -699,11 +830,13 @@ class ChatBotOrchestrator:
             
             logger.info(f"[process_message] Exécution du graphe LangGraph...")
             # Exécuter le workflow LangGraph (multi-agent)
-            result_state = await self.graph.ainvoke(state)
+            with streaming_to(on_event):
+                result_state = await self.graph.ainvoke(state)
             logger.info(f"[process_message] Résultat final: {result_state}")
             
             processing_time = time.time() - start_time
-            return {
+            self._record_turn(session_id, user_id, message, result_state)
+            result = {
                 "success": True,
                 "response": result_state.get("response_text", "[Aucune réponse générée par les agents]"),
                 "intent": result_state.get("intent", "unknown"),
@@ -714,10 +847,12 @@ class ChatBotOrchestrator:
                 "recommendations": result_state.get("recommendations", []),
                 "cart": result_state.get("cart", {}) # Include cart in the result
             }
+            self._schedule_metrics(session_id, result, new_conversation)
+            return result
         except Exception as e:
             logger.error(f"[process_message] Erreur détaillée: {str(e)}")
             logger.error(f"[process_message] Traceback: {traceback.format_exc()}")
-            return {
+            result = {
                 "success": False,
                 "response": f"Erreur technique lors du traitement du message: {str(e)}",
                 "intent": "error",
@@ -728,6 +863,35 @@ class ChatBotOrchestrator:
                 "recommendations": [],
                 "cart": {} # Ensure cart is empty on error
             }
+            self._schedule_metrics(session_id, result, new_conversation)
+            return result
+
+    async def stream_message(self, message: str, session_id: str, user_id: int = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Événements du traitement d'un message, au fil de l'eau : "node" à la fin
+        de chaque nœud, "products" dès la recherche, "delta" pour le texte, puis
+        "response" avec le résultat complet de process_message.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.process_message(
+            message=message,
+            session_id=session_id,
+            user_id=user_id,
+            on_event=events.put
+        ))
+        try:
+            while not (task.done() and events.empty()):
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            yield {"type": "response", **task.result()}
+        finally:
+            # Client déconnecté : inutile de poursuivre le traitement
+            if not task.done():
+                task.cancel()
 
 # Instance globale de l'orchestrateur
 chatbot_orchestrator = ChatBotOrchestrator()
\ No newline at end of file
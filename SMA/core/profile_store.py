@@ -0,0 +1,105 @@
+"""
+Instantanés de profils clients
+
+Les profils (historique, préférences, valeur, segment) sont calculés hors du
+chemin de chat puis mis en cache par utilisateur avec une version de schéma et
+un TTL. La lecture est un simple GET (O(1)) ; un instantané plus ancien que
+PROFILE_REFRESH_AFTER_SECONDS reste servi pendant son recalcul en tâche de fond.
+En mémoire, les PROFILE_LOCAL_MAX_ENTRIES instantanés les plus récemment lus
+sont gardés (éviction LRU).
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# À incrémenter quand la structure du profil change : les anciens instantanés sont ignorés
+PROFILE_SCHEMA_VERSION = 1
+
+class ProfileSnapshotStore:
+    """Cache des profils par utilisateur (Redis si fourni, sinon mémoire)"""
+
+    def __init__(self, ttl_seconds: int, refresh_after_seconds: int, redis_client=None,
+                 max_local_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_after_seconds = refresh_after_seconds
+        self.redis = redis_client
+        self.max_local_entries = max_local_entries
+        self._local: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"profile:{user_id}"
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Retourne l'instantané {version, computed_at, profile} ou None"""
+        if self.redis is not None:
+            raw = self.redis.get(self._key(user_id))
+            snapshot = json.loads(raw) if raw else None
+        else:
+            with self._lock:
+                snapshot = self._local.get(user_id)
+                if snapshot and snapshot["computed_at"] + self.ttl_seconds < time.time():
+                    self._local.pop(user_id, None)
+                    snapshot = None
+                elif snapshot:
+                    self._local.move_to_end(user_id)
+        if snapshot is None or snapshot.get("version") != PROFILE_SCHEMA_VERSION:
+            return None
+        return snapshot
+
+    def put(self, user_id: int, profile: Dict[str, Any]) -> None:
+        snapshot = {
+            "version": PROFILE_SCHEMA_VERSION,
+            "computed_at": time.time(),
+            "profile": profile
+        }
+        if self.redis is not None:
+            self.redis.set(self._key(user_id), json.dumps(snapshot, default=str), ex=self.ttl_seconds)
+        else:
+            with self._lock:
+                self._local[user_id] = snapshot
+                self._local.move_to_end(user_id)
+                while len(self._local) > self.max_local_entries:
+                    self._local.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        if self.redis is not None:
+            self.redis.delete(self._key(user_id))
+        else:
+            with self._lock:
+                self._local.pop(user_id, None)
+
+    def is_stale(self, snapshot: Dict[str, Any]) -> bool:
+        return snapshot["computed_at"] + self.refresh_after_seconds < time.time()
+
+_profile_store: Optional[ProfileSnapshotStore] = None
+
+def get_profile_store() -> ProfileSnapshotStore:
+    """Retourne le store d'instantanés du processus (Redis si configuré, sinon mémoire)"""
+    global _profile_store
+    if _profile_store is None:
+        redis_client = None
+        if settings.PROFILE_STORE_BACKEND.lower() == "redis":
+            try:
+                import redis
+                redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+                redis_client.ping()
+            except Exception as e:
+                logger.warning(f"Redis indisponible ({e}), instantanés de profil en mémoire")
+                redis_client = None
+        _profile_store = ProfileSnapshotStore(
+            settings.PROFILE_SNAPSHOT_TTL_SECONDS,
+            settings.PROFILE_REFRESH_AFTER_SECONDS,
+            redis_client,
+            settings.PROFILE_LOCAL_MAX_ENTRIES
+        )
+    return _profile_store
@@ -0,0 +1,331 @@
+"""
+Cache sémantique des réponses LLM
+
+Une réponse non personnalisée (aucune consigne de profil dans le prompt) est
+indexée par (agent, modèle de prompt, produits référencés) puis par la question
+normalisée. Une question identique est servie directement ; une question
+proche (similarité cosinus MiniLM au-dessus du seuil) réutilise la réponse
+sans appel LLM.
+
+Chaque espace (agent, modèle, produits) garde sa matrice d'embeddings
+normalisés : la recherche du plus proche voisin est un seul produit
+matrice-vecteur.
+
+Une entrée expire après RESPONSE_CACHE_TTL_SECONDS et devient invalide dès
+que le catalogue change :
+- version globale du catalogue (réimport complet) ;
+- version de chaque produit référencé par la réponse.
+Les versions sont partagées par Redis (RESPONSE_CACHE_BACKEND=redis, par
+défaut) pour que tous les workers, et l'API catalogue, voient les changements ;
+les écrivains du catalogue (création, modification, suppression de produit)
+appellent notify_catalogue_change() ; après un import complet, lancer
+`python -m SMA.core.response_cache [id ...]`. En mémoire (repli sans Redis),
+seules les écritures du processus courant invalident le cache : celles de
+l'API catalogue ne sont vues qu'à l'expiration (RESPONSE_CACHE_TTL_SECONDS).
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .config import settings
+from .embeddings import get_sentence_encoder
+from .intent_engine import normalize
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_VERSION_KEY = "catalogue:version"
+PRODUCT_VERSIONS_KEY = "catalogue:product_versions"
+# Relecture de la version globale au plus toutes les N secondes
+VERSION_REFRESH_SECONDS = 5.0
+
+class CacheKey(NamedTuple):
+    """Clé d'une réponse : modèle de prompt, question de l'utilisateur, produits cités"""
+    template: str
+    question: str
+    product_ids: Tuple[Any, ...] = ()
+
+class CatalogueVersions:
+    """Versions du catalogue (globale et par produit), Redis ou mémoire"""
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client
+        self._global = 0
+        self._products: Dict[str, int] = {}
+        self._global_read_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        if self.redis is not None and time.monotonic() - self._global_read_at > VERSION_REFRESH_SECONDS:
+            try:
+                self._global = int(self.redis.get(CATALOGUE_VERSION_KEY) or 0)
+                self._global_read_at = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Version du catalogue illisible: {e}")
+        return self._global
+
+    def products(self, product_ids: Iterable[Any]) -> Dict[str, int]:
+        ids = [str(pid) for pid in product_ids]
+        if not ids:
+            return {}
+        if self.redis is not None:
+            try:
+                values = self.redis.hmget(PRODUCT_VERSIONS_KEY, ids)
+                return {pid: int(value or 0) for pid, value in zip(ids, values)}
+            except Exception as e:
+                logger.warning(f"Versions produits illisibles: {e}")
+        with self._lock:
+            return {pid: self._products.get(pid, 0) for pid in ids}
+
+    def bump(self, product_ids: Optional[Iterable[Any]] = None):
+        ids = None if product_ids is None else [str(pid) for pid in product_ids]
+        with self._lock:
+            if ids is None:
+                self._global += 1
+            else:
+                for pid in ids:
+                    self._products[pid] = self._products.get(pid, 0) + 1
+        if self.redis is not None:
+            if ids is None:
+                self._global = int(self.redis.incr(CATALOGUE_VERSION_KEY))
+                self._global_read_at = time.monotonic()
+            else:
+                pipe = self.redis.pipeline()
+                for pid in ids:
+                    pipe.hincrby(PRODUCT_VERSIONS_KEY, pid, 1)
+                pipe.execute()
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "catalogue_version", "product_versions")
+
+    def __init__(self, answer: str, expires_at: float, catalogue_version: int, product_versions: Dict[str, int]):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.catalogue_version = catalogue_version
+        self.product_versions = product_versions
+
+class _Namespace:
+    """Réponses d'un même (agent, modèle, produits) et leur matrice d'embeddings"""
+
+    def __init__(self):
+        self.questions: List[str] = []
+        self.entries: List[_Entry] = []
+        self.vectors: List[Any] = []
+        self.exact: Dict[str, _Entry] = {}
+        self._matrix = None
+
+    def matrix(self):
+        if self._matrix is None:
+            import numpy as np
+            self._matrix = np.vstack(self.vectors)
+        return self._matrix
+
+    def add(self, question: str, vector, entry: _Entry):
+        if question in self.exact:
+            index = self.questions.index(question)
+            self.entries[index] = entry
+        else:
+            self.questions.append(question)
+            self.entries.append(entry)
+            self.vectors.append(vector)
+            self._matrix = None
+        self.exact[question] = entry
+
+    def prune(self, now: float) -> int:
+        """Retire les entrées expirées ; retourne le nombre retiré"""
+        keep = [i for i, entry in enumerate(self.entries) if entry.expires_at > now]
+        removed = len(self.entries) - len(keep)
+        if removed:
+            self.questions = [self.questions[i] for i in keep]
+            self.entries = [self.entries[i] for i in keep]
+            self.vectors = [self.vectors[i] for i in keep]
+            self.exact = dict(zip(self.questions, self.entries))
+            self._matrix = None
+        return removed
+
+class SemanticResponseCache:
+    def __init__(self, encoder, versions: CatalogueVersions, threshold: float, ttl_seconds: float,
+                 max_entries: int):
+        self.encoder = encoder
+        self.versions = versions
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Espaces par ordre d'utilisation (le moins récent est évincé en premier)
+        self._namespaces: "OrderedDict[Tuple, _Namespace]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale = 0
+        # Un échec de get() est suivi du put() de la même question : un seul encodage
+        self._encode = lru_cache(maxsize=256)(self._encode_question)
+
+    @staticmethod
+    def _namespace_key(agent: str, key: CacheKey) -> Tuple:
+        return (agent, key.template, tuple(sorted(str(pid) for pid in key.product_ids)))
+
+    def _encode_question(self, question: str):
+        import numpy as np
+        vector = np.asarray(self.encoder.encode(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _is_fresh(self, entry: _Entry, now: float) -> bool:
+        if entry.expires_at <= now or entry.catalogue_version != self.versions.current():
+            return False
+        return not entry.product_versions or self.versions.products(entry.product_versions) == entry.product_versions
+
+    def get(self, agent: str, key: CacheKey) -> Optional[str]:
+        """Réponse en cache pour une question identique ou proche, sinon None"""
+        namespace_key = self._namespace_key(agent, key)
+        question = normalize(key.question)
+        now = time.time()
+        with self._lock:
+            namespace = self._namespaces.get(namespace_key)
+            if namespace is not None:
+                self._size -= namespace.prune(now)
+                self._namespaces.move_to_end(namespace_key)
+            if namespace is None or not namespace.entries:
+                self.misses += 1
+                return None
+            entry = namespace.exact.get(question)
+            semantic = False
+            if entry is None:
+                # Instantané cohérent : prune() remplace les listes, add() ne fait qu'ajouter
+                matrix, entries = namespace.matrix(), namespace.entries
+        if entry is None:
+            # Encodage hors verrou : c'est l'étape coûteuse
+            similarities = matrix @ self._encode(question)
+            best = int(similarities.argmax())
+            if similarities[best] >= self.threshold:
+                entry = entries[best]
+                semantic = True
+        if entry is None:
+            self.misses += 1
+            return None
+        if not self._is_fresh(entry, now):
+            self.stale += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.semantic_hits += semantic
+        return entry.answer
+
+    def put(self, agent: str, key: CacheKey, answer: str):
+        question = normalize(key.question)
+        vector = self._encode(question)
+        entry = _Entry(answer, time.time() + self.ttl_seconds, self.versions.current(),
+                       self.versions.products(key.product_ids))
+        namespace_key = self._namespace_key(agent, key)
+        with self._lock:
+            namespace = self._namespaces.get(namespace_key)
+            if namespace is None:
+                namespace = self._namespaces[namespace_key] = _Namespace()
+            before = len(namespace.entries)
+            namespace.add(question, vector, entry)
+            self._size += len(namespace.entries) - before
+            self._namespaces.move_to_end(namespace_key)
+            while self._size > self.max_entries and len(self._namespaces) > 1:
+                _, evicted = self._namespaces.popitem(last=False)
+                self._size -= len(evicted.entries)
+
+    def invalidate_products(self, product_ids: Iterable[Any]):
+        """Retire localement les réponses citant ces produits"""
+        ids = {str(pid) for pid in product_ids}
+        with self._lock:
+            for namespace_key in [k for k in self._namespaces if ids.intersection(k[2])]:
+                self._size -= len(self._namespaces.pop(namespace_key).entries)
+
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "namespaces": len(self._namespaces),
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "catalogue_version": self.versions.current()
+        }
+
+    async def aget(self, agent: str, key: CacheKey) -> Optional[str]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, agent, key)
+
+    async def aput(self, agent: str, key: CacheKey, answer: str):
+        await asyncio.get_running_loop().run_in_executor(None, self.put, agent, key, answer)
+
+_versions: Optional[CatalogueVersions] = None
+_cache: Optional[SemanticResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_catalogue_versions() -> CatalogueVersions:
+    """Versions du catalogue du processus (Redis si configuré, sinon mémoire)"""
+    global _versions
+    if _versions is None:
+        with _cache_lock:
+            if _versions is None:
+                redis_client = None
+                if settings.RESPONSE_CACHE_BACKEND.lower() == "redis":
+                    try:
+                        import redis
+                        redis_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+                        redis_client.ping()
+                    except Exception as e:
+                        logger.warning(f"Redis indisponible ({e}), versions du catalogue en mémoire "
+                                       f"(changements des autres processus vus à l'expiration du cache)")
+                        redis_client = None
+                _versions = CatalogueVersions(redis_client)
+    return _versions
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """Cache sémantique du processus, ou None s'il est désactivé ou sans encodeur"""
+    global _cache
+    if _cache is None and settings.RESPONSE_CACHE_ENABLED:
+        encoder = get_sentence_encoder()
+        if encoder is None:
+            return None
+        versions = get_catalogue_versions()
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticResponseCache(
+                    encoder,
+                    versions,
+                    threshold=settings.RESPONSE_CACHE_SIMILARITY,
+                    ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+                    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES
+                )
+    return _cache
+
+def notify_catalogue_change(product_ids: Optional[Iterable[Any]] = None):
+    """
+    À appeler après une écriture du catalogue : `product_ids` modifiés, ou None
+    pour un changement global (import, changement de catégories...).
+    """
+    product_ids = None if product_ids is None else list(product_ids)
+    get_catalogue_versions().bump(product_ids)
+    if _cache is not None:
+        if product_ids is None:
+            _cache.clear()
+        else:
+            _cache.invalidate_products(product_ids)
+
+def main(argv: List[str]) -> int:
+    """python -m SMA.core.response_cache [id_produit ...] : invalide le cache après un import"""
+    notify_catalogue_change(argv or None)
+    print(f"Catalogue invalidé ({', '.join(argv) if argv else 'tous les produits'})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
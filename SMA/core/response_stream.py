@@ -0,0 +1,69 @@
+"""
+Diffusion progressive des réponses
+
+Un point d'entrée (WebSocket, SSE) qui veut recevoir la réponse au fil de sa
+génération installe un récepteur d'événements pour la durée du traitement
+(`streaming_to`). Les agents publient via `emit()` ; sans récepteur, `emit()`
+ne fait rien et le traitement reste identique au mode requête/réponse.
+
+Le récepteur est porté par une ContextVar : il suit les tâches asyncio créées
+par LangGraph pour exécuter les nœuds, sans passer par l'état du graphe.
+
+Événements publiés :
+- {"type": "node", "node": ..., "duration_ms": ...} : fin d'un nœud du graphe ;
+- {"type": "products", "products": [...]} : résultats de la recherche produits ;
+- {"type": "delta", "text": ...} : fragment du texte de la réponse finale.
+"""
+
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+EventSink = Callable[[Dict[str, Any]], Awaitable[None]]
+
+class _Stream:
+    __slots__ = ("sink", "deltas")
+
+    def __init__(self, sink: EventSink):
+        self.sink = sink
+        self.deltas = 0
+
+_stream: ContextVar[Optional[_Stream]] = ContextVar("response_stream", default=None)
+
+@contextmanager
+def streaming_to(sink: Optional[EventSink]):
+    """Publie les événements du traitement courant vers `sink` (None : aucun)"""
+    token = _stream.set(_Stream(sink) if sink is not None else None)
+    try:
+        yield
+    finally:
+        _stream.reset(token)
+
+def is_streaming() -> bool:
+    return _stream.get() is not None
+
+def deltas_sent() -> int:
+    """Nombre de fragments de texte déjà publiés pour le traitement courant"""
+    stream = _stream.get()
+    return stream.deltas if stream is not None else 0
+
+async def emit(event: Dict[str, Any]):
+    """Publie un événement ; une erreur du récepteur (client parti) n'interrompt pas le traitement"""
+    stream = _stream.get()
+    if stream is None:
+        return
+    if event.get("type") == "delta":
+        stream.deltas += 1
+    try:
+        await stream.sink(event)
+    except Exception as e:
+        logger.warning(f"Événement de diffusion perdu ({event.get('type')}): {e}")
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Trame Server-Sent Events : le type de l'événement devient le champ `event`"""
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    return f"event: {event.get('type', 'message')}\ndata: {data}\n\n"
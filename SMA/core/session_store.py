@@ -0,0 +1,321 @@
+"""
+Stockage de sessions partagé entre workers
+
+Deux implémentations d'une même interface :
+- InMemorySessionStore : exécution mono-processus (dev, tests)
+- RedisSessionStore : déploiement multi-workers derrière un load balancer
+
+L'historique de chaque session est une fenêtre bornée d'entrées JSON compactes,
+expirée par TTL. Une session a deux flux d'historique, chacun avec son propre
+schéma d'entrée :
+- TURNS : un tour par entrée {user, message, response, intent, timestamp},
+  écrit par l'orchestrateur et lu par la fenêtre de contexte ;
+- MESSAGES : un AgentMessage par entrée {type, content, sender, timestamp,
+  metadata}, écrit et relu par ChatSession.
+Le pub/sub permet d'envoyer un message vers un WebSocket détenu par un autre
+worker.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Signature des callbacks de fan-out : (session_id, message)
+MessageHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+# Flux d'historique d'une session
+TURNS = "history"
+MESSAGES = "messages"
+STREAMS = (TURNS, MESSAGES)
+
+def _dumps(data: Dict[str, Any]) -> str:
+    """Sérialisation JSON compacte (sans espaces)"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+class SessionStore(ABC):
+    """Interface commune des stores de session"""
+
+    def __init__(self, ttl_seconds: int, history_window: int):
+        self.ttl_seconds = ttl_seconds
+        self.history_window = history_window
+        # Identifiant du worker, pour ignorer ses propres messages pub/sub
+        self.worker_id = uuid.uuid4().hex
+
+    @abstractmethod
+    def append(self, session_id: str, entry: Dict[str, Any], stream: str = TURNS) -> None:
+        """Ajoute une entrée au flux d'historique `stream` et prolonge le TTL"""
+
+    @abstractmethod
+    def get_history(self, session_id: str, limit: Optional[int] = None,
+                    stream: str = TURNS) -> List[Dict[str, Any]]:
+        """Retourne la fenêtre du flux `stream` (les `limit` dernières entrées)"""
+
+    @abstractmethod
+    def clear(self, session_id: str) -> None:
+        """Vide les historiques sans supprimer la session"""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Supprime la session et son historique"""
+
+    @abstractmethod
+    def set_meta(self, session_id: str, **fields: Any) -> None:
+        """Met à jour les métadonnées de la session (user_id, intent...)"""
+
+    @abstractmethod
+    def get_meta(self, session_id: str) -> Dict[str, Any]:
+        """Retourne les métadonnées de la session"""
+
+    @abstractmethod
+    def list_sessions(self) -> List[str]:
+        """Liste les sessions non expirées"""
+
+    @abstractmethod
+    async def publish(self, session_id: str, message: Dict[str, Any]) -> None:
+        """Diffuse un message destiné au WebSocket d'une session"""
+
+    @abstractmethod
+    async def start_listener(self, handler: MessageHandler) -> None:
+        """Démarre la réception des messages diffusés par les autres workers"""
+
+    @abstractmethod
+    async def stop_listener(self) -> None:
+        """Arrête la réception des messages"""
+
+    def count_sessions(self) -> int:
+        return len(self.list_sessions())
+
+class InMemorySessionStore(SessionStore):
+    """Store en mémoire pour une exécution mono-processus"""
+
+    def __init__(self, ttl_seconds: int, history_window: int):
+        super().__init__(ttl_seconds, history_window)
+        self._history: Dict[str, Dict[str, Deque[str]]] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._expires_at: Dict[str, float] = {}
+        self._handlers: List[MessageHandler] = []
+
+    def _touch(self, session_id: str):
+        self._expires_at[session_id] = time.time() + self.ttl_seconds
+
+    def _is_alive(self, session_id: str) -> bool:
+        expires_at = self._expires_at.get(session_id)
+        if expires_at is None:
+            return False
+        if expires_at < time.time():
+            self.delete(session_id)
+            return False
+        return True
+
+    def append(self, session_id: str, entry: Dict[str, Any], stream: str = TURNS) -> None:
+        streams = self._history.setdefault(session_id, {})
+        history = streams.get(stream)
+        if history is None:
+            history = streams[stream] = deque(maxlen=self.history_window)
+        history.append(_dumps(entry))
+        self._touch(session_id)
+
+    def get_history(self, session_id: str, limit: Optional[int] = None,
+                    stream: str = TURNS) -> List[Dict[str, Any]]:
+        if not self._is_alive(session_id):
+            return []
+        entries = list(self._history.get(session_id, {}).get(stream, ()))
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return [json.loads(entry) for entry in entries]
+
+    def clear(self, session_id: str) -> None:
+        self._history.pop(session_id, None)
+        self._touch(session_id)
+
+    def delete(self, session_id: str) -> None:
+        self._history.pop(session_id, None)
+        self._meta.pop(session_id, None)
+        self._expires_at.pop(session_id, None)
+
+    def set_meta(self, session_id: str, **fields: Any) -> None:
+        self._meta.setdefault(session_id, {}).update(fields)
+        self._touch(session_id)
+
+    def get_meta(self, session_id: str) -> Dict[str, Any]:
+        if not self._is_alive(session_id):
+            return {}
+        return dict(self._meta.get(session_id, {}))
+
+    def list_sessions(self) -> List[str]:
+        return [session_id for session_id in list(self._expires_at) if self._is_alive(session_id)]
+
+    async def publish(self, session_id: str, message: Dict[str, Any]) -> None:
+        for handler in list(self._handlers):
+            try:
+                await handler(session_id, message)
+            except Exception as e:
+                logger.error(f"Erreur handler de session {session_id}: {e}")
+
+    async def start_listener(self, handler: MessageHandler) -> None:
+        self._handlers.append(handler)
+
+    async def stop_listener(self) -> None:
+        self._handlers.clear()
+
+class RedisSessionStore(SessionStore):
+    """
+    Store Redis partagé entre workers.
+
+    Clés utilisées :
+    - session:{id}:history  tours (flux TURNS), entrées JSON compactes (LTRIM à la fenêtre)
+    - session:{id}:messages messages de ChatSession (flux MESSAGES), même format
+    - session:{id}:meta     hash des métadonnées
+    - sessions:index        sorted set session_id -> date d'expiration
+    Canal pub/sub : sma:ws
+    """
+
+    CHANNEL = "sma:ws"
+    INDEX_KEY = "sessions:index"
+
+    def __init__(self, redis_url: str, ttl_seconds: int, history_window: int):
+        super().__init__(ttl_seconds, history_window)
+        import redis
+        import redis.asyncio as aioredis
+        self.redis_url = redis_url
+        self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.async_client = aioredis.Redis.from_url(redis_url, decode_responses=True)
+        self._listener_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _history_key(session_id: str, stream: str = TURNS) -> str:
+        return f"session:{session_id}:{stream}"
+
+    @staticmethod
+    def _meta_key(session_id: str) -> str:
+        return f"session:{session_id}:meta"
+
+    def _touch(self, pipe, session_id: str):
+        for stream in STREAMS:
+            pipe.expire(self._history_key(session_id, stream), self.ttl_seconds)
+        pipe.expire(self._meta_key(session_id), self.ttl_seconds)
+        pipe.zadd(self.INDEX_KEY, {session_id: time.time() + self.ttl_seconds})
+
+    def append(self, session_id: str, entry: Dict[str, Any], stream: str = TURNS) -> None:
+        key = self._history_key(session_id, stream)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(key, _dumps(entry))
+        pipe.ltrim(key, -self.history_window, -1)
+        self._touch(pipe, session_id)
+        pipe.execute()
+
+    def get_history(self, session_id: str, limit: Optional[int] = None,
+                    stream: str = TURNS) -> List[Dict[str, Any]]:
+        if limit is not None and limit <= 0:
+            return []
+        start = -limit if limit else 0
+        entries = self.client.lrange(self._history_key(session_id, stream), start, -1)
+        return [json.loads(entry) for entry in entries]
+
+    def clear(self, session_id: str) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*(self._history_key(session_id, stream) for stream in STREAMS))
+        pipe.zadd(self.INDEX_KEY, {session_id: time.time() + self.ttl_seconds})
+        pipe.execute()
+
+    def delete(self, session_id: str) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*(self._history_key(session_id, stream) for stream in STREAMS), self._meta_key(session_id))
+        pipe.zrem(self.INDEX_KEY, session_id)
+        pipe.execute()
+
+    def set_meta(self, session_id: str, **fields: Any) -> None:
+        if not fields:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(self._meta_key(session_id), mapping={k: _dumps({"v": v}) for k, v in fields.items()})
+        self._touch(pipe, session_id)
+        pipe.execute()
+
+    def get_meta(self, session_id: str) -> Dict[str, Any]:
+        raw = self.client.hgetall(self._meta_key(session_id))
+        return {k: json.loads(v)["v"] for k, v in raw.items()}
+
+    def list_sessions(self) -> List[str]:
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.INDEX_KEY, "-inf", now)
+        pipe.zrange(self.INDEX_KEY, 0, -1)
+        _, sessions = pipe.execute()
+        return sessions
+
+    def count_sessions(self) -> int:
+        return self.client.zcount(self.INDEX_KEY, time.time(), "+inf")
+
+    async def publish(self, session_id: str, message: Dict[str, Any]) -> None:
+        payload = _dumps({"origin": self.worker_id, "session_id": session_id, "message": message})
+        await self.async_client.publish(self.CHANNEL, payload)
+
+    async def start_listener(self, handler: MessageHandler) -> None:
+        if self._listener_task and not self._listener_task.done():
+            return
+        self._listener_task = asyncio.create_task(self._listen(handler))
+
+    async def _listen(self, handler: MessageHandler):
+        pubsub = self.async_client.pubsub()
+        await pubsub.subscribe(self.CHANNEL)
+        try:
+            async for raw in pubsub.listen():
+                if raw.get("type") != "message":
+                    continue
+                try:
+                    data = json.loads(raw["data"])
+                    if data.get("origin") == self.worker_id:
+                        continue
+                    await handler(data["session_id"], data["message"])
+                except Exception as e:
+                    logger.error(f"Erreur traitement message pub/sub: {e}")
+        except asyncio.CancelledError:
+            pass
+        finally:
+            await pubsub.unsubscribe(self.CHANNEL)
+            await pubsub.close()
+
+    async def stop_listener(self) -> None:
+        if self._listener_task:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+_session_store: Optional[SessionStore] = None
+
+def get_session_store() -> SessionStore:
+    """Retourne le store de session du processus (Redis si configuré, sinon mémoire)"""
+    global _session_store
+    if _session_store is None:
+        backend = settings.SESSION_STORE_BACKEND.lower()
+        if backend == "redis":
+            try:
+                _session_store = RedisSessionStore(
+                    settings.REDIS_URL,
+                    settings.SESSION_TTL_SECONDS,
+                    settings.SESSION_HISTORY_WINDOW
+                )
+                _session_store.client.ping()
+                logger.info("Store de session Redis initialisé")
+            except Exception as e:
+                logger.warning(f"Redis indisponible ({e}), utilisation du store en mémoire")
+                _session_store = None
+        if _session_store is None:
+            _session_store = InMemorySessionStore(
+                settings.SESSION_TTL_SECONDS,
+                settings.SESSION_HISTORY_WINDOW
+            )
+    return _session_store
@@ -14,6 +14,8 @@ from pathlib import Path
 from typing import Dict, Any, Optional, List
 import time
 
+from .intent_engine import intent_engine, normalize
+
 # Imports pour la reconnaissance vocale
 try:
     import speech_recognition as sr
@@ -55,33 +57,6 @@ class VoiceProcessingSystem:
             "ar": "ar-SA"
         }
         
-        # Patterns d'intention pour l'extraction
-        self.intent_patterns = {
-            "product_search": [
-                "cherche", "recherche", "trouve", "montre", "affiche",
-                "search", "find", "show", "display",
-                "ابحث", "اعثر", "أظهر", "عرض"
-            ],
-            "add_to_cart": [
-                "ajoute", "mets", "ajouter", "panier", "cart",
-                "add", "put", "cart", "basket",
-                "أضف", "ضع", "سلة", "عربة"
-            ],
-            "order_status": [
-                "commande", "statut", "livraison", "suivi",
-                "order", "status", "delivery", "tracking",
-                "طلب", "حالة", "توصيل", "تتبع"
-            ],
-            "help": [
-                "aide", "help", "support", "assistance",
-                "help", "support", "assist",
-                "مساعدة", "دعم", "مساعدة"
-            ],
-            "bot_role": [
-                "rôle", "role", "mission", "qui es-tu", "ta fonction", "ta mission", "à quoi sers-tu", "présente-toi", "about you", "your role", "who are you"
-            ]
-        }
-        
         logger.info("VoiceProcessingSystem initialisé")
     
     def _check_ffmpeg(self) -> bool:
@@ -383,28 +358,23 @@ class VoiceProcessingSystem:
     def _extract_intent(self, text: str, language: str = "fr") -> Dict[str, Any]:
         """Extraire l'intention d'un texte"""
         try:
-            text_lower = text.lower().strip()
-            
-            # Chercher des patterns d'intention
-            for intent, patterns in self.intent_patterns.items():
-                for pattern in patterns:
-                    if pattern.lower() in text_lower:
-                        # Calculer un score de confiance basique
-                        confidence = min(0.9, 0.5 + (len(pattern) / len(text)) * 0.4)
-                        
-                        # Extraire des entités basiques
-                        entities = []
-                        words = text_lower.split()
-                        for word in words:
-                            if len(word) > 3 and word not in patterns:
-                                entities.append(word)
-                        
-                        return {
-                            "intent": intent,
-                            "confidence": confidence,
-                            "entities": entities[:5],  # Limiter à 5 entités
-                            "language": language
-                        }
+            # Même moteur d'intention que le chat (intentions partagées)
+            match = intent_engine.analyze(text)
+            if match.intent:
+                # Calculer un score de confiance basique
+                pattern = max(match.keywords, key=len)
+                confidence = min(0.9, 0.5 + (len(pattern) / len(text)) * 0.4)
+                
+                # Extraire des entités basiques
+                keywords = set(match.keywords)
+                entities = [word for word in normalize(text).split() if len(word) > 3 and word not in keywords]
+                
+                return {
+                    "intent": match.intent,
+                    "confidence": confidence,
+                    "entities": entities[:5],  # Limiter à 5 entités
+                    "language": language
+                }
             
             # Intention par défaut
             return {
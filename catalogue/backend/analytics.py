@@ -0,0 +1,114 @@
+"""
+Agrégats clients calculés côté base de données.
+
+Une seule requête groupée (par utilisateur ou par lot d'utilisateurs) retourne
+le nombre de commandes, le total dépensé, les dates de première et dernière
+commande, les catégories et marques favorites et la répartition par gamme de
+prix. Les agents de profilage et de recommandation n'itèrent plus sur
+commande.produits / produit en Python (chargements paresseux N+1).
+
+La marque n'est pas une colonne du catalogue : elle vient de
+caracteristiques_structurees->>'marque', à défaut du premier mot du nom.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from catalogue.backend.models import Product
+
+class CustomerStats(NamedTuple):
+    user_id: int
+    order_count: int
+    total_spent: float
+    first_order: Optional[datetime]
+    last_order: Optional[datetime]
+    top_categories: Tuple[str, ...]
+    top_brands: Tuple[str, ...]
+    # Nombre de lignes de commande par gamme de prix : (< 50€, < 200€, >= 200€)
+    price_bands: Tuple[int, int, int]
+
+def empty_stats(user_id: int) -> CustomerStats:
+    return CustomerStats(user_id, 0, 0.0, None, None, (), (), (0, 0, 0))
+
+def product_brand():
+    """Expression SQLAlchemy de la marque d'un produit (même règle que la requête d'agrégats)"""
+    return func.coalesce(
+        Product.caracteristiques_structurees["marque"].as_string(),
+        func.split_part(Product.nom, " ", 1)
+    )
+
+CUSTOMER_STATS_SQL = text("""
+WITH commandes_u AS (
+    SELECT id, utilisateur_id, total, date
+    FROM commandes
+    WHERE utilisateur_id = ANY(:user_ids)
+),
+lignes AS (
+    SELECT c.utilisateur_id, l.quantite, l.prix_unitaire, cat.nom AS categorie,
+           COALESCE(p.caracteristiques_structurees->>'marque', split_part(p.nom, ' ', 1)) AS marque
+    FROM commandes_u c
+    JOIN commande_produits l ON l.id_commande = c.id
+    JOIN produits p ON p.id = l.id_produit
+    LEFT JOIN categories cat ON cat.id = p.categorie_id
+),
+categories_u AS (
+    SELECT utilisateur_id, categorie,
+           ROW_NUMBER() OVER (PARTITION BY utilisateur_id ORDER BY SUM(quantite) DESC, categorie) AS rang
+    FROM lignes
+    WHERE categorie IS NOT NULL
+    GROUP BY utilisateur_id, categorie
+),
+marques_u AS (
+    SELECT utilisateur_id, marque,
+           ROW_NUMBER() OVER (PARTITION BY utilisateur_id ORDER BY SUM(quantite) DESC, marque) AS rang
+    FROM lignes
+    WHERE marque IS NOT NULL AND marque <> ''
+    GROUP BY utilisateur_id, marque
+),
+prix_u AS (
+    SELECT utilisateur_id,
+           COUNT(*) FILTER (WHERE prix_unitaire < 50) AS bas,
+           COUNT(*) FILTER (WHERE prix_unitaire >= 50 AND prix_unitaire < 200) AS moyen,
+           COUNT(*) FILTER (WHERE prix_unitaire >= 200) AS haut
+    FROM lignes
+    GROUP BY utilisateur_id
+)
+SELECT c.utilisateur_id,
+       COUNT(*) AS nb_commandes,
+       COALESCE(SUM(c.total), 0) AS total_depense,
+       MIN(c.date) AS premiere_commande,
+       MAX(c.date) AS derniere_commande,
+       (SELECT array_agg(k.categorie ORDER BY k.rang) FROM categories_u k
+        WHERE k.utilisateur_id = c.utilisateur_id AND k.rang <= :top) AS categories,
+       (SELECT array_agg(m.marque ORDER BY m.rang) FROM marques_u m
+        WHERE m.utilisateur_id = c.utilisateur_id AND m.rang <= :top) AS marques,
+       COALESCE(p.bas, 0) AS bas, COALESCE(p.moyen, 0) AS moyen, COALESCE(p.haut, 0) AS haut
+FROM commandes_u c
+LEFT JOIN prix_u p ON p.utilisateur_id = c.utilisateur_id
+GROUP BY c.utilisateur_id, p.bas, p.moyen, p.haut
+""")
+
+def customer_stats_batch(db: Session, user_ids: Iterable[int], top: int = 5) -> Dict[int, CustomerStats]:
+    """Agrégats de plusieurs clients en un aller-retour ; les clients sans commande ont des stats vides"""
+    ids = list(user_ids)
+    stats = {user_id: empty_stats(user_id) for user_id in ids}
+    if not ids:
+        return stats
+    for row in db.execute(CUSTOMER_STATS_SQL, {"user_ids": ids, "top": top}):
+        stats[row.utilisateur_id] = CustomerStats(
+            row.utilisateur_id,
+            row.nb_commandes,
+            float(row.total_depense),
+            row.premiere_commande,
+            row.derniere_commande,
+            tuple(row.categories or ()),
+            tuple(row.marques or ()),
+            (row.bas, row.moyen, row.haut)
+        )
+    return stats
+
+def customer_stats(db: Session, user_id: int, top: int = 5) -> CustomerStats:
+    return customer_stats_batch(db, [user_id], top)[user_id]
@@ -2,7 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from catalogue.backend.database import SessionLocal
-from catalogue.backend.models import Panier, PanierProduit, Product
+from catalogue.backend.models import Panier, PanierProduit
+from catalogue.backend.cart_service import cart_cache
+from catalogue.backend import stock_reservation
 from datetime import datetime
 
 router = APIRouter()
@@ -47,36 +49,15 @@ def _get_or_create_panier(db: Session, user_id: int) -> Panier:
 
 @router.get("/{user_id}")
 def get_cart(user_id: int, db: Session = Depends(get_db)):
-    panier = db.query(Panier).filter_by(utilisateur_id=user_id).first()
-    if not panier:
-        return {"produits": [], "total": 0.0}
-    items = db.query(PanierProduit).filter_by(id_panier=panier.id).all()
-    total = 0.0
-    produits = []
-    for item in items:
-        p = db.query(Product).filter_by(id=item.id_produit).first()
-        if p:
-            st = float(p.prix) * item.quantite
-            total += st
-            produits.append({
-                "id": p.id,
-                "nom": p.nom,
-                "prix": float(p.prix),
-                "quantite": item.quantite,
-                "total_partiel": st
-            })
-    return {"produits": produits, "total": round(total, 2)}
+    return cart_cache.get_cart(db, user_id)
 
 @router.post("/add")
 def add_to_cart(req: AddToCartRequest, db: Session = Depends(get_db)):
     if req.quantite <= 0:
         raise HTTPException(status_code=400, detail="Quantité invalide")
-    prod = db.query(Product).filter_by(id=req.product_id).first()
-    if not prod:
-        raise HTTPException(status_code=404, detail="Produit introuvable")
-    if prod.stock < req.quantite:
-        raise HTTPException(status_code=400, detail="Stock insuffisant")
     panier = _get_or_create_panier(db, req.user_id)
+    # Contrôle et décrément du stock en une requête conditionnelle (pas de survente)
+    stock_reservation.reserve(db, req.user_id, req.product_id, req.quantite)
     item = db.query(PanierProduit).filter_by(id_panier=panier.id, id_produit=req.product_id).first()
     if item:
         item.quantite += req.quantite
@@ -84,6 +65,7 @@ def add_to_cart(req: AddToCartRequest, db: Session = Depends(get_db)):
         item = PanierProduit(id_panier=panier.id, id_produit=req.product_id, quantite=req.quantite)
         db.add(item)
     db.commit()
+    cart_cache.invalidate(req.user_id)
     return get_cart(req.user_id, db)
 
 @router.delete("/remove")
@@ -98,7 +80,9 @@ def remove_from_cart(req: RemoveFromCartRequest, db: Session = Depends(get_db)):
         item.quantite -= 1
     else:
         db.delete(item)
+    stock_reservation.release(db, req.user_id, req.product_id, 1)
     db.commit()
+    cart_cache.invalidate(req.user_id)
     return get_cart(req.user_id, db)
 
 @router.put("/update")
@@ -111,16 +95,18 @@ def update_cart(req: UpdateCartRequest, db: Session = Depends(get_db)):
     item = db.query(PanierProduit).filter_by(id_panier=panier.id, id_produit=req.product_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Produit non présent")
+    # Seul l'écart avec la quantité déjà réservée touche le stock
+    delta = req.quantite - item.quantite
+    if delta > 0:
+        stock_reservation.reserve(db, req.user_id, req.product_id, delta)
+    elif delta < 0:
+        stock_reservation.release(db, req.user_id, req.product_id, -delta)
     if req.quantite == 0:
         db.delete(item)
     else:
-        prod = db.query(Product).filter_by(id=req.product_id).first()
-        if not prod:
-            raise HTTPException(status_code=404, detail="Produit introuvable")
-        if prod.stock < req.quantite:
-            raise HTTPException(status_code=400, detail="Stock insuffisant")
         item.quantite = req.quantite
     db.commit()
+    cart_cache.invalidate(req.user_id)
     return get_cart(req.user_id, db)
 
 @router.delete("/clear")
@@ -129,5 +115,7 @@ def clear_cart(req: ClearCartRequest, db: Session = Depends(get_db)):
     if not panier:
         return {"message": "Panier déjà vide."}
     db.query(PanierProduit).filter_by(id_panier=panier.id).delete()
+    stock_reservation.release_user(db, req.user_id)
     db.commit()
+    cart_cache.invalidate(req.user_id)
     return {"message": "Panier vidé avec succès."}
@@ -1,7 +1,10 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from SMA.core.orchestrator import chatbot_orchestrator
+from SMA.core.session_store import get_session_store
+from SMA.core.response_stream import format_sse
 
 router = APIRouter()
 
@@ -11,8 +14,9 @@ class ChatMessageRequest(BaseModel):
     user_id: Optional[int] = None
     message: str
 
-# Mémoire simple en process pour l'historique (à remplacer par DB si besoin)
-_chat_histories = {}
+# Historique partagé entre workers (Redis) ou en mémoire en mono-processus.
+# L'orchestrateur enregistre chaque tour dans ce store.
+_session_store = get_session_store()
 
 @router.post("/message")
 async def send_message(req: ChatMessageRequest):
@@ -22,35 +26,43 @@ async def send_message(req: ChatMessageRequest):
             session_id=req.session_id,
             user_id=req.user_id
         )
-        # Stocker historique simple
-        _chat_histories.setdefault(req.session_id, []).append({
-            "user": req.user_id,
-            "message": req.message,
-            "response": result.get("response")
-        })
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/message/stream")
+async def stream_message(req: ChatMessageRequest):
+    # Mêmes événements SSE que /chat/stream du SMA ; le dernier ("response") porte le résultat de /message
+    async def events():
+        async for event in chatbot_orchestrator.stream_message(
+            message=req.message,
+            session_id=req.session_id,
+            user_id=req.user_id
+        ):
+            yield format_sse(event)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @router.get("/history/{session_id}")
 def get_chat_history(session_id: str):
-    return _chat_histories.get(session_id, [])
+    return _session_store.get_history(session_id)
 
 @router.get("/sessions")
 def get_user_sessions():
-    # Implémentation minimale: retourne les clés connues
-    return list(_chat_histories.keys())
+    # Implémentation minimale: retourne les sessions non expirées
+    return _session_store.list_sessions()
 
 @router.delete("/sessions/{id}")
 def delete_chat_session(id: str):
-    _chat_histories.pop(id, None)
+    _session_store.delete(id)
     return {"success": True}
 
 @router.post("/sessions/{id}/clear")
 def clear_chat_history(id: str):
-    _chat_histories[id] = []
+    _session_store.clear(id)
     return {"success": True}
 
 @router.get("/health")
 def chat_health():
-    return {"status": "ok", "sessions": len(_chat_histories)}
+    return {"status": "ok", "sessions": _session_store.count_sessions()}
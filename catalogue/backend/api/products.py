@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from pydantic import BaseModel
 from typing import Optional, Dict, Any, List
@@ -6,6 +7,9 @@ from sqlalchemy import func
 from catalogue.backend.database import SessionLocal
 from catalogue.backend.models import Product, Category
 from catalogue.backend.qdrant_client import search_embedding
+from SMA.core.response_cache import notify_catalogue_change
+
+logger = logging.getLogger(__name__)
 
 # Optionnel: encodeur d'embedding
 try:
@@ -38,6 +42,13 @@ class ProductSearchRequest(BaseModel):
     filters: Optional[Dict[str, Any]] = None
     limit: int = 10
 
+def _notify_product_change(product_id: int):
+    # Les réponses du chatbot citant ce produit ne doivent plus être servies (versions partagées par Redis)
+    try:
+        notify_catalogue_change([product_id])
+    except Exception as e:
+        logger.warning(f"Invalidation du cache de réponses pour le produit {product_id} échouée: {e}")
+
 # Dépendance DB
 def get_db():
     db = SessionLocal()
@@ -67,21 +78,6 @@ def get_products(db: Session = Depends(get_db), skip: int = 0, limit: int = 20,
         "caracteristiques": p.caracteristiques_structurees
     } for p in items]
 
-@router.get("/{id}")
-def get_product(id: int, db: Session = Depends(get_db)):
-    p = db.query(Product).filter(Product.id == id).first()
-    if not p:
-        raise HTTPException(status_code=404, detail="Produit introuvable")
-    return {
-        "id": p.id,
-        "nom": p.nom,
-        "prix": float(p.prix),
-        "stock": p.stock,
-        "categorie_id": p.categorie_id,
-        "description": p.description_courte,
-        "caracteristiques": p.caracteristiques_structurees
-    }
-
 @router.post("/search")
 def search_products(req: ProductSearchRequest, db: Session = Depends(get_db)):
     if _embedder is None:
@@ -137,6 +133,22 @@ def get_product_stats(db: Session = Depends(get_db)):
         "max_price": float(max_price) if max_price is not None else 0.0
     }
 
+# Déclarée après /recommendations, /categories, /brands et /stats, qu'elle capterait sinon
+@router.get("/{id}")
+def get_product(id: int, db: Session = Depends(get_db)):
+    p = db.query(Product).filter(Product.id == id).first()
+    if not p:
+        raise HTTPException(status_code=404, detail="Produit introuvable")
+    return {
+        "id": p.id,
+        "nom": p.nom,
+        "prix": float(p.prix),
+        "stock": p.stock,
+        "categorie_id": p.categorie_id,
+        "description": p.description_courte,
+        "caracteristiques": p.caracteristiques_structurees
+    }
+
 @router.post("/")
 def create_product(req: ProductCreateRequest, db: Session = Depends(get_db)):
     p = Product(
@@ -150,6 +162,7 @@ def create_product(req: ProductCreateRequest, db: Session = Depends(get_db)):
     db.add(p)
     db.commit()
     db.refresh(p)
+    _notify_product_change(p.id)
     return {"id": p.id}
 
 @router.put("/{id}")
@@ -170,6 +183,7 @@ def update_product(id: int, req: ProductUpdateRequest, db: Session = Depends(get
     if req.caracteristiques is not None:
         p.caracteristiques_structurees = req.caracteristiques
     db.commit()
+    _notify_product_change(id)
     return {"success": True}
 
 @router.delete("/{id}")
@@ -179,4 +193,5 @@ def delete_product(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Produit introuvable")
     db.delete(p)
     db.commit()
+    _notify_product_change(id)
     return {"success": True}
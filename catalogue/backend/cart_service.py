@@ -0,0 +1,167 @@
+"""
+Lecture du panier en une requête + cache par utilisateur.
+
+Partagé par l'API /api/cart et le CartManagementAgent : la vue du panier
+(lignes, sous-totaux, total) est calculée en SQL par une seule jointure, puis
+mise en cache jusqu'à la prochaine mutation du panier de l'utilisateur.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from catalogue.backend.models import Panier, PanierProduit, Product
+
+logger = logging.getLogger(__name__)
+
+CART_CACHE_TTL_SECONDS = int(os.getenv("CART_CACHE_TTL_SECONDS", "300"))
+CART_CACHE_BACKEND = os.getenv("CART_CACHE_BACKEND", "redis")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+def load_cart(db: Session, user_id: int) -> Dict[str, Any]:
+    """Vue du panier en un aller-retour : jointure panier/lignes/produits, total par fenêtre SQL"""
+    panier_id = (
+        db.query(Panier.id)
+        .filter(Panier.utilisateur_id == user_id)
+        .order_by(Panier.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    sous_total = (Product.prix * PanierProduit.quantite).label("total_partiel")
+    rows = (
+        db.query(
+            Product.id,
+            Product.nom,
+            Product.prix,
+            PanierProduit.quantite,
+            sous_total,
+            func.sum(Product.prix * PanierProduit.quantite).over().label("total")
+        )
+        .join(PanierProduit, PanierProduit.id_produit == Product.id)
+        .filter(PanierProduit.id_panier == panier_id)
+        .order_by(Product.id)
+        .all()
+    )
+    if not rows:
+        return {"produits": [], "total": 0.0}
+    produits = [
+        {
+            "id": row.id,
+            "nom": row.nom,
+            "prix": float(row.prix),
+            "quantite": row.quantite,
+            "total_partiel": float(row.total_partiel)
+        }
+        for row in rows
+    ]
+    return {"produits": produits, "total": round(float(rows[0].total), 2)}
+
+class CartCache:
+    """
+    Cache des vues de panier, invalidé à chaque mutation.
+
+    Avec Redis (CART_CACHE_BACKEND=redis, par défaut) le cache est partagé
+    entre workers et entre l'API catalogue et le SMA. Les vues sont rangées
+    sous une clé versionnée cart:{id}:v{génération} ; une invalidation
+    incrémente le compteur cart:{id}:gen (INCR atomique). Une lecture lancée
+    avant une mutation, même sur un autre processus, écrit donc sa vue
+    périmée sous l'ancienne version, que plus personne ne lit. Le compteur
+    n'expire pas : une remise à zéro ferait relire une ancienne version.
+
+    En mémoire (repli si Redis est indisponible), les invalidations ne sont
+    vues que par le processus courant : `shared` vaut False et les lecteurs
+    d'un autre processus doivent lire le panier sans passer par le cache.
+    """
+
+    def __init__(self, ttl_seconds: int = CART_CACHE_TTL_SECONDS, redis_client=None):
+        self.ttl_seconds = ttl_seconds
+        self.redis = redis_client
+        self._local: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        # Génération par utilisateur (mode mémoire) : une lecture lancée avant
+        # une mutation ne doit pas réécrire une vue périmée après l'invalidation
+        self._generations: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        """Vrai si les invalidations sont vues par tous les processus"""
+        return self.redis is not None
+
+    @staticmethod
+    def _generation_key(user_id: int) -> str:
+        return f"cart:{user_id}:gen"
+
+    @staticmethod
+    def _key(user_id: int, generation: int) -> str:
+        return f"cart:{user_id}:v{generation}"
+
+    def get_cart(self, db: Session, user_id: int) -> Dict[str, Any]:
+        generation, cached = self._get(user_id)
+        if cached is not None:
+            return cached
+        cart = load_cart(db, user_id)
+        if generation is not None:
+            self._set(user_id, cart, generation)
+        return cart
+
+    def invalidate(self, user_id: int) -> None:
+        if self.redis is not None:
+            try:
+                self.redis.incr(self._generation_key(user_id))
+            except Exception as e:
+                logger.warning(f"Invalidation Redis du panier {user_id} échouée: {e}")
+            return
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self._local.pop(user_id, None)
+
+    def _get(self, user_id: int) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """(génération lue, vue en cache) ; génération None si le cache est injoignable"""
+        if self.redis is not None:
+            try:
+                generation = int(self.redis.get(self._generation_key(user_id)) or 0)
+                raw = self.redis.get(self._key(user_id, generation))
+                return generation, (json.loads(raw) if raw else None)
+            except Exception as e:
+                logger.warning(f"Lecture Redis du panier {user_id} échouée: {e}")
+                return None, None
+        with self._lock:
+            generation = self._generations.get(user_id, 0)
+            entry = self._local.get(user_id)
+            if entry is None:
+                return generation, None
+            expires_at, cart = entry
+            if expires_at < time.time():
+                del self._local[user_id]
+                return generation, None
+            return generation, cart
+
+    def _set(self, user_id: int, cart: Dict[str, Any], generation: int) -> None:
+        if self.redis is not None:
+            try:
+                self.redis.set(self._key(user_id, generation), json.dumps(cart), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning(f"Écriture Redis du panier {user_id} échouée: {e}")
+            return
+        with self._lock:
+            if self._generations.get(user_id, 0) == generation:
+                self._local[user_id] = (time.time() + self.ttl_seconds, cart)
+
+def _build_cart_cache() -> CartCache:
+    if CART_CACHE_BACKEND.lower() == "redis":
+        try:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+            client.ping()
+            return CartCache(redis_client=client)
+        except Exception as e:
+            logger.warning(f"Redis indisponible ({e}), cache de panier en mémoire (limité à ce processus)")
+    return CartCache()
+
+cart_cache = _build_cart_cache()
@@ -0,0 +1,267 @@
+"""
+Moteur de likes persistant et indexé.
+
+Deux index (produit -> utilisateurs, utilisateur -> produits) et un classement
+des produits les plus aimés maintenu à chaque like/unlike, ce qui évite de
+parcourir ou trier tous les produits à chaque requête.
+
+Backends (LIKES_BACKEND) :
+- postgres : tables likes / compteurs_likes, classement par index sur le total
+- redis    : ensembles par produit et par utilisateur + sorted set du classement
+- memory   : exécution mono-processus (dev, tests)
+"""
+
+import bisect
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+
+from catalogue.backend.database import SessionLocal
+from catalogue.backend.models import CompteurLikes, Like
+
+logger = logging.getLogger(__name__)
+
+LIKES_BACKEND = os.getenv("LIKES_BACKEND", "postgres")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+class LikesEngine(ABC):
+    """Interface commune des moteurs de likes"""
+
+    @abstractmethod
+    def toggle(self, user_id: int, product_id: int) -> Tuple[bool, int]:
+        """Like/unlike ; retourne (liked, nombre de likes du produit)"""
+
+    @abstractmethod
+    def user_likes(self, user_id: int) -> List[int]:
+        """Produits aimés par l'utilisateur"""
+
+    @abstractmethod
+    def product_count(self, product_id: int) -> int:
+        """Nombre de likes du produit"""
+
+    @abstractmethod
+    def is_liked(self, user_id: int, product_id: int) -> bool:
+        """L'utilisateur aime-t-il le produit"""
+
+    @abstractmethod
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        """Les k produits les plus aimés : [(product_id, count)]"""
+
+class InMemoryLikesEngine(LikesEngine):
+    """Moteur en mémoire ; le classement est une liste triée mise à jour par bisect"""
+
+    def __init__(self):
+        self._users_by_product: Dict[int, Set[int]] = {}
+        self._products_by_user: Dict[int, Set[int]] = {}
+        # Entrées (-count, product_id) triées : les plus aimés en tête
+        self._ranking: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+
+    def toggle(self, user_id: int, product_id: int) -> Tuple[bool, int]:
+        with self._lock:
+            users = self._users_by_product.setdefault(product_id, set())
+            products = self._products_by_user.setdefault(user_id, set())
+            old_count = len(users)
+            if user_id in users:
+                users.remove(user_id)
+                products.discard(product_id)
+                liked = False
+            else:
+                users.add(user_id)
+                products.add(product_id)
+                liked = True
+            self._rerank(product_id, old_count, len(users))
+            return liked, len(users)
+
+    def _rerank(self, product_id: int, old_count: int, new_count: int):
+        if old_count:
+            index = bisect.bisect_left(self._ranking, (-old_count, product_id))
+            del self._ranking[index]
+        if new_count:
+            bisect.insort(self._ranking, (-new_count, product_id))
+
+    def user_likes(self, user_id: int) -> List[int]:
+        return sorted(self._products_by_user.get(user_id, ()))
+
+    def product_count(self, product_id: int) -> int:
+        return len(self._users_by_product.get(product_id, ()))
+
+    def is_liked(self, user_id: int, product_id: int) -> bool:
+        return product_id in self._products_by_user.get(user_id, ())
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        if k <= 0:
+            return []
+        return [(product_id, -count) for count, product_id in self._ranking[:k]]
+
+class RedisLikesEngine(LikesEngine):
+    """
+    Moteur Redis partagé entre workers.
+
+    Clés : likes:product:{id} (set d'utilisateurs), likes:user:{id} (set de
+    produits), likes:ranking (sorted set produit -> nombre de likes).
+    Le toggle est un script Lua : les trois structures restent cohérentes.
+    """
+
+    RANKING_KEY = "likes:ranking"
+
+    TOGGLE_SCRIPT = """
+    local product_key, user_key, ranking_key = KEYS[1], KEYS[2], KEYS[3]
+    local user_id, product_id = ARGV[1], ARGV[2]
+    local liked
+    if redis.call('SISMEMBER', product_key, user_id) == 1 then
+        redis.call('SREM', product_key, user_id)
+        redis.call('SREM', user_key, product_id)
+        liked = 0
+    else
+        redis.call('SADD', product_key, user_id)
+        redis.call('SADD', user_key, product_id)
+        liked = 1
+    end
+    local count = redis.call('SCARD', product_key)
+    if count > 0 then
+        redis.call('ZADD', ranking_key, count, product_id)
+    else
+        redis.call('ZREM', ranking_key, product_id)
+    end
+    return {liked, count}
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._toggle = client.register_script(self.TOGGLE_SCRIPT)
+
+    @staticmethod
+    def _product_key(product_id: int) -> str:
+        return f"likes:product:{product_id}"
+
+    @staticmethod
+    def _user_key(user_id: int) -> str:
+        return f"likes:user:{user_id}"
+
+    def toggle(self, user_id: int, product_id: int) -> Tuple[bool, int]:
+        liked, count = self._toggle(
+            keys=[self._product_key(product_id), self._user_key(user_id), self.RANKING_KEY],
+            args=[user_id, product_id]
+        )
+        return bool(liked), int(count)
+
+    def user_likes(self, user_id: int) -> List[int]:
+        return sorted(int(pid) for pid in self.client.smembers(self._user_key(user_id)))
+
+    def product_count(self, product_id: int) -> int:
+        return int(self.client.scard(self._product_key(product_id)))
+
+    def is_liked(self, user_id: int, product_id: int) -> bool:
+        return bool(self.client.sismember(self._user_key(user_id), product_id))
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        if k <= 0:
+            return []
+        ranked = self.client.zrevrange(self.RANKING_KEY, 0, k - 1, withscores=True)
+        return [(int(pid), int(score)) for pid, score in ranked]
+
+class PostgresLikesEngine(LikesEngine):
+    """
+    Moteur PostgreSQL : la clé primaire (utilisateur, produit) sert l'index
+    utilisateur -> produits, l'index sur id_produit l'index inverse, et
+    compteurs_likes.total (indexé) le classement, mis à jour dans la même
+    transaction que le like.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def toggle(self, user_id: int, product_id: int) -> Tuple[bool, int]:
+        with self.session_factory() as db:
+            removed = db.execute(
+                delete(Like)
+                .where(Like.utilisateur_id == user_id, Like.id_produit == product_id)
+                .returning(Like.id_produit)
+            ).first()
+            if removed is not None:
+                count = db.execute(
+                    update(CompteurLikes)
+                    .where(CompteurLikes.id_produit == product_id)
+                    .values(total=CompteurLikes.total - 1)
+                    .returning(CompteurLikes.total)
+                ).scalar()
+                db.commit()
+                return False, count or 0
+
+            try:
+                inserted = db.execute(
+                    insert(Like)
+                    .values(utilisateur_id=user_id, id_produit=product_id)
+                    .on_conflict_do_nothing()
+                    .returning(Like.id_produit)
+                ).first()
+            except IntegrityError:
+                # Clés étrangères : utilisateur ou produit inexistant
+                db.rollback()
+                raise HTTPException(status_code=404, detail="Utilisateur ou produit introuvable.")
+            if inserted is None:
+                # Like concurrent déjà enregistré : ne pas compter deux fois
+                db.commit()
+                return True, self.product_count(product_id)
+            stmt = insert(CompteurLikes).values(id_produit=product_id, total=1)
+            count = db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[CompteurLikes.id_produit],
+                    set_={"total": CompteurLikes.total + 1}
+                ).returning(CompteurLikes.total)
+            ).scalar()
+            db.commit()
+            return True, count
+
+    def user_likes(self, user_id: int) -> List[int]:
+        with self.session_factory() as db:
+            rows = db.query(Like.id_produit).filter(Like.utilisateur_id == user_id).order_by(Like.id_produit)
+            return [row.id_produit for row in rows]
+
+    def product_count(self, product_id: int) -> int:
+        with self.session_factory() as db:
+            total = db.query(CompteurLikes.total).filter(CompteurLikes.id_produit == product_id).scalar()
+            return total or 0
+
+    def is_liked(self, user_id: int, product_id: int) -> bool:
+        with self.session_factory() as db:
+            return db.query(Like.id_produit).filter(
+                Like.utilisateur_id == user_id, Like.id_produit == product_id
+            ).first() is not None
+
+    def top(self, k: int) -> List[Tuple[int, int]]:
+        if k <= 0:
+            return []
+        with self.session_factory() as db:
+            rows = (
+                db.query(CompteurLikes.id_produit, CompteurLikes.total)
+                .filter(CompteurLikes.total > 0)
+                .order_by(CompteurLikes.total.desc())
+                .limit(k)
+            )
+            return [(row.id_produit, row.total) for row in rows]
+
+def _build_likes_engine() -> LikesEngine:
+    backend = LIKES_BACKEND.lower()
+    if backend == "redis":
+        try:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+            client.ping()
+            return RedisLikesEngine(client)
+        except Exception as e:
+            logger.warning(f"Redis indisponible ({e}), likes stockés dans PostgreSQL")
+            backend = "postgres"
+    if backend == "postgres":
+        return PostgresLikesEngine()
+    return InMemoryLikesEngine()
+
+likes_engine = _build_likes_engine()
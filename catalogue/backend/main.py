@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from .database import Base, engine
 from .api.auth import router as auth_router
@@ -6,6 +7,7 @@ from .api.cart import router as cart_router
 from .api.likes import router as likes_router
 from .api.chat import router as chat_router
 from .api.system import router as system_router
+from .stock_reservation import run_expiry_sweeper
 
 app = FastAPI()
 
@@ -20,6 +22,15 @@ app.include_router(likes_router, prefix="/api/likes")
 app.include_router(chat_router, prefix="/api/chat")
 app.include_router(system_router, prefix="/api")
 
+@app.on_event("startup")
+async def start_background_tasks():
+    # Libération du stock réservé par les paniers expirés
+    app.state.reservation_sweeper = asyncio.create_task(run_expiry_sweeper())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    app.state.reservation_sweeper.cancel()
+
 @app.get("/")
 def read_root():
     return {"message": "API catalogue opérationnelle"}
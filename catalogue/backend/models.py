@@ -78,6 +78,28 @@ class PanierProduit(Base):
     panier = relationship("Panier", back_populates="produits")
     produit = relationship("Product")
 
+class ReservationStock(Base):
+    """Stock réservé par une ligne de panier, rendu au stock à expiration du panier"""
+    __tablename__ = "reservations_stock"
+    utilisateur_id = Column(Integer, ForeignKey("utilisateurs.id"), primary_key=True)
+    id_produit = Column(Integer, ForeignKey("produits.id"), primary_key=True)
+    quantite = Column(Integer, nullable=False)
+    date_creation = Column(DateTime, default=datetime.utcnow)
+    expire_le = Column(DateTime, nullable=False, index=True)
+
+class Like(Base):
+    """Index utilisateur -> produits (clé primaire) et produit -> utilisateurs (index)"""
+    __tablename__ = "likes"
+    utilisateur_id = Column(Integer, ForeignKey("utilisateurs.id"), primary_key=True)
+    id_produit = Column(Integer, ForeignKey("produits.id"), primary_key=True, index=True)
+    date_creation = Column(DateTime, default=datetime.utcnow)
+
+class CompteurLikes(Base):
+    """Nombre de likes par produit, indexé pour le classement des plus aimés"""
+    __tablename__ = "compteurs_likes"
+    id_produit = Column(Integer, ForeignKey("produits.id"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0, index=True)
+
 class TicketServiceClient(Base):
     __tablename__ = "tickets_service_client"
     id = Column(Integer, primary_key=True, index=True)
@@ -0,0 +1,174 @@
+"""
+Réservation atomique du stock pour les ajouts au panier.
+
+Le contrôle et la décrémentation du stock tiennent en une seule requête
+conditionnelle (UPDATE ... WHERE stock >= :q RETURNING stock) : deux clients
+concurrents ne peuvent pas réserver la même unité, sans verrou applicatif.
+Chaque réservation porte une date d'expiration prolongée à chaque mutation du
+panier ; à expiration, le stock est rendu et la ligne de panier supprimée.
+
+Hormis release_expired (exécutée en tâche de fond), les fonctions ne
+commitent pas : l'appelant regroupe la réservation et l'écriture de la ligne
+de panier dans la même transaction.
+
+Aucun passage de commande n'existe encore : les réservations ne sont jamais
+consommées. Le futur point de création de commande devra supprimer les
+réservations de l'utilisateur dans sa transaction (le stock reste alors
+décrémenté), faute de quoi release_expired remettrait en stock des unités
+vendues.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from catalogue.backend.database import SessionLocal
+from catalogue.backend.models import Panier, PanierProduit, Product, ReservationStock
+from catalogue.backend.cart_service import cart_cache
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL_SECONDS = int(os.getenv("STOCK_RESERVATION_TTL_SECONDS", "1800"))
+RESERVATION_SWEEP_SECONDS = int(os.getenv("STOCK_RESERVATION_SWEEP_SECONDS", "60"))
+
+def _expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=RESERVATION_TTL_SECONDS)
+
+def reserve(db: Session, user_id: int, product_id: int, quantite: int) -> int:
+    """
+    Réserve `quantite` unités du produit pour l'utilisateur.
+    Retourne le stock restant ; lève HTTPException (404/400) si impossible.
+    """
+    remaining = db.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.stock >= quantite)
+        .values(stock=Product.stock - quantite)
+        .returning(Product.stock)
+    ).scalar()
+    if remaining is None:
+        # Chemin d'échec uniquement : distinguer produit absent et stock insuffisant
+        if db.query(Product.id).filter_by(id=product_id).first() is None:
+            raise HTTPException(status_code=404, detail="Produit introuvable.")
+        raise HTTPException(status_code=400, detail="Stock insuffisant.")
+
+    expire_le = _expiry()
+    stmt = insert(ReservationStock).values(
+        utilisateur_id=user_id,
+        id_produit=product_id,
+        quantite=quantite,
+        date_creation=datetime.utcnow(),
+        expire_le=expire_le
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[ReservationStock.utilisateur_id, ReservationStock.id_produit],
+        set_={"quantite": ReservationStock.quantite + stmt.excluded.quantite, "expire_le": expire_le}
+    ))
+    touch(db, user_id, expire_le)
+    return remaining
+
+def release(db: Session, user_id: int, product_id: int, quantite: Optional[int] = None) -> int:
+    """Rend au stock `quantite` unités réservées (toutes si None). Retourne la quantité rendue."""
+    reservation = (
+        db.query(ReservationStock)
+        .filter_by(utilisateur_id=user_id, id_produit=product_id)
+        .with_for_update()
+        .first()
+    )
+    if reservation is None:
+        # Ligne de panier antérieure aux réservations : rien à rendre
+        return 0
+    released = reservation.quantite if quantite is None else min(quantite, reservation.quantite)
+    if released >= reservation.quantite:
+        db.delete(reservation)
+    else:
+        reservation.quantite -= released
+    db.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock=Product.stock + released)
+    )
+    touch(db, user_id)
+    return released
+
+def release_user(db: Session, user_id: int) -> int:
+    """Rend au stock toutes les réservations de l'utilisateur (panier vidé)"""
+    rows = db.execute(
+        delete(ReservationStock)
+        .where(ReservationStock.utilisateur_id == user_id)
+        .returning(ReservationStock.id_produit, ReservationStock.quantite)
+    ).all()
+    _restock(db, {row.id_produit: row.quantite for row in rows})
+    return len(rows)
+
+def touch(db: Session, user_id: int, expire_le: Optional[datetime] = None) -> None:
+    """Prolonge toutes les réservations de l'utilisateur : le panier reste actif"""
+    db.execute(
+        update(ReservationStock)
+        .where(ReservationStock.utilisateur_id == user_id)
+        .values(expire_le=expire_le or _expiry())
+    )
+
+def release_expired(db: Session) -> int:
+    """Libère les réservations expirées et supprime les lignes de panier correspondantes"""
+    rows = db.execute(
+        delete(ReservationStock)
+        .where(ReservationStock.expire_le < datetime.utcnow())
+        .returning(ReservationStock.utilisateur_id, ReservationStock.id_produit, ReservationStock.quantite)
+    ).all()
+    if not rows:
+        return 0
+
+    restock: Dict[int, int] = {}
+    lines_by_user: Dict[int, List[int]] = {}
+    for row in rows:
+        restock[row.id_produit] = restock.get(row.id_produit, 0) + row.quantite
+        lines_by_user.setdefault(row.utilisateur_id, []).append(row.id_produit)
+    _restock(db, restock)
+
+    for user_id, product_ids in lines_by_user.items():
+        paniers = select(Panier.id).where(Panier.utilisateur_id == user_id)
+        db.execute(
+            delete(PanierProduit)
+            .where(PanierProduit.id_panier.in_(paniers), PanierProduit.id_produit.in_(product_ids))
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+    for user_id in lines_by_user:
+        cart_cache.invalidate(user_id)
+    return len(rows)
+
+def _restock(db: Session, quantities: Dict[int, int]) -> None:
+    for product_id in sorted(quantities):
+        db.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + quantities[product_id])
+        )
+
+def _sweep_once() -> int:
+    db = SessionLocal()
+    try:
+        return release_expired(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Erreur libération des réservations expirées: {e}")
+        return 0
+    finally:
+        db.close()
+
+async def run_expiry_sweeper(interval_seconds: int = RESERVATION_SWEEP_SECONDS):
+    """Tâche de fond : libère périodiquement les réservations des paniers expirés"""
+    loop = asyncio.get_running_loop()
+    while True:
+        released = await loop.run_in_executor(None, _sweep_once)
+        if released:
+            logger.info(f"{released} réservation(s) de stock expirée(s) libérée(s)")
+        await asyncio.sleep(interval_seconds)
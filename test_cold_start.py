@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Mesure du démarrage à froid du SMA.
+
+Compare le temps d'import de l'orchestrateur (agents paresseux) au temps de
+construction de chaque agent, c'est-à-dire ce que coûtait le démarrage quand
+tous les agents étaient construits à l'import.
+
+Usage :
+    python test_cold_start.py [agent ...]
+
+Sans argument, tous les agents de l'orchestrateur sont construits.
+"""
+
+import sys
+import time
+
+def main():
+    start = time.perf_counter()
+    from SMA.core.orchestrator import chatbot_orchestrator
+    import_time = time.perf_counter() - start
+
+    registry = chatbot_orchestrator.agents
+    names = sys.argv[1:] or list(registry)
+    print(f"🔍 Import de l'orchestrateur: {import_time:.2f}s (agents chargés: {len(registry.loaded())})")
+
+    failed = []
+    for name in names:
+        try:
+            registry[name]
+            print(f"  {name:<25} {registry.load_times[name]:.2f}s")
+        except Exception as e:
+            failed.append(name)
+            print(f"  {name:<25} ❌ {e}")
+
+    eager = import_time + sum(registry.load_times.values())
+    print(f"\n✅ Démarrage paresseux: {import_time:.2f}s")
+    print(f"Démarrage avec tous les agents construits: {eager:.2f}s")
+    if registry.load_times:
+        slowest = max(registry.load_times, key=registry.load_times.get)
+        print(f"Agent le plus lent: {slowest} ({registry.load_times[slowest]:.2f}s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
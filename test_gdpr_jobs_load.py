@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test de débit des tâches RGPD d'export et d'effacement sur un utilisateur
+synthétique volumineux (conversations et messages insérés en masse).
+
+Usage :
+    python test_gdpr_jobs_load.py [conversations] [messages_par_conversation]
+
+Les tâches sont soumises comme par l'API (/gdpr/users/{id}/export puis
+/erase) et leur état est suivi par scrutation, comme le ferait un client.
+L'utilisateur synthétique est supprimé à la fin : à lancer sur une base de test.
+"""
+
+import os
+import sys
+import time
+import uuid
+import zipfile
+from datetime import datetime
+
+from SMA.models.database import SessionLocal, User, Conversation, Message
+from SMA.core.gdpr_jobs import COMPLETED, FAILED, get_gdpr_jobs
+from SMA.core.gdpr_user_data import EXPORT_MEMBER
+
+def create_synthetic_user(db, conversations: int, messages_per_conversation: int) -> int:
+    tag = uuid.uuid4().hex[:8]
+    user = User(email=f"gdpr_load_{tag}@example.com", username=f"gdpr_load_{tag}",
+                hashed_password="x", preferences={"categories": ["audio"]})
+    db.add(user)
+    db.commit()
+
+    now = datetime.utcnow()
+    db.bulk_insert_mappings(Conversation, [
+        {"user_id": user.id, "session_id": f"gdpr_load_{tag}_{i}", "started_at": now, "status": "completed"}
+        for i in range(conversations)
+    ])
+    db.commit()
+    conversation_ids = [row.id for row in db.query(Conversation.id).filter(Conversation.user_id == user.id)]
+    for conversation_id in conversation_ids:
+        db.bulk_insert_mappings(Message, [
+            {
+                "conversation_id": conversation_id,
+                "sender_type": "user" if i % 2 == 0 else "bot",
+                "content": f"Message {i} : mon adresse email est client{i}@example.com",
+                "intent": "general_info",
+                "agent_used": "customer_service_agent",
+                "timestamp": now
+            }
+            for i in range(messages_per_conversation)
+        ])
+        db.commit()
+    return user.id
+
+def wait_for(job_id: str):
+    """Scrute l'état de la tâche jusqu'à sa fin, en affichant la progression"""
+    jobs = get_gdpr_jobs()
+    last = None
+    while True:
+        job = jobs.get(job_id)
+        if job.status in (COMPLETED, FAILED):
+            return job
+        if job.progress != last:
+            print(f"   {job.kind} {job.status} {job.progress:.0%}")
+            last = job.progress
+        time.sleep(0.2)
+
+def main(argv: list) -> int:
+    conversations = int(argv[0]) if len(argv) > 0 else 200
+    messages_per_conversation = int(argv[1]) if len(argv) > 1 else 250
+
+    db = SessionLocal()
+    total_rows = conversations * (messages_per_conversation + 1)
+    print(f"🔍 Utilisateur synthétique: {conversations} conversations x {messages_per_conversation} messages")
+    start = time.perf_counter()
+    user_id = create_synthetic_user(db, conversations, messages_per_conversation)
+    print(f"Données insérées en {time.perf_counter() - start:.1f}s (utilisateur {user_id})")
+
+    jobs = get_gdpr_jobs()
+    failed = False
+
+    # Export
+    start = time.perf_counter()
+    job = wait_for(jobs.submit("export", {"user_id": user_id}).id)
+    elapsed = time.perf_counter() - start
+    if job.status == FAILED:
+        print(f"❌ Export en échec: {job.error}")
+        failed = True
+    else:
+        with zipfile.ZipFile(job.result["path"]) as archive:
+            with archive.open(EXPORT_MEMBER) as member:
+                lines = sum(1 for _ in member)
+        print(f"\n✅ Export: {job.result['size_bytes'] / 1e6:.1f} Mo, {lines} lignes NDJSON en {elapsed:.2f}s")
+        print(f"Débit export: {total_rows / elapsed:.0f} lignes/s")
+        if job.result["total_messages"] != conversations * messages_per_conversation:
+            print("❌ Export incomplet")
+            failed = True
+        os.remove(job.result["path"])
+
+    # Effacement
+    start = time.perf_counter()
+    job = wait_for(jobs.submit("erasure", {"user_id": user_id}).id)
+    elapsed = time.perf_counter() - start
+    if job.status == FAILED:
+        print(f"❌ Effacement en échec: {job.error}")
+        failed = True
+    else:
+        deleted = job.result["messages_deleted"] + job.result["conversations_deleted"]
+        print(f"\n✅ Effacement: {deleted} lignes en {elapsed:.2f}s")
+        print(f"Débit effacement: {deleted / elapsed:.0f} lignes/s")
+        if deleted != total_rows:
+            print("❌ Effacement incomplet")
+            failed = True
+
+    # Nettoyage (l'effacement anonymise le compte sans le supprimer)
+    db.expire_all()
+    db.query(Message).filter(
+        Message.conversation_id.in_(db.query(Conversation.id).filter(Conversation.user_id == user_id))
+    ).delete(synchronize_session=False)
+    db.query(Conversation).filter(Conversation.user_id == user_id).delete(synchronize_session=False)
+    db.query(User).filter(User.id == user_id).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
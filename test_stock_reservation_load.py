@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Test de charge de la réservation de stock : de nombreux clients concurrents
+réservent le même produit (SKU) et on vérifie qu'il n'y a aucune survente.
+
+Usage :
+    python test_stock_reservation_load.py [product_id] [stock] [clients] [tentatives_par_client]
+
+Le stock du produit est fixé à `stock` pour le test puis restauré, et les
+réservations créées sont supprimées à la fin : à lancer sur une base de test.
+"""
+
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+
+from catalogue.backend.database import SessionLocal
+from catalogue.backend.models import Product, ReservationStock, Utilisateur
+from catalogue.backend import stock_reservation
+
+def client(user_id: int, product_id: int, attempts: int, stats: dict, lock: threading.Lock):
+    db = SessionLocal()
+    latencies = []
+    ok = refused = errors = 0
+    try:
+        for _ in range(attempts):
+            start = time.perf_counter()
+            try:
+                stock_reservation.reserve(db, user_id, product_id, 1)
+                db.commit()
+                ok += 1
+            except HTTPException:
+                db.rollback()
+                refused += 1
+            except Exception:
+                db.rollback()
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    with lock:
+        stats["ok"] += ok
+        stats["refused"] += refused
+        stats["errors"] += errors
+        stats["latencies"].extend(latencies)
+
+def main(argv: list) -> int:
+    product_id = int(argv[0]) if len(argv) > 0 else 1
+    initial_stock = int(argv[1]) if len(argv) > 1 else 100
+    clients = int(argv[2]) if len(argv) > 2 else 50
+    attempts = int(argv[3]) if len(argv) > 3 else 10
+
+    db = SessionLocal()
+    product = db.query(Product).filter_by(id=product_id).first()
+    if product is None:
+        print(f"❌ Produit {product_id} introuvable")
+        return 1
+    user_ids = [row.id for row in db.query(Utilisateur.id).order_by(Utilisateur.id).limit(clients)]
+    if not user_ids:
+        print("❌ Aucun utilisateur en base pour simuler les clients")
+        return 1
+
+    original_stock = product.stock
+    product.stock = initial_stock
+    db.commit()
+
+    print(f"🔍 {len(user_ids)} clients x {attempts} tentatives sur le produit {product_id} (stock {initial_stock})")
+    stats = {"ok": 0, "refused": 0, "errors": 0, "latencies": []}
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(user_ids)) as pool:
+        for user_id in user_ids:
+            pool.submit(client, user_id, product_id, attempts, stats, lock)
+    elapsed = time.perf_counter() - start
+
+    db.expire_all()
+    final_stock = db.query(Product.stock).filter_by(id=product_id).scalar()
+    reserved = sum(
+        r.quantite for r in db.query(ReservationStock).filter(
+            ReservationStock.id_produit == product_id,
+            ReservationStock.utilisateur_id.in_(user_ids)
+        )
+    )
+
+    latencies = sorted(stats["latencies"])
+    total = len(latencies)
+    print(f"\n✅ Réservations acceptées: {stats['ok']}  refusées: {stats['refused']}  erreurs: {stats['errors']}")
+    print(f"Débit: {total / elapsed:.0f} req/s sur {elapsed:.2f}s")
+    if total:
+        print(f"Latence p50: {latencies[total // 2] * 1000:.1f}ms  p99: {latencies[int(total * 0.99) - 1] * 1000:.1f}ms")
+    print(f"Stock final: {final_stock}  réservé: {reserved}")
+
+    oversold = final_stock < 0 or stats["ok"] + final_stock != initial_stock or reserved != stats["ok"]
+    if oversold:
+        print("❌ Incohérence de stock détectée (survente)")
+    else:
+        print("✅ Aucune survente")
+
+    # Nettoyage
+    db.execute(delete(ReservationStock).where(
+        ReservationStock.id_produit == product_id,
+        ReservationStock.utilisateur_id.in_(user_ids)
+    ))
+    db.query(Product).filter_by(id=product_id).update({"stock": original_stock})
+    db.commit()
+    db.close()
+    return 1 if oversold else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))